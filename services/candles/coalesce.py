@@ -0,0 +1,112 @@
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+from common.instrumentation import REGISTRY
+from loguru import logger
+from quixstreams import State
+
+# The candles emitted by the coalescer, and the updates of each pair superseded by a
+# newer one before being emitted
+EMITTED = REGISTRY.counter(
+    'candles_emitted_total', 'Candles emitted by the coalescer of incomplete candles'
+)
+SUPPRESSED = REGISTRY.counter(
+    'candles_suppressed_total',
+    'Incomplete candles superseded by a newer one before being emitted',
+    ['pair'],
+)
+
+
+class CandleCoalescer:
+    """
+    Coalesce the incomplete candles, so at most one candle per pair is emitted per
+    interval, plus the final candle of each window once the pair trades in a later
+    window.
+
+    The latest candle that was not emitted is kept in the state. It is emitted as the
+    final candle of its window when the next candle of the same pair arrives, i.e.
+    with the first trade of the pair in a later window: there is no timer, and the
+    windows advance per pair, like the `.final()` windows of quixstreams. Until then
+    the last candle emitted for the window can be up to `interval_ms` of trades behind
+    its final values, and if the pair stops trading, its final candle is never emitted.
+    quixstreams 3.4 has no timers to close the windows on the wall clock instead.
+    """
+
+    def __init__(self, interval_ms: int, log_interval_seconds: float = 60.0):
+        """
+        Args:
+            interval_ms (int): Minimum event time between two candles emitted for the same pair.
+            log_interval_seconds (float): How often to log the counters.
+        """
+        self.interval_ms = interval_ms
+        self.log_interval_seconds = log_interval_seconds
+
+        # Counters of the candles emitted, and of the updates that were superseded by
+        # a newer one before being emitted, for the logs (the metrics are EMITTED and
+        # SUPPRESSED)
+        self.emitted = 0
+        self.suppressed = 0
+        self.suppressed_by_pair: Counter = Counter()
+        self._last_log_time = time.monotonic()
+
+    def __call__(self, candle: Dict[str, Any], state: State) -> List[Dict[str, Any]]:
+        """
+        Args:
+            candle (Dict[str, Any]): The latest incomplete candle.
+            state (State): The state of the streaming application.
+
+        Returns:
+            List[Dict[str, Any]]: The candles to emit, possibly empty.
+        """
+        stored_pending = pending = state.get('coalesce_pending', default=None)
+        last_emitted_ms = state.get('coalesce_last_emitted_ms', default=None)
+        candles = []
+
+        # The window of the pending candle is over, so it is the final candle
+        if (
+            pending is not None
+            and pending['window_start_ms'] != candle['window_start_ms']
+        ):
+            candles.append(pending)
+            pending = None
+
+        if (
+            last_emitted_ms is None
+            or candle['timestamp_ms'] - last_emitted_ms >= self.interval_ms
+        ):
+            candles.append(candle)
+            state.set('coalesce_last_emitted_ms', candle['timestamp_ms'])
+            if pending is not None:
+                self._suppress(pending)
+            pending = None
+        else:
+            if pending is not None:
+                self._suppress(pending)
+            pending = candle
+
+        if pending is not None:
+            state.set('coalesce_pending', pending)
+        elif stored_pending is not None:
+            state.delete('coalesce_pending')
+
+        self.emitted += len(candles)
+        EMITTED.inc(len(candles))
+        self._maybe_log()
+
+        return candles
+
+    def _suppress(self, candle: Dict[str, Any]) -> None:
+        self.suppressed += 1
+        self.suppressed_by_pair[candle['pair']] += 1
+        SUPPRESSED.labels(candle['pair']).inc()
+
+    def _maybe_log(self) -> None:
+        now = time.monotonic()
+        if now - self._last_log_time < self.log_interval_seconds:
+            return
+        self._last_log_time = now
+        logger.info(
+            f'Coalesced candles: emitted={self.emitted}, suppressed={self.suppressed}, '
+            f'top suppressed pairs={self.suppressed_by_pair.most_common(5)}'
+        )
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Literal, Optional
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -9,8 +9,26 @@ class Config(BaseSettings):
     kafka_input_topic: str
     kafka_output_topic: str
     kafka_consumer_group: str
+    # The partitions and replication factor of the topics, if they are created. The
+    # candles go to the partition of their trades, so the output topic needs at least
+    # as many partitions as the input one
+    kafka_topic_partitions: int = 1
+    kafka_topic_replication_factor: int = 1
     candle_seconds: int
     emit_incomplete_candles: Optional[bool] = True
+    # At most one incomplete candle per pair per interval (0 emits them all). The last
+    # update of a window is held back until the next trade of the pair, so it is not a
+    # final candle at the close of the window, see coalesce.py
+    incomplete_candles_interval_ms: int = 0
+    rollup_candle_seconds: List[int] = []
+    # Add the in and out times to the headers of the candles, see common/tracing.py
+    latency_tracing: bool = True
+    # The port of the Prometheus metrics endpoint, 0 to disable it
+    metrics_port: int = 9102
+    # The fraction of the candles logged, at most 10 per second
+    log_sample_rate: float = 0.001
+    # The format of the candles, see common/wire_format.py
+    wire_format: Literal['json', 'binary'] = 'binary'
 
 
 config = Config()
@@ -0,0 +1,121 @@
+from typing import Any, Dict, List, Optional
+
+from quixstreams import State
+
+
+def rollup_candles(
+    candle: Dict[str, Any],
+    state: State,
+    rollup_candle_seconds: List[int],
+    emit_incomplete_candles: bool,
+) -> List[Dict[str, Any]]:
+    """
+    Roll up the candles of the smallest window into candles of larger windows.
+
+    The larger candles are built from the aggregates of the smallest window instead
+    of the raw trades. For each larger window, we keep in the state the aggregate of
+    the closed small candles, and merge it with the latest small candle.
+
+    Args:
+        candle (Dict[str, Any]): The latest candle of the smallest window.
+        state (State): The state of the streaming application.
+        rollup_candle_seconds (List[int]): The seconds of the larger candles, multiples of the smallest one.
+        emit_incomplete_candles (bool): Emit incomplete candles or just the final ones
+
+    Returns:
+        List[Dict[str, Any]]: The latest candle followed by the larger candles to emit.
+    """
+    last_candle = state.get('rollup_last_candle', default=None)
+    rollups = state.get('rollups', default={})
+
+    # Ignore late candles of a window older than the last one
+    if last_candle and candle['window_start_ms'] < last_candle['window_start_ms']:
+        return [candle]
+
+    # The last candle is closed if this one belongs to a new window
+    last_candle_closed = (
+        last_candle is not None
+        and candle['window_start_ms'] != last_candle['window_start_ms']
+    )
+
+    candles = [candle]
+    for seconds in rollup_candle_seconds:
+        window_ms = seconds * 1000
+        window_start_ms = (
+            candle['window_start_ms'] - candle['window_start_ms'] % window_ms
+        )
+        rollup = rollups.get(str(seconds))
+
+        # Add the closed candle to the aggregate of its larger window
+        if rollup is not None and last_candle_closed:
+            rollup['candle'] = merge_candles(rollup['candle'], last_candle)
+
+        # The larger window is over, so its aggregate is final
+        if rollup is not None and rollup['window_start_ms'] != window_start_ms:
+            if not emit_incomplete_candles and not rollup['emitted']:
+                candles.append(to_rollup_candle(rollup['candle'], rollup, seconds))
+            rollup = None
+
+        if rollup is None:
+            rollup = {
+                'window_start_ms': window_start_ms,
+                'window_end_ms': window_start_ms + window_ms,
+                'candle': None,
+                'emitted': False,
+            }
+
+        rollup_candle = to_rollup_candle(
+            merge_candles(rollup['candle'], candle), rollup, seconds
+        )
+        if emit_incomplete_candles:
+            candles.append(rollup_candle)
+        elif candle['window_end_ms'] == rollup['window_end_ms']:
+            # The latest candle is the last one of the larger window
+            candles.append(rollup_candle)
+            rollup['emitted'] = True
+
+        rollups[str(seconds)] = rollup
+
+    state.set('rollup_last_candle', candle)
+    state.set('rollups', rollups)
+
+    return candles
+
+
+def merge_candles(
+    candle: Optional[Dict[str, Any]], next_candle: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Merge two consecutive candles into one.
+    """
+    if candle is None:
+        return dict(next_candle)
+    return {
+        **candle,
+        'high': max(candle['high'], next_candle['high']),
+        'low': min(candle['low'], next_candle['low']),
+        'close': next_candle['close'],
+        'volume': candle['volume'] + next_candle['volume'],
+        'timestamp_ms': next_candle['timestamp_ms'],
+    }
+
+
+def to_rollup_candle(
+    candle: Dict[str, Any], rollup: Dict[str, Any], seconds: int
+) -> Dict[str, Any]:
+    """
+    Turn an aggregate into a candle of the larger window, with the same fields as the
+    candles of the smallest window.
+    """
+    return {
+        'pair': candle['pair'],
+        'timestamp_ms': candle['timestamp_ms'],
+        'open': candle['open'],
+        'high': candle['high'],
+        'low': candle['low'],
+        'close': candle['close'],
+        'volume': candle['volume'],
+        'window_start_ms': rollup['window_start_ms'],
+        'window_end_ms': rollup['window_end_ms'],
+        'candle_seconds': seconds,
+    }
@@ -1,9 +1,27 @@
 from datetime import timedelta
+from functools import partial
 from typing import Any, Dict, List, Optional, Tuple
 
+from coalesce import CandleCoalescer
+from common.instrumentation import (
+    REGISTRY,
+    SampledLogger,
+    StageMetrics,
+    consumer_stats_config,
+    directory_bytes,
+    start_metrics_server,
+)
+from common.partitioning import (
+    check_copartitioned,
+    to_topic_copartitioned,
+    topic_config,
+)
+from common.tracing import LatencyRecorder, stamp_in, stamp_out
+from common.wire_format import WireDeserializer, WireFormat, WireSerializer
 from loguru import logger
 from quixstreams import Application
 from quixstreams.models import TimestampType
+from rollup import rollup_candles
 
 
 def custom_ts_extractor(
@@ -59,11 +77,19 @@ def main(
     kafka_consumer_group: str,
     candle_seconds: int,
     emit_incomplete_candles: bool,
+    incomplete_candles_interval_ms: int = 0,
+    rollup_candle_seconds: Optional[List[int]] = None,
+    latency_tracing: bool = True,
+    metrics_port: int = 0,
+    log_sample_rate: float = 0.001,
+    wire_format: WireFormat = 'binary',
+    topic_partitions: int = 1,
+    topic_replication_factor: int = 1,
 ):
     """
     3 steps:
     1. Ingest trades from Kafka
-    2. Generate candles using tumbling window and
+    2. Generate candles using tumbling window, and roll them up into larger candles and
     3. Output candles to Kafka
 
     Args:
@@ -73,6 +99,14 @@ def main(
         kafka_consumer_group (str): Kafka consumer group
         candle_seconds (int): Candle seconds
         emit_incomplete_candles (bool): Emit incomplete candles or just the final one
+        incomplete_candles_interval_ms (int): Emit at most one incomplete candle per pair per interval, 0 to emit them all. The final candle of a window is emitted on the next trade of the pair
+        rollup_candle_seconds (Optional[List[int]]): Seconds of the larger candles rolled up from the `candle_seconds` ones
+        latency_tracing (bool): Add the in and out times of the service to the headers of the candles, and log its latency
+        metrics_port (int): The port of the Prometheus metrics endpoint, 0 to disable it
+        log_sample_rate (float): The fraction of the candles logged
+        wire_format (WireFormat): The format of the candles, 'binary' or 'json'. The trades can be in both
+        topic_partitions (int): The number of partitions of the topics, if they are created
+        topic_replication_factor (int): The replication factor of the topics, if they are created
 
     Returns:
         None
@@ -84,21 +118,64 @@ def main(
     logger.info(f'Kafka consumer group: {kafka_consumer_group}')
     logger.info(f'Candle seconds: {candle_seconds}')
     logger.info(f'Emit incomplete candles: {emit_incomplete_candles}')
+    logger.info(f'Incomplete candles interval ms: {incomplete_candles_interval_ms}')
+    logger.info(f'Rollup candle seconds: {rollup_candle_seconds}')
+    logger.info(f'Latency tracing: {latency_tracing}')
+    logger.info(f'Metrics port: {metrics_port}')
+    logger.info(f'Log sample rate: {log_sample_rate}')
+    logger.info(f'Wire format: {wire_format}')
+    logger.info(f'Topic partitions: {topic_partitions}')
+
+    rollup_candle_seconds = sorted(rollup_candle_seconds or [])
+    for seconds in rollup_candle_seconds:
+        if seconds <= candle_seconds or seconds % candle_seconds:
+            raise ValueError(
+                f'Rollup candle seconds must be multiples of {candle_seconds}, got {seconds}'
+            )
+
     # Initialize the QuixStreams application
     app = Application(
-        broker_address=kafka_broker_address, consumer_group=kafka_consumer_group
+        broker_address=kafka_broker_address,
+        consumer_group=kafka_consumer_group,
+        # Report the consumer lag to the metrics
+        consumer_extra_config=consumer_stats_config(),
     )
 
-    # Define the input and output topics
+    if metrics_port:
+        REGISTRY.gauge('state_bytes', 'Size of the state on disk').set_function(
+            lambda: directory_bytes(app.config.state_dir)
+        )
+        start_metrics_server(metrics_port)
+    stage_metrics = StageMetrics('candles')
+    sampled_logger = SampledLogger(log_sample_rate)
+
+    # Define the input and output topics, created with the same partitions if they
+    # don't exist yet
+    new_topic_config = topic_config(topic_partitions, topic_replication_factor)
     input_topic = app.topic(
         name=kafka_input_topic,
-        value_serializer='json',
+        value_deserializer=WireDeserializer(),
         timestamp_extractor=custom_ts_extractor,
+        config=new_topic_config,
+    )
+    output_topic = app.topic(
+        name=kafka_output_topic,
+        value_serializer=WireSerializer(wire_format),
+        config=new_topic_config,
     )
-    output_topic = app.topic(name=kafka_output_topic, value_serializer='json')
+
+    # The candles are produced to the partition of their trade, so the output topic
+    # can't have fewer partitions, e.g. if it existed before
+    app.setup_topics()
+    check_copartitioned(app, input_topic, output_topic)
 
     # Create a Streaming Dataframe
     sdf = app.dataframe(topic=input_topic)
+    sdf = sdf.update(stage_metrics.message_in)
+
+    if latency_tracing:
+        # The time the trade was consumed, carried by the candles it updates
+        sdf = sdf.set_headers(stamp_in('candles'))
 
     # Aggregation of trades into candles using tumbling windows
     sdf = (
@@ -144,14 +221,40 @@ def main(
 
     sdf['candle_seconds'] = candle_seconds
 
+    if emit_incomplete_candles and incomplete_candles_interval_ms > 0:
+        # Emit at most one incomplete candle per pair per interval, plus the final one
+        # on the next trade of the pair, see coalesce.py
+        sdf = sdf.apply(
+            CandleCoalescer(interval_ms=incomplete_candles_interval_ms),
+            stateful=True,
+            expand=True,
+        )
+
+    if rollup_candle_seconds:
+        # Roll up the candles into larger candles, emitted as separate messages
+        sdf = sdf.apply(
+            partial(
+                rollup_candles,
+                rollup_candle_seconds=rollup_candle_seconds,
+                emit_incomplete_candles=emit_incomplete_candles,
+            ),
+            stateful=True,
+            expand=True,
+        )
+
     # For debugging
     # sdf = sdf.update(lambda value: breakpoint())
 
     # sdf = sdf.print()
-    sdf = sdf.update(lambda x: logger.info(f'Candle: {x}'))
+    sdf = sdf.update(lambda candle: sampled_logger.log('Candle', candle))
+    sdf = sdf.update(stage_metrics.message_out)
+
+    if latency_tracing:
+        sdf = sdf.set_headers(stamp_out(LatencyRecorder('candles')))
 
-    # Push the candles to the output topic
-    sdf.to_topic(topic=output_topic)
+    # Push the candles to the partition of their trades, so each replica of the
+    # technical-indicators service gets the pairs of the same partitions
+    to_topic_copartitioned(sdf, output_topic)
 
     # Start the application
     app.run()
@@ -167,4 +270,12 @@ if __name__ == '__main__':
         kafka_consumer_group=config.kafka_consumer_group,
         candle_seconds=config.candle_seconds,
         emit_incomplete_candles=config.emit_incomplete_candles,
+        incomplete_candles_interval_ms=config.incomplete_candles_interval_ms,
+        rollup_candle_seconds=config.rollup_candle_seconds,
+        latency_tracing=config.latency_tracing,
+        metrics_port=config.metrics_port,
+        log_sample_rate=config.log_sample_rate,
+        wire_format=config.wire_format,
+        topic_partitions=config.kafka_topic_partitions,
+        topic_replication_factor=config.kafka_topic_replication_factor,
     )
@@ -0,0 +1,121 @@
+"""
+The coalescer of the incomplete candles, against the candles it receives.
+"""
+
+from typing import Any, Dict, List
+
+from coalesce import REGISTRY, CandleCoalescer
+from common.state import MemoryState
+
+WINDOW_MS = 60_000
+
+
+def candle_updates(
+    pair: str, n_windows: int, step_ms: int, start_ms: int = 1_700_000_000_000
+) -> List[Dict[str, Any]]:
+    """
+    The incomplete candles of a pair with a trade every `step_ms`, as emitted by
+    `.current()`.
+    """
+    candles = []
+    for timestamp_ms in range(start_ms, start_ms + n_windows * WINDOW_MS, step_ms):
+        window_start_ms = timestamp_ms - timestamp_ms % WINDOW_MS
+        price = float(timestamp_ms % 997)
+        last = candles[-1] if candles else None
+        if last is None or last['window_start_ms'] != window_start_ms:
+            candle = {
+                'pair': pair,
+                'open': price,
+                'high': price,
+                'low': price,
+                'volume': 0.0,
+                'window_start_ms': window_start_ms,
+                'window_end_ms': window_start_ms + WINDOW_MS,
+                'candle_seconds': WINDOW_MS // 1000,
+            }
+        else:
+            candle = {
+                **last,
+                'high': max(last['high'], price),
+                'low': min(last['low'], price),
+            }
+        candle['close'] = price
+        candle['volume'] += 1.0
+        candle['timestamp_ms'] = timestamp_ms
+        candles.append(candle)
+    return candles
+
+
+def coalesce(
+    coalescer: CandleCoalescer, candles: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    state = MemoryState()
+    return [emitted for candle in candles for emitted in coalescer(candle, state)]
+
+
+def test_at_most_one_candle_per_interval():
+    candles = candle_updates('BTC/USD', n_windows=3, step_ms=100)
+    emitted = coalesce(CandleCoalescer(interval_ms=1000), candles)
+
+    # Apart from the final candles of the windows, closed by the next one
+    final_times = {
+        candle['timestamp_ms']
+        for candle, next_candle in zip(candles, candles[1:])
+        if candle['window_start_ms'] != next_candle['window_start_ms']
+    }
+    times = [
+        candle['timestamp_ms']
+        for candle in emitted
+        if candle['timestamp_ms'] not in final_times
+    ]
+    assert all(later - earlier >= 1000 for earlier, later in zip(times, times[1:]))
+    assert len(emitted) < len(candles) / 5
+
+
+def test_final_candle_of_each_closed_window():
+    candles = candle_updates('BTC/USD', n_windows=4, step_ms=700)
+    emitted = coalesce(CandleCoalescer(interval_ms=5000), candles)
+
+    last_emitted: Dict[int, Dict[str, Any]] = {}
+    for candle in emitted:
+        last_emitted[candle['window_start_ms']] = candle
+    last_update: Dict[int, Dict[str, Any]] = {}
+    for candle in candles:
+        last_update[candle['window_start_ms']] = candle
+
+    windows = sorted(last_update)
+    # Every window but the last one ends with its final candle, emitted when the
+    # first trade of the next window arrives
+    for window_start_ms in windows[:-1]:
+        assert last_emitted[window_start_ms] == last_update[window_start_ms]
+    # The final candle of the last window waits for a trade of a later window
+    assert last_emitted[windows[-1]] != last_update[windows[-1]]
+
+    # In the order of the windows, with the final candle before the new window
+    starts = [candle['window_start_ms'] for candle in emitted]
+    assert starts == sorted(starts)
+
+
+def test_counters():
+    candles = candle_updates('ETH/USD', n_windows=2, step_ms=300)
+    coalescer = CandleCoalescer(interval_ms=2000)
+    emitted_before = _sample('candles_emitted_total')
+    suppressed_before = _sample('candles_suppressed_total', pair='ETH/USD')
+
+    emitted = coalesce(coalescer, candles)
+
+    # Each update is emitted, suppressed by a newer one, or the one still pending
+    assert coalescer.emitted == len(emitted)
+    assert 0 <= len(candles) - coalescer.emitted - coalescer.suppressed <= 1
+    assert coalescer.suppressed > 0
+    assert coalescer.suppressed_by_pair == {'ETH/USD': coalescer.suppressed}
+    assert _sample('candles_emitted_total') == emitted_before + len(emitted)
+    assert (
+        _sample('candles_suppressed_total', pair='ETH/USD')
+        == suppressed_before + coalescer.suppressed
+    )
+
+
+def _sample(name: str, **labels: str) -> float:
+    value = REGISTRY.collector_registry.get_sample_value(name, labels)
+    return value or 0.0
@@ -0,0 +1,170 @@
+"""
+The candles rolled up from the 60s candles, against the candles aggregated straight
+from the same trades.
+"""
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pytest
+from common.state import MemoryState
+from rollup import rollup_candles
+
+CANDLE_SECONDS = 60
+ROLLUP_CANDLE_SECONDS = [300, 3600]
+START_MS = 1_700_000_000_000
+
+
+def make_trades(n_trades: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """
+    Trades of a pair every 20 seconds on average, so some minutes have none, and
+    none in the last minute of the first 5 minutes.
+    """
+    rng = np.random.default_rng(seed)
+    timestamps = START_MS + np.cumsum(rng.exponential(20_000, n_trades)).astype(int)
+    first_window_ms = START_MS - START_MS % 300_000
+    gap = (timestamps >= first_window_ms + 540_000) & (
+        timestamps < first_window_ms + 600_000
+    )
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, n_trades)))
+    return [
+        {
+            'pair': 'BTC/USD',
+            'price': float(price),
+            'volume': float(volume),
+            'timestamp_ms': int(timestamp_ms),
+        }
+        for timestamp_ms, price, volume in zip(
+            timestamps[~gap], prices[~gap], rng.exponential(0.5, n_trades)[~gap]
+        )
+    ]
+
+
+def aggregate(
+    trades: List[Dict[str, Any]], seconds: int, window_start_ms: int
+) -> Optional[Dict[str, Any]]:
+    """
+    The candle of a window aggregated from the trades, None without trades.
+    """
+    window_ms = seconds * 1000
+    trades = [
+        trade
+        for trade in trades
+        if window_start_ms <= trade['timestamp_ms'] < window_start_ms + window_ms
+    ]
+    if not trades:
+        return None
+    prices = [trade['price'] for trade in trades]
+    return {
+        'pair': trades[0]['pair'],
+        'timestamp_ms': trades[-1]['timestamp_ms'],
+        'open': prices[0],
+        'high': max(prices),
+        'low': min(prices),
+        'close': prices[-1],
+        'volume': sum(trade['volume'] for trade in trades),
+        'window_start_ms': window_start_ms,
+        'window_end_ms': window_start_ms + window_ms,
+        'candle_seconds': seconds,
+    }
+
+
+def small_candles(
+    trades: List[Dict[str, Any]], emit_incomplete_candles: bool
+) -> List[Dict[str, Any]]:
+    """
+    The 60s candles of the candles service: every update with `.current()`, or the
+    candle of a window once a trade of a later window arrives with `.final()`, so the
+    last window is never emitted.
+    """
+    window_ms = CANDLE_SECONDS * 1000
+    candles = []
+    for i, trade in enumerate(trades):
+        window_start_ms = trade['timestamp_ms'] - trade['timestamp_ms'] % window_ms
+        candle = aggregate(trades[: i + 1], CANDLE_SECONDS, window_start_ms)
+        if emit_incomplete_candles:
+            candles.append(candle)
+        elif i + 1 < len(trades) and trades[i + 1]['timestamp_ms'] >= (
+            window_start_ms + window_ms
+        ):
+            candles.append(candle)
+    return candles
+
+
+def rollup(
+    candles: List[Dict[str, Any]], emit_incomplete_candles: bool
+) -> List[Dict[str, Any]]:
+    state = MemoryState()
+    return [
+        rolled_up
+        for candle in candles
+        for rolled_up in rollup_candles(
+            candle, state, ROLLUP_CANDLE_SECONDS, emit_incomplete_candles
+        )
+        if rolled_up['candle_seconds'] != CANDLE_SECONDS
+    ]
+
+
+def assert_same_candle(actual: Dict[str, Any], expected: Dict[str, Any]) -> None:
+    assert actual == pytest.approx(expected, rel=1e-12), actual['window_start_ms']
+
+
+def test_incomplete_candles():
+    trades = make_trades(n_trades=1_000)
+    rolled_up = rollup(small_candles(trades, True), emit_incomplete_candles=True)
+
+    # A candle of each timeframe per trade, with the trades of its window so far
+    assert len(rolled_up) == len(ROLLUP_CANDLE_SECONDS) * len(trades)
+    for candle in rolled_up:
+        trades_so_far = [
+            trade for trade in trades if trade['timestamp_ms'] <= candle['timestamp_ms']
+        ]
+        assert_same_candle(
+            candle,
+            aggregate(
+                trades_so_far, candle['candle_seconds'], candle['window_start_ms']
+            ),
+        )
+
+    # The last candle of each window has all its trades, including the last window
+    # which is never closed
+    for seconds in ROLLUP_CANDLE_SECONDS:
+        last = {
+            candle['window_start_ms']: candle
+            for candle in rolled_up
+            if candle['candle_seconds'] == seconds
+        }
+        window_ms = seconds * 1000
+        last_trade_ms = trades[-1]['timestamp_ms']
+        assert max(last) == last_trade_ms - last_trade_ms % window_ms
+        for window_start_ms, candle in last.items():
+            assert_same_candle(candle, aggregate(trades, seconds, window_start_ms))
+
+
+def test_final_candles():
+    trades = make_trades(n_trades=1_000)
+    rolled_up = rollup(small_candles(trades, False), emit_incomplete_candles=False)
+
+    for seconds in ROLLUP_CANDLE_SECONDS:
+        window_ms = seconds * 1000
+        candles = [
+            candle for candle in rolled_up if candle['candle_seconds'] == seconds
+        ]
+        # A single candle per window with trades, in order, even when the last
+        # minute of the window has none
+        window_starts = [candle['window_start_ms'] for candle in candles]
+        last_trade_ms = trades[-1]['timestamp_ms']
+        last_window_start_ms = last_trade_ms - last_trade_ms % window_ms
+        expected_starts = sorted(
+            {
+                trade['timestamp_ms'] - trade['timestamp_ms'] % window_ms
+                for trade in trades
+            }
+            # The window of the last trade is never closed
+            - {last_window_start_ms}
+        )
+        assert window_starts == expected_starts
+        for candle in candles:
+            assert_same_candle(
+                candle, aggregate(trades, seconds, candle['window_start_ms'])
+            )
@@ -0,0 +1,3 @@
+"""
+The code shared by the services of the pipeline.
+"""
@@ -0,0 +1,288 @@
+"""
+Metrics and sampled logs of the hot path of a service.
+
+The metrics are Prometheus metrics (`prometheus_client`) of the service registry,
+exposed on http://<host>:<port>/metrics by `start_metrics_server`, from a background
+thread:
+- messages_total{stage, direction}: the messages in and out of each stage
+- processing_seconds{stage}: the time from a message in to a message out
+- consumer_lag{topic, partition}: from the librdkafka statistics of the consumer
+- and the state sizes of each service
+
+The per-message logs go through `SampledLogger`, which only formats and writes one
+message out of `1 / sample_rate`, at most `max_per_second` times per second, with
+the message as structured fields (`event` and `value` in the extra of the record).
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Sequence, Union
+
+from loguru import logger
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    start_http_server,
+)
+from prometheus_client.metrics_core import GaugeMetricFamily, Metric
+
+# From 10us to 10s, the processing time of a message or a batch
+LATENCY_BUCKETS = (
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# Powers of 2, for the number of items in a state
+SIZE_BUCKETS = tuple(float(2**i) for i in range(17))
+
+# The content type of `Registry.render`
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+
+class _FunctionGauge:
+    """
+    A gauge with labels computed by a function when the metrics are read, as a dict
+    of label values to numbers.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str],
+        function: Callable[[], Dict[tuple, float]],
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = list(labelnames)
+        self.function = function
+
+    def collect(self) -> Iterator[Metric]:
+        gauge = GaugeMetricFamily(self.name, self.help, labels=self.labelnames)
+        try:
+            values = self.function()
+        except Exception as err:
+            logger.warning(f'Failed to compute the gauge {self.name}: {err!r}')
+            values = {}
+        for labelvalues, value in values.items():
+            gauge.add_metric([str(label) for label in labelvalues], value)
+        yield gauge
+
+
+class Registry:
+    """
+    The metrics of a service, in a `prometheus_client` registry. Getting a metric that
+    already exists returns it, so several modules (or several instances of a class)
+    can use the same one.
+    """
+
+    def __init__(self):
+        self.collector_registry = CollectorRegistry()
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """
+        A gauge set from the hot path, or computed when the metrics are read with its
+        `set_function` if it has no labels, see `gauge_function` otherwise.
+        """
+        return self._get(Gauge, name, help, labelnames)
+
+    def gauge_function(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str],
+        function: Callable[[], Dict[tuple, float]],
+    ) -> None:
+        """
+        A gauge with labels computed when the metrics are read, from a function
+        returning a dict of label values to numbers.
+        """
+        with self._lock:
+            if name in self._metrics:
+                self.collector_registry.unregister(self._metrics[name])
+            collector = self._metrics[name] = _FunctionGauge(
+                name, help, labelnames, function
+            )
+            self.collector_registry.register(collector)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """
+        The metrics in the Prometheus text format.
+        """
+        return generate_latest(self.collector_registry).decode()
+
+    def _get(self, cls, name: str, help: str, labelnames: Sequence[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(
+                    name,
+                    help,
+                    labelnames,
+                    registry=self.collector_registry,
+                    **kwargs,
+                )
+        if not isinstance(metric, cls):
+            raise ValueError(f'{name} is already a {type(metric).__name__}')
+        return metric
+
+
+# The metrics of the service, exposed by `start_metrics_server`
+REGISTRY = Registry()
+
+
+def start_metrics_server(
+    port: int, host: str = '0.0.0.0', registry: Registry = REGISTRY
+) -> None:
+    """
+    Serve the metrics on http://<host>:<port>/metrics from a background thread.
+    """
+    start_http_server(port, addr=host, registry=registry.collector_registry)
+    logger.info(f'Serving the metrics on http://{host}:{port}/metrics')
+
+
+class StageMetrics:
+    """
+    The messages in and out of a stage, and the processing time from the last message
+    in to each message out. `message_in` and `message_out` can be the first and last
+    steps of a StreamingDataFrame, which processes one message at a time.
+    """
+
+    def __init__(self, stage: str, registry: Registry = REGISTRY):
+        messages = registry.counter(
+            'messages_total',
+            'Messages in and out of each stage',
+            ['stage', 'direction'],
+        )
+        self._in = messages.labels(stage, 'in')
+        self._out = messages.labels(stage, 'out')
+        self._seconds = registry.histogram(
+            'processing_seconds', 'Processing time of the messages', ['stage']
+        ).labels(stage)
+        self._start = time.perf_counter()
+
+    def message_in(self, value: Any = None) -> None:
+        self._in.inc()
+        self._start = time.perf_counter()
+
+    def message_out(self, value: Any = None) -> None:
+        self._out.inc()
+        self._seconds.observe(time.perf_counter() - self._start)
+
+    def batch(self, messages_in: int, messages_out: int, seconds: float) -> None:
+        """
+        Count a batch of messages processed at once, with its processing time.
+        """
+        self._in.inc(messages_in)
+        self._out.inc(messages_out)
+        self._seconds.observe(seconds)
+
+
+def consumer_stats_config(
+    interval_ms: int = 5000, registry: Registry = REGISTRY
+) -> Dict[str, Any]:
+    """
+    librdkafka options of a consumer, to report its lag per partition to the
+    `consumer_lag` gauge every `interval_ms`.
+    """
+    lag = registry.gauge(
+        'consumer_lag',
+        'Messages behind the end of each partition',
+        ['topic', 'partition'],
+    )
+
+    def on_stats(stats_json: str) -> None:
+        stats = json.loads(stats_json)
+        for topic, topic_stats in stats.get('topics', {}).items():
+            for partition, partition_stats in topic_stats['partitions'].items():
+                # -1 is the internal partition, and the lag is -1 until it is known
+                consumer_lag = partition_stats.get('consumer_lag', -1)
+                if partition != '-1' and consumer_lag >= 0:
+                    lag.labels(topic, partition).set(consumer_lag)
+
+    return {'statistics.interval.ms': interval_ms, 'stats_cb': on_stats}
+
+
+def directory_bytes(path: Union[str, Path]) -> int:
+    """
+    The size of the files under a directory, e.g. the RocksDB state of an app.
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                # Deleted by a compaction in the meantime
+                pass
+    return total
+
+
+class SampledLogger:
+    """
+    Log one message out of every `1 / sample_rate` (none with 0), at most
+    `max_per_second` times per second, so the other messages only cost a counter.
+    """
+
+    def __init__(self, sample_rate: float = 0.001, max_per_second: float = 10.0):
+        self.sample_rate = sample_rate
+        self.every = round(1 / sample_rate) if sample_rate > 0 else 0
+        self.max_per_second = max_per_second
+        self._count = 0
+        self._second = 0.0
+        self._logged_in_second = 0
+
+    def log(self, event: str, value: Any, level: str = 'INFO') -> None:
+        if not self.every:
+            return
+        self._count += 1
+        if self._count % self.every:
+            return
+        now = time.monotonic()
+        if now - self._second >= 1.0:
+            self._second = now
+            self._logged_in_second = 0
+        if self._logged_in_second >= self.max_per_second:
+            return
+        self._logged_in_second += 1
+        logger.log(
+            level, '{event}: {value}', event=event, value=value, sampled=self.every
+        )
@@ -0,0 +1,191 @@
+"""
+Partitioning of the topics by pair, so the candles and technical-indicators services
+can run several replicas, each with the state of the pairs of its partitions.
+
+- The trades service produces each trade to the partition of its pair given by a
+  `PairPartitioner`: the pairs with a weight (e.g. their share of the trades) are
+  spread over the partitions, the heaviest first, each to the least loaded partition,
+  and the other pairs go to the partition of the Kafka default partitioner (murmur2
+  of the key), so without weights nothing moves.
+- The candles and technical-indicators services produce each message to the partition
+  of the message it comes from (`to_topic_copartitioned`), so a pair is in the same
+  partition of all the topics and the load stays balanced downstream.
+
+The assignment only depends on the number of partitions and the weights, so it is the
+same across restarts and replicas. Changing them moves some pairs to other partitions,
+where their windows and candles in state start over.
+
+The number of partitions is the one of the topics on the broker (`broker_partitions`):
+the config only applies to the topics created by the services, so the services check it
+at startup instead of producing to partitions that don't exist.
+"""
+
+from typing import Any, Dict, List, Optional
+
+from confluent_kafka import KafkaException
+from quixstreams import Application, message_context
+from quixstreams.dataframe import StreamingDataFrame
+from quixstreams.models import Row, Topic, TopicConfig
+
+
+def murmur2(data: bytes) -> int:
+    """
+    The murmur2 hash of the Kafka default partitioner, as an unsigned 32-bit integer.
+    """
+    m = 0x5BD1E995
+    h = (0x9747B28C ^ len(data)) & 0xFFFFFFFF
+
+    tail = len(data) & ~3
+    for i in range(0, tail, 4):
+        k = int.from_bytes(data[i : i + 4], 'little')
+        k = (k * m) & 0xFFFFFFFF
+        k ^= k >> 24
+        k = (k * m) & 0xFFFFFFFF
+        h = ((h * m) & 0xFFFFFFFF) ^ k
+
+    extra = len(data) - tail
+    if extra == 3:
+        h ^= data[tail + 2] << 16
+    if extra >= 2:
+        h ^= data[tail + 1] << 8
+    if extra >= 1:
+        h ^= data[tail]
+        h = (h * m) & 0xFFFFFFFF
+
+    h ^= h >> 13
+    h = (h * m) & 0xFFFFFFFF
+    h ^= h >> 15
+    return h
+
+
+def default_partition(key: str, n_partitions: int) -> int:
+    """
+    The partition of a key with the Kafka default partitioner.
+    """
+    return (murmur2(key.encode()) & 0x7FFFFFFF) % n_partitions
+
+
+class PairPartitioner:
+    """
+    Stable assignment of the pairs to the partitions of a topic, balancing the load of
+    the pairs with a weight.
+    """
+
+    def __init__(
+        self, n_partitions: int, pair_weights: Optional[Dict[str, float]] = None
+    ):
+        """
+        Args:
+            n_partitions (int): The number of partitions of the topic.
+            pair_weights (Optional[Dict[str, float]]): The load of some pairs, e.g. their share of the trades.
+        """
+        if n_partitions < 1:
+            raise ValueError(
+                f'Number of partitions must be positive, got {n_partitions}'
+            )
+        self.n_partitions = n_partitions
+
+        # Longest processing time first: the heaviest pairs first, each to the least
+        # loaded partition, with ties broken by name and partition so it is stable
+        self.assignment: Dict[str, int] = {}
+        self.loads: List[float] = [0.0] * n_partitions
+        for pair, weight in sorted(
+            (pair_weights or {}).items(), key=lambda item: (-item[1], item[0])
+        ):
+            partition = min(range(n_partitions), key=self.loads.__getitem__)
+            self.assignment[pair] = partition
+            self.loads[partition] += weight
+
+    def __call__(self, pair: str) -> int:
+        partition = self.assignment.get(pair)
+        if partition is None:
+            partition = self.assignment[pair] = default_partition(
+                pair, self.n_partitions
+            )
+        return partition
+
+
+def topic_config(num_partitions: int, replication_factor: int = 1) -> TopicConfig:
+    """
+    The config of the topics created by a service, if they don't exist yet. The number
+    of partitions of an existing topic is not changed.
+    """
+    return TopicConfig(
+        num_partitions=num_partitions, replication_factor=replication_factor
+    )
+
+
+def broker_partitions(app: Application, topic: Topic, timeout: float = 10.0) -> int:
+    """
+    The number of partitions of a topic on the broker, which is not the one of its
+    config if the topic already existed.
+    """
+    with app.get_consumer(auto_commit_enable=False) as consumer:
+        metadata = consumer.list_topics(topic.name, timeout=timeout).topics[topic.name]
+    if metadata.error is not None:
+        raise KafkaException(metadata.error)
+    return len(metadata.partitions)
+
+
+def check_copartitioned(
+    app: Application, input_topic: Topic, output_topic: Topic
+) -> None:
+    """
+    Check the output topic has at least as many partitions as the input one on the
+    broker, so the messages can be produced to the partition of their input message
+    with `to_topic_copartitioned`.
+    """
+    n_input = broker_partitions(app, input_topic)
+    n_output = broker_partitions(app, output_topic)
+    if n_output < n_input:
+        raise ValueError(
+            f'The output topic {output_topic.name} has {n_output} partitions, fewer '
+            f'than the {n_input} partitions of the input topic {input_topic.name}: '
+            f'add partitions to it or recreate it'
+        )
+
+
+def _application_producer(sdf: StreamingDataFrame) -> Any:
+    """
+    The producer of the application of a dataframe, the one `sdf.to_topic` uses.
+
+    `StreamingDataFrame` doesn't expose it, so this reads its private `_producer`
+    attribute, and fails at startup if a version of quixstreams renames it.
+    """
+    producer = getattr(sdf, '_producer', None)
+    if producer is None:
+        raise RuntimeError(
+            'StreamingDataFrame has no _producer attribute in this version of '
+            'quixstreams, see to_topic_copartitioned'
+        )
+    return producer
+
+
+def to_topic_copartitioned(sdf: StreamingDataFrame, topic: Topic) -> StreamingDataFrame:
+    """
+    Like `sdf.to_topic(topic)`, but produce each message to the partition of the
+    message it comes from instead of the partition of its key, so the output topic is
+    partitioned like the input one. It must have at least as many partitions, see
+    `check_copartitioned`.
+    """
+    # The producer of the application, flushed before the offsets are committed
+    producer = _application_producer(sdf)
+
+    def produce(value: Any, key: Any, timestamp: int, headers: Any) -> None:
+        context = message_context()
+        row = Row(
+            value=value,
+            key=key,
+            timestamp=timestamp,
+            context=context,
+            headers=headers,
+        )
+        producer.produce_row(
+            row=row,
+            topic=topic,
+            key=key,
+            partition=context.partition,
+            timestamp=timestamp,
+        )
+
+    return sdf.update(produce, metadata=True)
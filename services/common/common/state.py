@@ -0,0 +1,40 @@
+"""
+In-memory stand-in for the quixstreams state of a single key, to run the steps of the
+services without Kafka: the fused pipeline, the benchmarks, the parity checks and the
+tests.
+"""
+
+from typing import Any, Callable, Dict
+
+from quixstreams.utils.json import dumps as json_dumps
+from quixstreams.utils.json import loads as json_loads
+
+
+class MemoryState:
+    """
+    In-memory state of a single key, serializing the values like the RocksDB state of
+    the services does, so the steps behave the same: a value changed after `set` or
+    returned by `get` is not changed in the state.
+    """
+
+    def __init__(
+        self,
+        dumps: Callable[[Any], bytes] = json_dumps,
+        loads: Callable[[bytes], Any] = json_loads,
+    ):
+        self._values: Dict[str, bytes] = {}
+        self._dumps = dumps
+        self._loads = loads
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._values.get(key)
+        return default if value is None else self._loads(value)
+
+    def set(self, key: str, value: Any) -> None:
+        self._values[key] = self._dumps(value)
+
+    def delete(self, key: str) -> None:
+        self._values.pop(key, None)
+
+    def exists(self, key: str) -> bool:
+        return key in self._values
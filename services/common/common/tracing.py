@@ -0,0 +1,129 @@
+"""
+Latency tracing of the messages through the pipeline, with Kafka headers.
+
+Each service adds the time it consumed and produced a message to the headers of the
+message it produces, as `trace.<stage>.in_us` and `trace.<stage>.out_us`
+(microseconds since the epoch, as ASCII digits), after the headers of the message it
+comes from. So a message of the technical-indicators topic has the times of all the
+stages before it, in the pipeline order.
+
+Each service also records its own latency (from in to out) and the cumulative
+latency (from the `timestamp_ms` of the trade to out) in Prometheus histograms, see
+`common.instrumentation`. They are not labelled by pair, which would make thousands of
+series with many pairs: the latencies of each pair are in the headers, for an offline
+report.
+"""
+
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from common.instrumentation import LATENCY_BUCKETS, REGISTRY, Registry
+
+HEADER_PREFIX = 'trace.'
+
+# From 10us to 1 hour: a stage takes microseconds to seconds, but the cumulative
+# latency of a candle includes its window, and more for a final candle emitted with
+# the next trade of its pair
+TRACE_LATENCY_BUCKETS = (
+    *LATENCY_BUCKETS,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+    600.0,
+    1800.0,
+    3600.0,
+)
+
+Headers = List[Tuple[str, bytes]]
+
+
+def now_us() -> int:
+    return time.time_ns() // 1000
+
+
+def stamp(
+    headers: Optional[Headers], stage: str, event: str, time_us: Optional[int] = None
+) -> Headers:
+    """
+    A copy of the headers with the time of an event ('in' or 'out') of a stage.
+    """
+    headers = list(headers) if headers else []
+    time_us = now_us() if time_us is None else time_us
+    headers.append((f'{HEADER_PREFIX}{stage}.{event}_us', str(time_us).encode()))
+    return headers
+
+
+def read_stamps(headers: Optional[Headers]) -> Dict[str, int]:
+    """
+    The times of the headers, as `{'<stage>.<event>': time_us}` in the pipeline order.
+    """
+    stamps = {}
+    for name, value in headers or ():
+        if name.startswith(HEADER_PREFIX) and name.endswith('_us'):
+            stamps[name[len(HEADER_PREFIX) : -len('_us')]] = int(value)
+    return stamps
+
+
+class LatencyRecorder:
+    """
+    The latency of a stage, from the `<stage>.in` time of the headers to its out time,
+    and the cumulative latency from the `timestamp_ms` of the message, in the
+    `stage_latency_seconds` and `pipeline_latency_seconds` histograms of the registry.
+    Negative latencies (clock skew between hosts) fall in the first bucket.
+    """
+
+    def __init__(self, stage: str, registry: Registry = REGISTRY):
+        self.stage = stage
+        self._stage_latency = registry.histogram(
+            'stage_latency_seconds',
+            'Latency of each stage, from the message in to the message out',
+            ['stage'],
+            buckets=TRACE_LATENCY_BUCKETS,
+        ).labels(stage)
+        self._cumulative_latency = registry.histogram(
+            'pipeline_latency_seconds',
+            'Latency from the timestamp of the trade to the message out of each stage',
+            ['stage'],
+            buckets=TRACE_LATENCY_BUCKETS,
+        ).labels(stage)
+
+    def record(
+        self,
+        headers: Optional[Headers],
+        value: Dict[str, Any],
+        out_us: Optional[int] = None,
+    ) -> None:
+        out_us = now_us() if out_us is None else out_us
+        in_us = read_stamps(headers).get(f'{self.stage}.in', out_us)
+
+        self._stage_latency.observe((out_us - in_us) / 1e6)
+        if 'timestamp_ms' in value:
+            self._cumulative_latency.observe(
+                (out_us - value['timestamp_ms'] * 1000) / 1e6
+            )
+
+
+def stamp_in(stage: str):
+    """
+    A `StreamingDataFrame.set_headers` callback adding the in time of a stage.
+    """
+
+    def callback(value: Any, key: Any, timestamp: int, headers: Headers) -> Headers:
+        return stamp(headers, stage, 'in')
+
+    return callback
+
+
+def stamp_out(recorder: LatencyRecorder):
+    """
+    A `StreamingDataFrame.set_headers` callback adding the out time of the stage of
+    the recorder, and recording its latencies.
+    """
+
+    def callback(value: Any, key: Any, timestamp: int, headers: Headers) -> Headers:
+        out_us = now_us()
+        recorder.record(headers, value, out_us)
+        return stamp(headers, recorder.stage, 'out', out_us)
+
+    return callback
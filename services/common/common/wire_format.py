@@ -0,0 +1,290 @@
+"""
+Compact binary format of the messages of the pipeline topics, with JSON as fallback.
+
+A binary message is:
+- a 0x00 byte, which no JSON document starts with, so a consumer reads both formats
+  from the same topic
+- the version of the format (1 byte)
+- the size of the schema (2 bytes) and the schema, with for each field its name, as
+  its 1-byte code in `FIELD_NAMES` (or 0, the size and the UTF-8 name if it has no
+  code), and its type (1 byte): d (float), q (int), ? (bool), s (str) or n (None)
+- the numbers, packed with `struct` in the order of the schema
+- the strings, each after its 2-byte size
+
+The fields of the trades, candles and default indicators have a code, so the schema
+of a technical-indicators message is 2 bytes per field and the floats are 8 bytes,
+instead of every name and float as text. The layout of each set of fields and types
+is built once and cached, on both sides. A message with other types (e.g. a nested
+dict) is written as JSON.
+
+`FIELD_NAMES` is append-only: adding names needs a new `VERSION`, with the number of
+names it knows in `VERSION_FIELD_NAMES`, and the consumers must be updated first.
+"""
+
+import struct
+from operator import itemgetter
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple
+
+from quixstreams.models.serializers import (
+    Deserializer,
+    SerializationContext,
+    Serializer,
+)
+from quixstreams.utils.json import dumps as json_dumps
+from quixstreams.utils.json import loads as json_loads
+
+WireFormat = Literal['json', 'binary']
+
+MAGIC = 0x00
+VERSION = 1
+
+FIELD_NAMES = (
+    # Trades
+    'pair',
+    'price',
+    'volume',
+    'timestamp',
+    'timestamp_ms',
+    # Candles
+    'open',
+    'high',
+    'low',
+    'close',
+    'window_start_ms',
+    'window_end_ms',
+    'candle_seconds',
+    # Indicators of indicators.json
+    'rsi_9',
+    'rsi_14',
+    'rsi_21',
+    'macd',
+    'macd_signal',
+    'macd_hist',
+    'bbands_upper',
+    'bbands_middle',
+    'bbands_lower',
+    'stochrsi_fastk',
+    'stochrsi_fastd',
+    'adx',
+    'volume_ema',
+    'ichimoku_conv',
+    'ichimoku_base',
+    'ichimoku_span_a',
+    'ichimoku_span_b',
+    'mfi',
+    'atr',
+    'price_roc',
+    'sma_7',
+    'sma_14',
+    'sma_21',
+)
+
+# The number of names of FIELD_NAMES known by each version
+VERSION_FIELD_NAMES = {1: 35}
+
+_CODES = {name: code for code, name in enumerate(FIELD_NAMES, start=1)}
+_TYPE_CODES = {float: 'd', int: 'q', bool: '?', str: 's', type(None): 'n'}
+_NUMBER_TYPES = 'dq?'
+_HEADER = struct.Struct('<BBH')
+_STRING_SIZE = struct.Struct('<H')
+
+# The number of layouts cached on each side, more means the fields change per message
+MAX_LAYOUTS = 1024
+
+
+class _Layout:
+    """
+    The fields of a schema, in the order they are written: the numbers, then the
+    strings, then the None values.
+    """
+
+    __slots__ = (
+        'header',
+        'numbers',
+        'number_names',
+        'get_numbers',
+        'string_names',
+        'null_names',
+    )
+
+    def __init__(
+        self,
+        header: bytes,
+        numbers: struct.Struct,
+        number_names: Tuple[str, ...],
+        string_names: Tuple[str, ...],
+        null_names: Tuple[str, ...],
+    ):
+        self.header = header
+        self.numbers = numbers
+        self.number_names = number_names
+        # The numbers of a dict, in order. itemgetter is faster, but returns the value
+        # instead of a tuple with a single name
+        self.get_numbers: Callable[[Dict[str, Any]], Tuple[Any, ...]] = (
+            itemgetter(*number_names)
+            if len(number_names) > 1
+            else lambda value: tuple(value[name] for name in number_names)
+        )
+        self.string_names = string_names
+        self.null_names = null_names
+
+
+# Layouts by (names, types) to encode, and by (version, schema) to decode
+_encoding_layouts: Dict[tuple, Optional[_Layout]] = {}
+_decoding_layouts: Dict[Tuple[int, bytes], _Layout] = {}
+
+
+def encode(value: Dict[str, Any]) -> bytes:
+    """
+    The binary message of a dict, or its JSON if it has types the format does not
+    support.
+    """
+    # The names then the types of the fields, in a single tuple as it is faster
+    key = (*value, *map(type, value.values()))
+    try:
+        layout = _encoding_layouts[key]
+    except KeyError:
+        layout = _build_encoding_layout(tuple(value), tuple(map(type, value.values())))
+        if len(_encoding_layouts) >= MAX_LAYOUTS:
+            _encoding_layouts.clear()
+        _encoding_layouts[key] = layout
+    if layout is None:
+        return json_dumps(value)
+
+    try:
+        data = layout.header + layout.numbers.pack(*layout.get_numbers(value))
+        for name in layout.string_names:
+            encoded = value[name].encode()
+            data += _STRING_SIZE.pack(len(encoded)) + encoded
+    except struct.error:
+        # An int that does not fit in 64 bits, or a string of more than 64KB
+        return json_dumps(value)
+    return data
+
+
+def decode(data: bytes) -> Any:
+    """
+    The value of a binary or JSON message.
+    """
+    if not data or data[0] != MAGIC:
+        return json_loads(data)
+
+    _, version, schema_size = _HEADER.unpack_from(data)
+    end = _HEADER.size + schema_size
+    key = (version, data[_HEADER.size : end])
+    layout = _decoding_layouts.get(key)
+    if layout is None:
+        layout = _build_decoding_layout(*key)
+        if len(_decoding_layouts) >= MAX_LAYOUTS:
+            _decoding_layouts.clear()
+        _decoding_layouts[key] = layout
+
+    value = dict(
+        zip(layout.number_names, layout.numbers.unpack_from(data, end), strict=True)
+    )
+    offset = end + layout.numbers.size
+    for name in layout.string_names:
+        (size,) = _STRING_SIZE.unpack_from(data, offset)
+        offset += _STRING_SIZE.size
+        value[name] = data[offset : offset + size].decode()
+        offset += size
+    for name in layout.null_names:
+        value[name] = None
+    return value
+
+
+class WireSerializer(Serializer):
+    """
+    The value serializer of the pipeline topics, binary or JSON.
+    """
+
+    def __init__(self, wire_format: WireFormat = 'binary'):
+        self.wire_format = wire_format
+        self._encode = encode if wire_format == 'binary' else json_dumps
+
+    def __call__(self, value: Any, ctx: SerializationContext) -> bytes:
+        if type(value) is not dict:
+            return json_dumps(value)
+        return self._encode(value)
+
+
+class WireDeserializer(Deserializer):
+    """
+    The value deserializer of the pipeline topics, of both the binary and JSON
+    messages.
+    """
+
+    def __call__(self, value: bytes, ctx: SerializationContext) -> Any:
+        return decode(value)
+
+
+def _build_encoding_layout(
+    names: Tuple[str, ...], types: Tuple[type, ...]
+) -> Optional[_Layout]:
+    type_codes = [_TYPE_CODES.get(value_type) for value_type in types]
+    if None in type_codes:
+        return None
+
+    # The numbers first, so they are packed in a single call, then the strings and
+    # the None values
+    order = sorted(
+        range(len(names)),
+        key=lambda i: (
+            0 if type_codes[i] in _NUMBER_TYPES else 1 if type_codes[i] == 's' else 2
+        ),
+    )
+    schema = bytearray()
+    for i in order:
+        code = _CODES.get(names[i])
+        if code is None:
+            encoded = names[i].encode()
+            if len(encoded) > 255:
+                return None
+            schema += bytes((0, len(encoded))) + encoded
+        else:
+            schema.append(code)
+        schema += type_codes[i].encode()
+    if len(schema) > 0xFFFF:
+        return None
+
+    return _make_layout(
+        [(names[i], type_codes[i]) for i in order],
+        header=_HEADER.pack(MAGIC, VERSION, len(schema)) + bytes(schema),
+    )
+
+
+def _build_decoding_layout(version: int, schema: bytes) -> _Layout:
+    if version not in VERSION_FIELD_NAMES:
+        raise ValueError(
+            f'Unknown wire format version {version}, the consumer must be updated'
+        )
+    n_names = VERSION_FIELD_NAMES[version]
+
+    names, type_codes = [], []
+    i = 0
+    while i < len(schema):
+        code = schema[i]
+        if code == 0:
+            size = schema[i + 1]
+            names.append(schema[i + 2 : i + 2 + size].decode())
+            i += 2 + size
+        elif code <= n_names:
+            names.append(FIELD_NAMES[code - 1])
+            i += 1
+        else:
+            raise ValueError(f'Unknown field code {code} in version {version}')
+        type_codes.append(chr(schema[i]))
+        i += 1
+
+    return _make_layout(list(zip(names, type_codes, strict=True)))
+
+
+def _make_layout(fields: List[Tuple[str, str]], header: bytes = b'') -> _Layout:
+    number_fields = [(name, code) for name, code in fields if code in _NUMBER_TYPES]
+    return _Layout(
+        header=header,
+        numbers=struct.Struct('<' + ''.join(code for _, code in number_fields)),
+        number_names=tuple(name for name, _ in number_fields),
+        string_names=tuple(name for name, code in fields if code == 's'),
+        null_names=tuple(name for name, code in fields if code == 'n'),
+    )
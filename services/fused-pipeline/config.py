@@ -0,0 +1,66 @@
+from typing import Dict, List, Literal, Optional
+
+from pydantic import model_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Config(BaseSettings):
+    model_config = SettingsConfigDict(env_file='.env', env_file_encoding='utf-8')
+    # Where the trades come from, with the options of the trades service
+    trade_source: Literal['websocket', 'mock', 'replay', 'synthetic'] = 'websocket'
+    pairs: List[str]
+    kraken_websocket_url: str = 'wss://ws.kraken.com/v2'
+    validate_trades: bool = False
+    replay_frames_path: Optional[str] = None
+    # 0 to replay the trades as fast as possible, e.g. for a backtest
+    replay_speed: float = 0.0
+    synthetic_trades_per_second: float = 1000
+    synthetic_pairs: int = 200
+    synthetic_seed: int = 42
+    # The timestamp of the first synthetic trade, in ms since the epoch, so the trades
+    # are the same from one run to the next (defaults to the start time of the run)
+    synthetic_start_ms: Optional[int] = None
+    synthetic_max_trades: Optional[int] = None
+    # The candles, with the options of the candles service
+    candle_seconds: int = 60
+    emit_incomplete_candles: bool = True
+    incomplete_candles_interval_ms: int = 0
+    rollup_candle_seconds: List[int] = []
+    # The technical indicators, with the options of the technical-indicators service.
+    # The indicators of every timeframe of the candles if INDICATOR_CANDLE_SECONDS is
+    # empty, and the default indicators if INDICATORS_FILE is not set, the only ones of
+    # INCREMENTAL_INDICATORS
+    max_candles_in_state: int = 60
+    indicator_candle_seconds: List[int] = []
+    max_candles_in_state_by_timeframe: Dict[int, int] = {}
+    incremental_indicators: bool = False
+    indicators_file: Optional[str] = None
+    debounce_interval_ms: int = 0
+    # Write the indicators to the local Parquet store of the to-feature-store
+    # service, or nowhere (e.g. with only the Kafka taps)
+    output_sink: Literal['local', 'none'] = 'local'
+    local_store_path: str = 'feature_store'
+    feature_group_event_time: str = 'timestamp_ms'
+    feature_group_dedup_keys: List[str] = ['pair', 'candle_seconds', 'window_start_ms']
+    sink_batch_size: int = 10_000
+    # Also produce the trades, candles and indicators to these topics, none by default
+    kafka_broker_address: Optional[str] = None
+    kafka_trades_topic: Optional[str] = None
+    kafka_candles_topic: Optional[str] = None
+    kafka_indicators_topic: Optional[str] = None
+    # The format of the messages of the taps, see common/wire_format.py
+    wire_format: Literal['json', 'binary'] = 'binary'
+    # The port of the Prometheus metrics endpoint, 0 to disable it
+    metrics_port: int = 9105
+
+    @model_validator(mode='after')
+    def check_incremental_indicators_without_indicators_file(self) -> 'Config':
+        if self.incremental_indicators and self.indicators_file:
+            raise ValueError(
+                'INCREMENTAL_INDICATORS only computes the default indicators, not the '
+                f'ones of INDICATORS_FILE={self.indicators_file}: unset one of them'
+            )
+        return self
+
+
+config = Config()
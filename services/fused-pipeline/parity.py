@@ -0,0 +1,143 @@
+"""
+Parity check of the fused pipeline against the backfill of the technical-indicators service.
+
+It generates random trades (with a few late ones), pushes them one by one through
+the fused pipeline with the 60s candles rolled up into 300s candles, and checks the
+last message of each window of both timeframes equals the row of the backfill, which
+builds the candles and indicators of all the trades at once with pandas and talib.
+It also checks the final candles (EMIT_INCOMPLETE_CANDLES=false) are these same last
+messages, and reports the trades/sec of the fused pipeline.
+
+Usage:
+    python parity.py --trades 200000 --pairs 3
+"""
+
+import argparse
+import importlib
+import math
+import sys
+import time
+from typing import Any, Dict, List
+
+import pandas as pd
+from loguru import logger
+from pipeline import FusedPipeline
+from sinks import MemorySink
+from steps import indicator_registry
+
+backfill = importlib.import_module('backfill')
+backfill_parity = importlib.import_module('backfill_parity')
+
+CANDLE_SECONDS = 60
+ROLLUP_CANDLE_SECONDS = 300
+
+
+def run_pipeline(
+    trades: List[Dict[str, Any]], emit_incomplete_candles: bool, max_candles: int
+) -> List[Dict[str, Any]]:
+    """
+    The messages of the fused pipeline, with the trades/sec logged.
+    """
+    sink = MemorySink()
+    pipeline = FusedPipeline(
+        candle_seconds=CANDLE_SECONDS,
+        max_candles_in_state=max_candles,
+        emit_incomplete_candles=emit_incomplete_candles,
+        rollup_candle_seconds=[ROLLUP_CANDLE_SECONDS],
+        plan=indicator_registry.default_plan(),
+        sinks=[sink],
+    )
+    start = time.perf_counter()
+    for trade in trades:
+        pipeline.process(trade)
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f'emit_incomplete_candles={emit_incomplete_candles}: {len(trades)} trades, '
+        f'{len(sink.messages)} messages, {len(trades) / elapsed:,.0f} trades/sec'
+    )
+    return sink.messages
+
+
+def last_by_window(messages: List[Dict[str, Any]]) -> Dict[tuple, Dict[str, Any]]:
+    return {
+        (
+            message['candle_seconds'],
+            message['pair'],
+            message['window_start_ms'],
+        ): message
+        for message in messages
+    }
+
+
+def assert_same(expected: pd.DataFrame, messages: List[Dict[str, Any]]) -> float:
+    """
+    Check the messages have the values of the rows, and return the worst relative
+    difference.
+    """
+    assert len(expected) == len(messages), (len(expected), len(messages))
+    assert list(expected.columns) == list(messages[0]), 'Different columns'
+
+    worst = 0.0
+    for row, message in zip(expected.to_dict('records'), messages, strict=True):
+        for column, value in message.items():
+            actual = row[column]
+            if isinstance(value, str) or value is None:
+                assert actual == value, (column, actual, value)
+                continue
+            if math.isnan(value):
+                assert math.isnan(actual), (message['pair'], column, actual, value)
+                continue
+            diff = abs(actual - value) / max(1.0, abs(value))
+            assert diff < 1e-9, (message['pair'], column, actual, value)
+            worst = max(worst, diff)
+    return worst
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--trades', type=int, default=200_000)
+    parser.add_argument('--pairs', type=int, default=3)
+    parser.add_argument('--max-candles-in-state', type=int, default=60)
+    args = parser.parse_args()
+
+    # Skip the debug logs of the indicators
+    logger.remove()
+    logger.add(sys.stderr, level='INFO')
+
+    trades = backfill_parity.make_trades(args.trades, args.pairs)
+    records = trades.to_dict('records')
+
+    # The larger candles are rolled up from the 60s candles, without their late trades
+    window_start_ms = trades['timestamp_ms'] // (CANDLE_SECONDS * 1000)
+    on_time = window_start_ms == window_start_ms.groupby(trades['pair']).cummax()
+    expected = pd.concat(
+        [
+            backfill.compute_indicators_batch(
+                backfill.build_candles(trades, CANDLE_SECONDS)
+            ),
+            backfill.compute_indicators_batch(
+                backfill.build_candles(trades[on_time], ROLLUP_CANDLE_SECONDS)
+            ),
+        ],
+        ignore_index=True,
+    )
+
+    messages = last_by_window(run_pipeline(records, True, args.max_candles_in_state))
+    worst = assert_same(expected, [messages[key] for key in sorted(messages)])
+    print(
+        f'{len(messages)} candles of {CANDLE_SECONDS}s and {ROLLUP_CANDLE_SECONDS}s '
+        f'match the backfill, worst relative difference: {worst:.2e}'
+    )
+
+    # Only the last window of each pair and timeframe is never closed
+    final = last_by_window(run_pipeline(records, False, args.max_candles_in_state))
+    open_windows = {
+        max(key for key in messages if key[:2] == prefix)
+        for prefix in {key[:2] for key in messages}
+    }
+    assert set(final) == set(messages) - open_windows
+    assert_same(
+        pd.DataFrame([messages[key] for key in sorted(final)]),
+        [final[key] for key in sorted(final)],
+    )
+    print(f'{len(final)} final candles match the last incomplete ones')
@@ -0,0 +1,239 @@
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Protocol, Sequence
+
+from common.state import MemoryState
+from steps import (
+    candle_buffer,
+    candles_run,
+    coalesce,
+    debounce,
+    incremental_indicators,
+    rollup,
+    technical_indicators,
+    timeframes,
+)
+
+# The columns of the candles, in the order of the candles topic
+CANDLE_COLUMNS = (
+    'pair',
+    'timestamp_ms',
+    'open',
+    'high',
+    'low',
+    'close',
+    'volume',
+)
+
+
+class Sink(Protocol):
+    """
+    Where the messages of a stage go: the technical indicators, or the trades and
+    candles of a tap.
+    """
+
+    def write(self, messages: List[Dict[str, Any]]) -> None: ...
+
+    def flush(self) -> None: ...
+
+
+class CandleWindows:
+    """
+    The tumbling windows of the candles service, with the `init_candle` and
+    `update_candle` reducers, for all the pairs.
+
+    As the quixstreams windows without grace period, each pair has a single open
+    window: a trade of an older window is dropped, and a trade of a newer window
+    closes it. With `emit_incomplete_candles`, every trade emits the candle of its
+    window (`.current()`), otherwise the trade closing a window emits its final candle
+    (`.final()`).
+    """
+
+    def __init__(self, candle_seconds: int, emit_incomplete_candles: bool):
+        self.candle_seconds = candle_seconds
+        self.window_ms = candle_seconds * 1000
+        self.emit_incomplete_candles = emit_incomplete_candles
+        # The start and the candle of the open window of each pair
+        self._windows: Dict[str, tuple] = {}
+        self.late_trades = 0
+
+    def update(self, trade: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Update the window of a trade, and return the candles to emit.
+        """
+        start = trade['timestamp_ms'] - trade['timestamp_ms'] % self.window_ms
+        window = self._windows.get(trade['pair'])
+
+        if window is not None and start < window[0]:
+            self.late_trades += 1
+            return []
+
+        if window is not None and start == window[0]:
+            candles_run.update_candle(window[1], trade)
+            closed = None
+        else:
+            closed = window
+            window = self._windows[trade['pair']] = (
+                start,
+                candles_run.init_candle(trade),
+            )
+
+        if self.emit_incomplete_candles:
+            return [self._to_candle(*window)]
+        return [self._to_candle(*closed)] if closed is not None else []
+
+    def _to_candle(self, start: int, value: Dict[str, Any]) -> Dict[str, Any]:
+        candle = {column: value[column] for column in CANDLE_COLUMNS}
+        candle['window_start_ms'] = start
+        candle['window_end_ms'] = start + self.window_ms
+        candle['candle_seconds'] = self.candle_seconds
+        return candle
+
+
+class FusedPipeline:
+    """
+    The candles and technical-indicators services in a single process: each trade
+    goes through the steps of both services, with a state per pair in memory, and the
+    technical indicators are written to the sinks.
+
+    The steps are the functions of the services, in the same order and with the same
+    options, so the messages are the same as the ones of the technical-indicators
+    topic. The trades and candles can also be written to taps, e.g. their Kafka topics.
+    """
+
+    def __init__(
+        self,
+        candle_seconds: int,
+        max_candles_in_state: int,
+        emit_incomplete_candles: bool = True,
+        incomplete_candles_interval_ms: int = 0,
+        rollup_candle_seconds: Optional[List[int]] = None,
+        indicator_candle_seconds: Optional[List[int]] = None,
+        max_candles_in_state_by_timeframe: Optional[Dict[int, int]] = None,
+        incremental: bool = False,
+        plan: Optional[Any] = None,
+        debounce_interval_ms: int = 0,
+        sinks: Sequence[Sink] = (),
+        taps: Optional[Dict[str, Sink]] = None,
+    ):
+        """
+        Args:
+            candle_seconds (int): The seconds of the candles built from the trades.
+            max_candles_in_state (int): The number of candles kept per pair and timeframe to compute the indicators.
+            emit_incomplete_candles (bool): Emit the incomplete candles or just the final ones.
+            incomplete_candles_interval_ms (int): Emit at most one incomplete candle per pair per interval, 0 to emit them all.
+            rollup_candle_seconds (Optional[List[int]]): The seconds of the larger candles rolled up from the `candle_seconds` ones.
+            indicator_candle_seconds (Optional[List[int]]): The timeframes to compute the indicators of, all the candles by default.
+            max_candles_in_state_by_timeframe (Optional[Dict[int, int]]): The number of candles kept for some of the timeframes, instead of `max_candles_in_state`.
+            incremental (bool): Compute the indicators from running sums, see incremental_indicators.py.
+            plan (Optional[IndicatorPlan]): The indicators to compute, the default ones if None.
+            debounce_interval_ms (int): Recompute the indicators of a pair at most once per this many milliseconds within a window, 0 to recompute them on every candle.
+            sinks (Sequence[Sink]): Where to write the technical indicators.
+            taps (Optional[Dict[str, Sink]]): Where to also write the 'trades' and the 'candles'.
+        """
+        rollup_candle_seconds = sorted(rollup_candle_seconds or [])
+        for seconds in rollup_candle_seconds:
+            if seconds <= candle_seconds or seconds % candle_seconds:
+                raise ValueError(
+                    f'Rollup candle seconds must be multiples of {candle_seconds}, got {seconds}'
+                )
+
+        # The steps of the candles service
+        self.windows = CandleWindows(candle_seconds, emit_incomplete_candles)
+        self.candle_steps: List[Callable[[Dict[str, Any], MemoryState], Any]] = []
+        if emit_incomplete_candles and incomplete_candles_interval_ms > 0:
+            self.candle_steps.append(
+                coalesce.CandleCoalescer(interval_ms=incomplete_candles_interval_ms)
+            )
+        if rollup_candle_seconds:
+            self.candle_steps.append(
+                partial(
+                    rollup.rollup_candles,
+                    rollup_candle_seconds=rollup_candle_seconds,
+                    emit_incomplete_candles=emit_incomplete_candles,
+                )
+            )
+
+        # The steps of the technical-indicators service
+        max_candles = timeframes.parse_max_candles(
+            indicator_candle_seconds or [candle_seconds, *rollup_candle_seconds],
+            max_candles_in_state,
+            max_candles_in_state_by_timeframe or {},
+        )
+        functions = {}
+        for seconds, max_candles_of_timeframe in max_candles.items():
+            if incremental:
+                compute = partial(
+                    incremental_indicators.compute_indicators_incremental,
+                    max_candles_in_state=max_candles_of_timeframe,
+                )
+            else:
+                compute = partial(
+                    technical_indicators.update_candles_and_compute_indicators,
+                    max_candles_in_state=max_candles_of_timeframe,
+                    plan=plan,
+                )
+            if debounce_interval_ms > 0:
+                compute = debounce.IndicatorDebouncer(debounce_interval_ms, compute)
+            functions[seconds] = compute
+        self.router = timeframes.TimeframeRouter(functions)
+        self.debounce = debounce_interval_ms > 0
+
+        self.sinks = list(sinks)
+        self.taps = taps or {}
+
+        # The states of each pair, with the serialization of the state of each service
+        self._candle_states: Dict[str, MemoryState] = {}
+        self._indicator_states: Dict[str, MemoryState] = {}
+
+    def process(self, trade: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Push a trade through all the steps.
+
+        Returns:
+            List[Dict[str, Any]]: The technical indicators written to the sinks.
+        """
+        if 'trades' in self.taps:
+            self.taps['trades'].write([trade])
+
+        candles = self.windows.update(trade)
+        if self.candle_steps and candles:
+            state = self._candle_states.get(trade['pair'])
+            if state is None:
+                state = self._candle_states[trade['pair']] = MemoryState()
+            for step in self.candle_steps:
+                # Each step expands a candle into zero or more candles
+                candles = [
+                    output for candle in candles for output in step(candle, state)
+                ]
+        if not candles:
+            return []
+        if 'candles' in self.taps:
+            self.taps['candles'].write(candles)
+
+        messages = []
+        for candle in candles:
+            if not self.router.accepts(candle):
+                continue
+            state = self._indicator_states.get(candle['pair'])
+            if state is None:
+                state = self._indicator_states[candle['pair']] = MemoryState(
+                    candle_buffer.state_dumps, candle_buffer.state_loads
+                )
+            # A copy, as the technical-indicators service gets its own from Kafka
+            output = self.router(dict(candle), state)
+            if self.debounce:
+                messages.extend(output)
+            else:
+                messages.append(output)
+
+        if messages:
+            for sink in self.sinks:
+                sink.write(messages)
+        return messages
+
+    def flush(self) -> None:
+        """
+        Flush the sinks and taps, e.g. at the end of a backtest.
+        """
+        for sink in [*self.sinks, *self.taps.values()]:
+            sink.flush()
@@ -0,0 +1,177 @@
+import signal
+import sys
+import time
+from typing import Dict, List, Optional, Union
+
+from common.instrumentation import REGISTRY, StageMetrics, start_metrics_server
+from common.wire_format import WireFormat, WireSerializer
+from loguru import logger
+from pipeline import FusedPipeline, Sink
+from quixstreams import Application
+from sinks import KafkaSink, LocalStoreSink
+from steps import (
+    indicator_registry,
+    kraken_mock,
+    kraken_replay,
+    kraken_synthetic,
+    kraken_websocket,
+)
+
+
+def signal_handler(sig, frame):
+    logger.info('Received shutdown signal. Exiting gracefully...')
+    sys.exit(0)
+
+
+def main(
+    kraken_api: Union[
+        kraken_mock.KrakenMockAPI,
+        kraken_websocket.KrakenWebsocketAPI,
+        kraken_replay.KrakenReplayAPI,
+        kraken_synthetic.KrakenSyntheticAPI,
+    ],
+    pipeline: FusedPipeline,
+    log_interval_seconds: float = 60.0,
+):
+    """
+    Push the trades of the Kraken API through the fused pipeline, until the API is
+    done (e.g. the end of a replay), then flush the sinks and taps.
+
+    Args:
+        kraken_api: The API to read the trades from.
+        pipeline (FusedPipeline): The candles and technical-indicators steps, with their sinks and taps.
+        log_interval_seconds (float): How often to log the number of trades and messages.
+
+    Returns:
+        None
+    """
+    logger.info('Starting the fused pipeline')
+
+    # Register the signal handler for graceful shutdown
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+
+    stage_metrics = StageMetrics('fused-pipeline')
+    n_trades = n_messages = 0
+    start = last_log_time = time.monotonic()
+    try:
+        while not kraken_api.is_done():
+            for trade in kraken_api.get_trades():
+                trade_start = time.perf_counter()
+                n_out = len(pipeline.process(trade.to_dict()))
+                stage_metrics.batch(1, n_out, time.perf_counter() - trade_start)
+                n_trades += 1
+                n_messages += n_out
+
+            if time.monotonic() - last_log_time >= log_interval_seconds:
+                last_log_time = time.monotonic()
+                logger.info(f'Trades={n_trades}, messages={n_messages}')
+    finally:
+        pipeline.flush()
+
+    elapsed = time.monotonic() - start
+    logger.info(
+        f'Trades={n_trades}, messages={n_messages}, late trades='
+        f'{pipeline.windows.late_trades} in {elapsed:.1f}s '
+        f'({n_trades / max(elapsed, 1e-9):,.0f} trades/sec)'
+    )
+
+
+def kafka_taps(
+    broker_address: str, topics: Dict[str, Optional[str]], wire_format: WireFormat
+) -> Dict[str, KafkaSink]:
+    """
+    A sink producing to the topic of each stage ('trades', 'candles' or
+    'technical-indicators') with a topic name, sharing a single producer.
+    """
+    app = Application(broker_address=broker_address)
+    producer = app.get_producer()
+    return {
+        stage: KafkaSink(
+            producer,
+            app.topic(name=name, value_serializer=WireSerializer(wire_format)),
+        )
+        for stage, name in topics.items()
+        if name
+    }
+
+
+if __name__ == '__main__':
+    from config import config
+
+    # The trade sources of the trades service, without the async websocket
+    if config.trade_source == 'synthetic':
+        kraken_api = kraken_synthetic.KrakenSyntheticAPI(
+            pairs=config.pairs,
+            trades_per_second=config.synthetic_trades_per_second,
+            n_pairs=config.synthetic_pairs,
+            seed=config.synthetic_seed,
+            start_ms=config.synthetic_start_ms,
+            max_trades=config.synthetic_max_trades,
+            validate=config.validate_trades,
+        )
+    elif config.trade_source == 'replay':
+        kraken_api = kraken_replay.KrakenReplayAPI(
+            path=config.replay_frames_path,
+            speed=config.replay_speed,
+            validate=config.validate_trades,
+        )
+    elif config.trade_source == 'mock':
+        kraken_api = kraken_mock.KrakenMockAPI(pair=config.pairs[0])
+    else:
+        kraken_api = kraken_websocket.KrakenWebsocketAPI(
+            pairs=config.pairs,
+            url=config.kraken_websocket_url,
+            validate=config.validate_trades,
+        )
+
+    sinks: List[Sink] = []
+    if config.output_sink == 'local':
+        local_sink = LocalStoreSink(
+            path=config.local_store_path,
+            event_time_column=config.feature_group_event_time,
+            dedup_keys=config.feature_group_dedup_keys,
+            batch_size=config.sink_batch_size,
+        )
+        sinks.append(local_sink)
+        REGISTRY.gauge(
+            'store_files', 'Number of files of the local feature store'
+        ).set_function(lambda: local_sink.store.n_files)
+
+    taps = {}
+    if config.kafka_broker_address:
+        taps = kafka_taps(
+            config.kafka_broker_address,
+            {
+                'trades': config.kafka_trades_topic,
+                'candles': config.kafka_candles_topic,
+                'technical-indicators': config.kafka_indicators_topic,
+            },
+            config.wire_format,
+        )
+        logger.info(f'Kafka taps: {list(taps)}')
+    if 'technical-indicators' in taps:
+        sinks.append(taps.pop('technical-indicators'))
+
+    if config.metrics_port:
+        start_metrics_server(config.metrics_port)
+
+    main(
+        kraken_api=kraken_api,
+        pipeline=FusedPipeline(
+            candle_seconds=config.candle_seconds,
+            max_candles_in_state=config.max_candles_in_state,
+            emit_incomplete_candles=config.emit_incomplete_candles,
+            incomplete_candles_interval_ms=config.incomplete_candles_interval_ms,
+            rollup_candle_seconds=config.rollup_candle_seconds,
+            indicator_candle_seconds=config.indicator_candle_seconds,
+            max_candles_in_state_by_timeframe=config.max_candles_in_state_by_timeframe,
+            incremental=config.incremental_indicators,
+            plan=indicator_registry.IndicatorPlan.from_file(config.indicators_file)
+            if config.indicators_file
+            else indicator_registry.default_plan(),
+            debounce_interval_ms=config.debounce_interval_ms,
+            sinks=sinks,
+            taps=taps,
+        ),
+    )
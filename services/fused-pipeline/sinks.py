@@ -0,0 +1,121 @@
+import time
+from typing import Any, Dict, List, Optional
+
+from common.instrumentation import StageMetrics
+from loguru import logger
+from quixstreams.kafka import Producer
+from quixstreams.models import Topic
+from steps import local_store, transform
+
+
+class MemorySink:
+    """
+    Keep the messages in a list, e.g. to run a backtest from Python.
+    """
+
+    def __init__(self):
+        self.messages: List[Dict[str, Any]] = []
+
+    def write(self, messages: List[Dict[str, Any]]) -> None:
+        self.messages.extend(messages)
+
+    def flush(self) -> None:
+        pass
+
+
+class LocalStoreSink:
+    """
+    Write the messages to the local Parquet feature store of the to-feature-store
+    service, in batches collapsed to the last message of each `dedup_keys`, as its
+    sink does.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        event_time_column: str,
+        dedup_keys: Optional[List[str]] = None,
+        batch_size: int = 10_000,
+        flush_interval_seconds: float = 5.0,
+        compaction_min_files: int = 10,
+        compaction_interval_seconds: float = 60.0,
+    ):
+        """
+        Args:
+            path (str): The root directory of the store.
+            event_time_column (str): The column with the event time, in milliseconds since the epoch.
+            dedup_keys (Optional[List[str]]): Collapse each batch to the last message of these columns, no collapsing if empty.
+            batch_size (int): Insert a batch every this many messages.
+            flush_interval_seconds (float): Or when the first message of the batch is this old.
+            compaction_min_files (int): The number of files from which a partition is compacted.
+            compaction_interval_seconds (float): How often to compact the partitions, in a background thread.
+        """
+        self.dedup_keys = dedup_keys or []
+        self.store = local_store.ParquetFeatureStore(
+            path,
+            event_time_column,
+            dedup_keys=self.dedup_keys,
+            compaction_min_files=compaction_min_files,
+        )
+        self.store.start_compaction(compaction_interval_seconds)
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.stage_metrics = StageMetrics('to-feature-store')
+
+        self._batch: List[Dict[str, Any]] = []
+        self._batch_start = time.monotonic()
+        # Counters of the messages received, and of the rows inserted after collapsing
+        self.received = 0
+        self.inserted = 0
+
+    def write(self, messages: List[Dict[str, Any]]) -> None:
+        if not self._batch:
+            self._batch_start = time.monotonic()
+        self._batch.extend(messages)
+        if (
+            len(self._batch) >= self.batch_size
+            or time.monotonic() - self._batch_start >= self.flush_interval_seconds
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._batch:
+            return
+        values, self._batch = self._batch, []
+        start = time.perf_counter()
+        latest = transform.latest_by_key(values, self.dedup_keys)
+        self.store.insert(transform.to_dataframe(latest))
+        self.stage_metrics.batch(len(values), len(latest), time.perf_counter() - start)
+        self.received += len(values)
+        self.inserted += len(latest)
+        logger.debug(f'Inserted {len(latest)} rows from {len(values)} messages')
+
+
+class KafkaSink:
+    """
+    Produce the messages to a Kafka topic, keyed by pair like the topics of the
+    services, so the consumers of the distributed pipeline can read them.
+    """
+
+    def __init__(self, producer: Producer, topic: Topic):
+        self.producer = producer
+        self.topic = topic
+
+    def write(self, messages: List[Dict[str, Any]]) -> None:
+        for message in messages:
+            serialized = self.topic.serialize(key=message['pair'], value=message)
+            while True:
+                try:
+                    self.producer.produce(
+                        topic=self.topic.name,
+                        key=serialized.key,
+                        value=serialized.value,
+                        buffer_error_max_tries=0,
+                    )
+                    break
+                except BufferError:
+                    # The local queue is full, wait for deliveries to free it up
+                    self.producer.poll(timeout=1.0)
+
+    def flush(self) -> None:
+        self.producer.flush()
@@ -0,0 +1,58 @@
+"""
+The code of the other services run by the fused pipeline, loaded from their
+directories so both pipelines run the same steps:
+- trades: the Kraken APIs (`kraken_api`)
+- candles: the reducers of the tumbling windows, the coalescer and the rollups
+- technical-indicators: the indicators of each timeframe and the debouncer
+- to-feature-store: the local Parquet store and the transform of its batches
+
+The directories are added after this one to `sys.path`. The metrics, the wire format
+and the latency tracing are in the `common` package, installed in every service.
+"""
+
+import importlib
+import importlib.util
+import sys
+from pathlib import Path
+from types import ModuleType
+
+SERVICES_DIR = Path(__file__).resolve().parent.parent
+SERVICES = ('trades', 'candles', 'technical-indicators', 'to-feature-store')
+
+
+def load_module(name: str, path: Path) -> ModuleType:
+    """
+    Load a module of another service under a new name, e.g. its run.py.
+    """
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+for service in SERVICES:
+    if str(SERVICES_DIR / service) not in sys.path:
+        sys.path.append(str(SERVICES_DIR / service))
+
+# The candles service, its run.py has the same name as ours
+candles_run = load_module('candles_run', SERVICES_DIR / 'candles' / 'run.py')
+coalesce = importlib.import_module('coalesce')
+rollup = importlib.import_module('rollup')
+
+# The technical-indicators service
+candle_buffer = importlib.import_module('candle_buffer')
+debounce = importlib.import_module('debounce')
+incremental_indicators = importlib.import_module('incremental_indicators')
+indicator_registry = importlib.import_module('indicator_registry')
+technical_indicators = importlib.import_module('technical_indicators')
+timeframes = importlib.import_module('timeframes')
+
+# The to-feature-store service
+local_store = importlib.import_module('local_store')
+transform = importlib.import_module('transform')
+
+# The trades service
+kraken_mock = importlib.import_module('kraken_api.mock')
+kraken_replay = importlib.import_module('kraken_api.replay')
+kraken_synthetic = importlib.import_module('kraken_api.synthetic')
+kraken_websocket = importlib.import_module('kraken_api.websocket')
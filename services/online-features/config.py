@@ -0,0 +1,18 @@
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Config(BaseSettings):
+    model_config = SettingsConfigDict(env_file='.env', env_file_encoding='utf-8')
+    kafka_broker_address: str
+    kafka_input_topic: str
+    kafka_consumer_group: str
+    host: str = '0.0.0.0'
+    port: int = 8000
+    # The number of previous windows to keep per pair and candle seconds
+    history_size: int = 0
+    max_batch_keys: int = 1000
+    # How far back to replay the topic into the cache on start, 0 for the whole topic
+    replay_seconds: int = 0
+
+
+config = Config()
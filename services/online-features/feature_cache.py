@@ -0,0 +1,161 @@
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Fields of the technical-indicators messages that are not features
+KEY_FIELDS = ('pair', 'candle_seconds')
+TIME_FIELD = 'timestamp_ms'
+WINDOW_FIELD = 'window_start_ms'
+WINDOW_END_FIELD = 'window_end_ms'
+
+
+class FeatureCache:
+    """
+    The latest indicator vector of each `(pair, candle_seconds)`, in a 2-D float array
+    with a row per key, plus the final vectors of its last `history_size` windows in a
+    3-D ring buffer.
+
+    The feature names are taken from the first message, and the fields missing from a
+    later message are NaN. A message older than the latest one of its key (e.g. from a
+    replayed partition) is ignored.
+
+    The messages are written from the consumer thread and read from the server, under
+    a lock held only while copying a row.
+    """
+
+    def __init__(self, history_size: int = 0, capacity: int = 1024):
+        """
+        Args:
+            history_size (int): The number of previous windows to keep per key.
+            capacity (int): The initial number of keys, the arrays grow as needed.
+        """
+        self.history_size = history_size
+        self.names: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._rows: Dict[Tuple[str, int], int] = {}
+        self._lock = threading.Lock()
+
+        self._capacity = capacity
+        self._values = np.empty((0, 0))
+        self._times = np.zeros(capacity, dtype=np.int64)
+        self._windows = np.zeros(capacity, dtype=np.int64)
+        self._history = np.empty((0, 0, 0))
+        self._history_times = np.zeros((capacity, history_size), dtype=np.int64)
+        self._history_counts = np.zeros(capacity, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def update(self, message: Dict[str, Any]) -> bool:
+        """
+        Store a technical-indicators message as the latest vector of its key.
+
+        Returns:
+            bool: Whether the message was newer than the latest one of its key.
+        """
+        if not self.names:
+            self._init_names(message)
+
+        vector = np.full(len(self.names), np.nan)
+        positions = self._positions
+        for name, value in message.items():
+            position = positions.get(name)
+            if position is not None and value is not None:
+                vector[position] = value
+
+        key = (message['pair'], message['candle_seconds'])
+        timestamp_ms = message[TIME_FIELD]
+        window_start_ms = message.get(WINDOW_FIELD, 0)
+
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                row = self._add_row(key)
+            elif timestamp_ms < self._times[row]:
+                return False
+            elif self.history_size and window_start_ms > self._windows[row]:
+                # The latest vector is the final one of the previous window
+                self._push_history(row)
+
+            self._values[row] = vector
+            self._times[row] = timestamp_ms
+            self._windows[row] = window_start_ms
+        return True
+
+    def get(
+        self, pair: str, candle_seconds: int, history: int = 0
+    ) -> Optional[Dict[str, Any]]:
+        """
+        The latest vector of a key, with the final vectors of up to `history` previous
+        windows (most recent first), or None if the key has no messages yet.
+        """
+        with self._lock:
+            row = self._rows.get((pair, candle_seconds))
+            if row is None:
+                return None
+            values = self._values[row].tolist()
+            timestamp_ms = int(self._times[row])
+            if history and self.history_size:
+                n = min(history, int(self._history_counts[row]), self.history_size)
+                # The ring buffer position of the most recent window, then backwards
+                last = (int(self._history_counts[row]) - 1) % self.history_size
+                slots = [(last - i) % self.history_size for i in range(n)]
+                past_values = self._history[row, slots].tolist()
+                past_times = self._history_times[row, slots].tolist()
+            else:
+                past_values, past_times = [], []
+
+        result = {
+            'pair': pair,
+            'candle_seconds': candle_seconds,
+            'timestamp_ms': timestamp_ms,
+            'values': values,
+        }
+        if history:
+            result['history'] = [
+                {'timestamp_ms': t, 'values': v}
+                for t, v in zip(past_times, past_values, strict=True)
+            ]
+        return result
+
+    def _init_names(self, message: Dict[str, Any]) -> None:
+        excluded = {*KEY_FIELDS, TIME_FIELD, WINDOW_FIELD, WINDOW_END_FIELD}
+        self.names = [
+            name
+            for name, value in message.items()
+            if name not in excluded and (value is None or type(value) in (int, float))
+        ]
+        self._positions = {name: i for i, name in enumerate(self.names)}
+        self._values = np.full((self._capacity, len(self.names)), np.nan)
+        self._history = np.full(
+            (self._capacity, self.history_size, len(self.names)), np.nan
+        )
+
+    def _add_row(self, key: Tuple[str, int]) -> int:
+        row = len(self._rows)
+        if row == self._capacity:
+            self._grow()
+        self._rows[key] = row
+        return row
+
+    def _grow(self) -> None:
+        self._capacity *= 2
+        self._values = _resize(self._values, self._capacity, np.nan)
+        self._times = _resize(self._times, self._capacity, 0)
+        self._windows = _resize(self._windows, self._capacity, 0)
+        self._history = _resize(self._history, self._capacity, np.nan)
+        self._history_times = _resize(self._history_times, self._capacity, 0)
+        self._history_counts = _resize(self._history_counts, self._capacity, 0)
+
+    def _push_history(self, row: int) -> None:
+        slot = int(self._history_counts[row]) % self.history_size
+        self._history[row, slot] = self._values[row]
+        self._history_times[row, slot] = self._times[row]
+        self._history_counts[row] += 1
+
+
+def _resize(array: np.ndarray, rows: int, fill: Any) -> np.ndarray:
+    resized = np.full((rows, *array.shape[1:]), fill, dtype=array.dtype)
+    resized[: len(array)] = array
+    return resized
@@ -0,0 +1,153 @@
+"""
+Load test of the online features endpoint, with keep-alive connections.
+
+It sends `--requests` lookups of random pairs over `--connections` concurrent
+connections, each waiting for a response before sending the next request, and
+reports the latency percentiles and requests/sec. With `--batch`, every request is a
+batch lookup of that many pairs.
+
+With `--self-hosted`, it first starts the server in another process, with a cache
+filled with synthetic indicators of `--pairs` pairs, so no Kafka is needed.
+
+Usage:
+    python load_test.py --self-hosted --pairs 500 --requests 50000 --connections 8
+    python load_test.py --host localhost --port 8000 --pair BTC/USD --pair ETH/USD
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import random
+import time
+from typing import List
+from urllib.parse import urlencode
+
+import numpy as np
+
+
+def serve_synthetic(
+    host: str, port: int, n_pairs: int, n_features: int, history_size: int
+):
+    """
+    Serve a cache filled with random indicators of `n_pairs` pairs.
+    """
+    from feature_cache import FeatureCache
+    from server import FeatureServer
+
+    cache = FeatureCache(history_size=history_size)
+    rng = np.random.default_rng(42)
+    for window in range(history_size + 1):
+        for pair in range(n_pairs):
+            cache.update(
+                {
+                    'pair': f'PAIR{pair}/USD',
+                    'candle_seconds': 60,
+                    'timestamp_ms': 1_700_000_000_000 + window * 60_000,
+                    'window_start_ms': 1_700_000_000_000 + window * 60_000,
+                    **{
+                        f'feature_{i}': float(x)
+                        for i, x in enumerate(rng.random(n_features))
+                    },
+                }
+            )
+    asyncio.run(FeatureServer(cache).serve(host, port))
+
+
+async def wait_for_server(host: str, port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def run_connection(
+    host: str,
+    port: int,
+    targets: List[str],
+    n_requests: int,
+    latencies: List[float],
+) -> None:
+    """
+    Send requests one after the other on a keep-alive connection.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    for _ in range(n_requests):
+        request = f'GET {random.choice(targets)} HTTP/1.1\r\nHost: {host}\r\n\r\n'
+        start = time.perf_counter()
+        writer.write(request.encode())
+        head = await reader.readuntil(b'\r\n\r\n')
+        length = int(head.split(b'Content-Length: ')[1].split(b'\r\n')[0])
+        body = await reader.readexactly(length)
+        latencies.append(time.perf_counter() - start)
+        if not head.startswith(b'HTTP/1.1 200'):
+            raise RuntimeError(f'{head.splitlines()[0]}: {body[:200]}')
+    writer.close()
+
+
+async def load_test(
+    host: str, port: int, targets: List[str], n_requests: int, n_connections: int
+) -> None:
+    latencies: List[float] = []
+    per_connection = n_requests // n_connections
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[
+            run_connection(host, port, targets, per_connection, latencies)
+            for _ in range(n_connections)
+        ]
+    )
+    elapsed = time.perf_counter() - start
+
+    p50, p99, p999 = np.percentile(np.array(latencies) * 1e6, [50, 99, 99.9])
+    print(
+        f'{len(latencies)} requests in {elapsed:.1f}s ({len(latencies) / elapsed:,.0f} req/s), '
+        f'latency p50={p50:.0f}us p99={p99:.0f}us p99.9={p999:.0f}us'
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--self-hosted', action='store_true')
+    parser.add_argument('--pairs', type=int, default=500)
+    parser.add_argument('--features', type=int, default=40)
+    parser.add_argument('--pair', action='append', help='The pairs to look up')
+    parser.add_argument('--candle-seconds', type=int, default=60)
+    parser.add_argument('--batch', type=int, default=1)
+    parser.add_argument('--history', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=20_000)
+    parser.add_argument('--connections', type=int, default=4)
+    args = parser.parse_args()
+
+    if args.self_hosted:
+        server = multiprocessing.Process(
+            target=serve_synthetic,
+            args=(args.host, args.port, args.pairs, args.features, args.history),
+            daemon=True,
+        )
+        server.start()
+        asyncio.run(wait_for_server(args.host, args.port))
+
+    pairs = args.pair or [f'PAIR{i}/USD' for i in range(args.pairs)]
+    targets = [
+        '/features?'
+        + urlencode(
+            {
+                'pair': random.sample(pairs, min(args.batch, len(pairs))),
+                'candle_seconds': args.candle_seconds,
+                'history': args.history,
+            },
+            doseq=True,
+        )
+        for _ in range(1000)
+    ]
+    asyncio.run(
+        load_test(args.host, args.port, targets, args.requests, args.connections)
+    )
@@ -0,0 +1,199 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from common.instrumentation import REGISTRY, StageMetrics, consumer_stats_config
+from common.wire_format import decode
+from confluent_kafka import OFFSET_BEGINNING, KafkaException, TopicPartition
+from feature_cache import FeatureCache
+from loguru import logger
+from quixstreams import Application
+from quixstreams.kafka import Consumer
+from server import FeatureServer
+
+
+def replay_offsets(
+    consumer: Consumer, topic_name: str, replay_seconds: int, timeout: float = 30.0
+) -> Tuple[List[TopicPartition], Dict[int, int]]:
+    """
+    The offsets to replay every partition of the topic from, and the offset of the last
+    message of each partition that has messages to replay.
+
+    Args:
+        consumer (Consumer): The consumer to read the metadata with.
+        topic_name (str): The topic to replay.
+        replay_seconds (int): How far back to replay, or 0 for the whole topic.
+        timeout (float): The timeout of each request to the broker.
+
+    Returns:
+        Tuple[List[TopicPartition], Dict[int, int]]: The partitions with their start
+            offsets, and the end offset of each partition to catch up with.
+    """
+    metadata = consumer.list_topics(topic_name, timeout=timeout).topics[topic_name]
+    if metadata.error is not None:
+        raise KafkaException(metadata.error)
+
+    partitions = sorted(metadata.partitions)
+    starts = [
+        TopicPartition(topic_name, partition, OFFSET_BEGINNING)
+        for partition in partitions
+    ]
+    if replay_seconds:
+        since_ms = int(time.time() * 1000) - replay_seconds * 1000
+        starts = consumer.offsets_for_times(
+            [
+                TopicPartition(topic_name, partition, since_ms)
+                for partition in partitions
+            ],
+            timeout=timeout,
+        )
+
+    ends: Dict[int, int] = {}
+    for start in starts:
+        low, high = consumer.get_watermark_offsets(
+            TopicPartition(topic_name, start.partition), timeout=timeout
+        )
+        if start.offset < 0:
+            # From the beginning, or from the end if no message is recent enough
+            start.offset = low if start.offset == OFFSET_BEGINNING else high
+        if high > start.offset:
+            ends[start.partition] = high - 1
+    return starts, ends
+
+
+def consume(
+    app: Application,
+    topic_name: str,
+    cache: FeatureCache,
+    ready: threading.Event,
+    replay_seconds: int = 0,
+):
+    """
+    Store every message of the technical-indicators topic in the cache.
+
+    The cache only lives in memory, so it is rebuilt on every start: all the partitions
+    are assigned to this replica, without a consumer group rebalance or commits, and
+    replayed from `replay_seconds` ago. `ready` is set once every partition has been
+    read up to the offset of its last message at the start.
+
+    If the consumer fails, the whole process exits, instead of serving features that
+    are no longer updated.
+    """
+    stage_metrics = StageMetrics('online-features')
+    try:
+        with app.get_consumer(auto_commit_enable=False) as consumer:
+            starts, ends = replay_offsets(consumer, topic_name, replay_seconds)
+            consumer.assign(starts)
+            logger.info(f'Replaying {topic_name} up to the offsets {ends}')
+            if not ends:
+                ready.set()
+
+            while True:
+                # After the message of the previous poll is in the cache
+                if ends:
+                    _drop_caught_up(consumer, topic_name, ends)
+                    if not ends:
+                        logger.info(f'Caught up with {topic_name}, {len(cache)} keys')
+                        ready.set()
+
+                msg = consumer.poll(timeout=1.0)
+                if msg is None:
+                    continue
+                if msg.error():
+                    logger.error(f'Kafka error: {msg.error()}')
+                    continue
+                stage_metrics.message_in()
+                cache.update(decode(msg.value()))
+                stage_metrics.message_out()
+    except Exception:
+        logger.exception('The consumer failed')
+        os._exit(1)
+
+
+def _drop_caught_up(consumer: Consumer, topic_name: str, ends: Dict[int, int]) -> None:
+    # The position is the offset of the next message to read, past the transaction
+    # markers and the compacted messages
+    positions = consumer.position(
+        [TopicPartition(topic_name, partition) for partition in ends]
+    )
+    for position in positions:
+        if position.offset > ends[position.partition]:
+            del ends[position.partition]
+
+
+def main(
+    kafka_broker_address: str,
+    kafka_input_topic: str,
+    kafka_consumer_group: str,
+    host: str,
+    port: int,
+    history_size: int = 0,
+    max_batch_keys: int = 1000,
+    replay_seconds: int = 0,
+):
+    """
+    2 things:
+    1. Consume the technical indicators from the Kafka input topic into an in-memory cache
+    2. Serve the latest indicators of each pair over HTTP
+
+    Args:
+        kafka_broker_address (str): The address of the Kafka broker
+        kafka_input_topic (str): The topic to consume the technical indicators from
+        kafka_consumer_group (str): The consumer group of the consumer, which commits no offsets since every replica reads all the partitions
+        host (str): The host to serve on
+        port (int): The port to serve on
+        history_size (int): The number of previous windows to keep per pair and candle seconds
+        max_batch_keys (int): The maximum number of keys per batch lookup
+        replay_seconds (int): How far back to replay the topic on start, 0 for the whole topic
+    Returns:
+        None
+    """
+    logger.info('Starting the online-features service')
+    logger.info(f'Kafka broker address: {kafka_broker_address}')
+    logger.info(f'Kafka input topic: {kafka_input_topic}')
+    logger.info(f'Kafka consumer group: {kafka_consumer_group}')
+    logger.info(f'History size: {history_size}')
+    logger.info(f'Replay seconds: {replay_seconds}')
+
+    cache = FeatureCache(history_size=history_size)
+
+    app = Application(
+        broker_address=kafka_broker_address,
+        consumer_group=kafka_consumer_group,
+        # For the offsets of the replay that are no longer in the topic
+        auto_offset_reset='earliest',
+        # Report the consumer lag to the metrics
+        consumer_extra_config=consumer_stats_config(),
+    )
+    REGISTRY.gauge(
+        'cache_keys', 'Number of pairs and candle seconds in the cache'
+    ).set_function(lambda: len(cache))
+
+    # The consumer runs in a thread, and the server in the event loop of the main one
+    ready = threading.Event()
+    threading.Thread(
+        target=consume,
+        args=(app, kafka_input_topic, cache, ready, replay_seconds),
+        name='online-features-consumer',
+        daemon=True,
+    ).start()
+
+    server = FeatureServer(cache, max_batch_keys=max_batch_keys, ready=ready)
+    asyncio.run(server.serve(host, port))
+
+
+if __name__ == '__main__':
+    from config import config
+
+    main(
+        kafka_broker_address=config.kafka_broker_address,
+        kafka_input_topic=config.kafka_input_topic,
+        kafka_consumer_group=config.kafka_consumer_group,
+        host=config.host,
+        port=config.port,
+        history_size=config.history_size,
+        max_batch_keys=config.max_batch_keys,
+        replay_seconds=config.replay_seconds,
+    )
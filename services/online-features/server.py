@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from common.instrumentation import CONTENT_TYPE, REGISTRY
+from feature_cache import FeatureCache
+from loguru import logger
+from quixstreams.utils.json import dumps as json_dumps
+
+# The longest request line and headers we accept, the requests have no body
+MAX_REQUEST_BYTES = 16_384
+
+JSON_CONTENT_TYPE = b'application/json'
+METRICS_CONTENT_TYPE = CONTENT_TYPE.encode()
+
+REQUESTS = REGISTRY.counter('requests_total', 'HTTP requests', ['path', 'status'])
+REQUEST_SECONDS = REGISTRY.histogram(
+    'request_seconds', 'Time to answer the HTTP requests', ['path']
+)
+PATHS = ('/features', '/health', '/metrics')
+
+
+class FeatureServer:
+    """
+    A minimal HTTP/1.1 server with keep-alive, answering from the feature cache in the
+    event loop, without any framework in between:
+
+    - GET /features?pair=BTC/USD&candle_seconds=60[&history=10]
+    - GET /features?pair=BTC/USD&pair=ETH/USD&candle_seconds=60, the batch lookup,
+      also with `key=BTC/USD:60` for keys of different timeframes
+    - GET /health, 503 until the cache has caught up with the topic
+    - GET /metrics, the Prometheus metrics of the service
+    """
+
+    def __init__(
+        self,
+        cache: FeatureCache,
+        max_batch_keys: int = 1000,
+        ready: Optional[threading.Event] = None,
+    ):
+        """
+        Args:
+            cache (FeatureCache): The cache to answer from.
+            max_batch_keys (int): The maximum number of keys per batch lookup.
+            ready (Optional[threading.Event]): Set once the cache has caught up with
+                the topic, or None if it is always ready.
+        """
+        self.cache = cache
+        self.max_batch_keys = max_batch_keys
+        self.ready = ready
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(
+            self._handle_connection, host, port, limit=MAX_REQUEST_BYTES
+        )
+        logger.info(f'Serving the features on http://{host}:{port}')
+        async with server:
+            await server.serve_forever()
+
+    def handle(self, target: str) -> Tuple[int, bytes]:
+        """
+        Answer a GET request.
+
+        Returns:
+            Tuple[int, bytes]: The status code and the JSON body.
+        """
+        url = urlsplit(target)
+        if url.path == '/health':
+            if self.ready is not None and not self.ready.is_set():
+                return 503, json_dumps({'status': 'starting', 'keys': len(self.cache)})
+            return 200, json_dumps({'status': 'ok', 'keys': len(self.cache)})
+        if url.path != '/features':
+            return 404, json_dumps({'error': f'Unknown path {url.path}'})
+
+        try:
+            keys, history = self._parse_query(url.query)
+        except ValueError as err:
+            return 400, json_dumps({'error': str(err)})
+
+        names = self.cache.names
+        if len(keys) == 1:
+            features = self.cache.get(*keys[0], history=history)
+            if features is None:
+                return 404, json_dumps({'error': f'No features for {keys[0]}'})
+            return 200, json_dumps({'names': names, **features})
+
+        # Batch lookup, with null for the keys without features
+        return 200, json_dumps(
+            {
+                'names': names,
+                'features': [
+                    self.cache.get(pair, candle_seconds, history=history)
+                    for pair, candle_seconds in keys
+                ],
+            }
+        )
+
+    def _parse_query(self, query: str) -> Tuple[List[Tuple[str, int]], int]:
+        params: Dict[str, List[str]] = parse_qs(query)
+        history = int(params.get('history', ['0'])[0])
+
+        keys = []
+        for key in params.get('key', []):
+            pair, _, candle_seconds = key.rpartition(':')
+            keys.append((pair, int(candle_seconds)))
+        if 'pair' in params:
+            if 'candle_seconds' not in params:
+                raise ValueError('candle_seconds is required with pair')
+            candle_seconds = int(params['candle_seconds'][0])
+            keys.extend((pair, candle_seconds) for pair in params['pair'])
+
+        if not keys:
+            raise ValueError('No pair or key given')
+        if len(keys) > self.max_batch_keys:
+            raise ValueError(f'At most {self.max_batch_keys} keys per request')
+        return keys, history
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+
+                start = time.perf_counter()
+                request_line, _, headers = head.decode('latin1').partition('\r\n')
+                method, target, version = request_line.split(' ', 2)
+                path = target.partition('?')[0]
+                content_type = JSON_CONTENT_TYPE
+                if method != 'GET':
+                    status, body = 405, json_dumps({'error': 'Only GET is supported'})
+                elif path == '/metrics':
+                    status, body = 200, REGISTRY.render().encode()
+                    content_type = METRICS_CONTENT_TYPE
+                else:
+                    status, body = self.handle(target)
+
+                keep_alive = (
+                    version == 'HTTP/1.1' and 'connection: close' not in headers.lower()
+                )
+                writer.write(
+                    b'HTTP/1.1 %d %s\r\n'
+                    b'Content-Type: %s\r\n'
+                    b'Content-Length: %d\r\n'
+                    b'Connection: %s\r\n\r\n'
+                    % (
+                        status,
+                        _REASONS.get(status, b'Error'),
+                        content_type,
+                        len(body),
+                        b'keep-alive' if keep_alive else b'close',
+                    )
+                    + body
+                )
+                # Only the known paths, so a scan does not add a label per URL
+                path = path if path in PATHS else 'other'
+                REQUESTS.labels(path, status).inc()
+                REQUEST_SECONDS.labels(path).observe(time.perf_counter() - start)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError) as err:
+            logger.debug(f'Connection closed: {err!r}')
+        finally:
+            writer.close()
+
+
+_REASONS = {
+    200: b'OK',
+    400: b'Bad Request',
+    404: b'Not Found',
+    405: b'Method Not Allowed',
+    503: b'Service Unavailable',
+}
@@ -0,0 +1,91 @@
+"""
+The latest vectors and the ring buffer of the previous windows of the feature cache.
+"""
+
+import math
+
+from feature_cache import FeatureCache
+
+START_MS = 1_700_000_000_000
+WINDOW_MS = 60_000
+
+
+def message(pair: str, window: int, update: int, **features) -> dict:
+    return {
+        'pair': pair,
+        'candle_seconds': 60,
+        'timestamp_ms': START_MS + window * WINDOW_MS + update * 1_000,
+        'window_start_ms': START_MS + window * WINDOW_MS,
+        'window_end_ms': START_MS + (window + 1) * WINDOW_MS,
+        'rsi': float(window * 10 + update),
+        'macd': -float(window),
+        **features,
+    }
+
+
+def test_latest_vector():
+    cache = FeatureCache()
+    cache.update(message('BTC/USD', 0, 0))
+    cache.update(message('BTC/USD', 0, 1))
+
+    assert cache.names == ['rsi', 'macd']
+    assert cache.get('BTC/USD', 60) == {
+        'pair': 'BTC/USD',
+        'candle_seconds': 60,
+        'timestamp_ms': START_MS + 1_000,
+        'values': [1.0, -0.0],
+    }
+    assert cache.get('BTC/USD', 300) is None
+    assert cache.get('ETH/USD', 60) is None
+
+
+def test_older_messages_are_ignored():
+    cache = FeatureCache()
+    assert cache.update(message('BTC/USD', 1, 0))
+    # E.g. from a replayed partition
+    assert not cache.update(message('BTC/USD', 0, 5))
+
+    assert cache.get('BTC/USD', 60)['values'] == [10.0, -1.0]
+
+
+def test_ring_buffer_of_the_previous_windows():
+    cache = FeatureCache(history_size=3)
+    for window in range(6):
+        for update in range(3):
+            cache.update(message('BTC/USD', window, update))
+
+    features = cache.get('BTC/USD', 60, history=10)
+
+    assert features['values'] == [52.0, -5.0]
+    # The final vectors of the last 3 windows before the current one, most recent first
+    assert features['history'] == [
+        {
+            'timestamp_ms': START_MS + window * WINDOW_MS + 2_000,
+            'values': [window * 10 + 2.0, -window],
+        }
+        for window in (4, 3, 2)
+    ]
+    assert len(cache.get('BTC/USD', 60, history=2)['history']) == 2
+    assert 'history' not in cache.get('BTC/USD', 60)
+
+
+def test_history_of_a_new_key():
+    cache = FeatureCache(history_size=3)
+    cache.update(message('BTC/USD', 0, 0))
+    cache.update(message('BTC/USD', 1, 0))
+
+    history = cache.get('BTC/USD', 60, history=3)['history']
+    assert [past['values'] for past in history] == [[0.0, -0.0]]
+
+
+def test_grows_and_fills_missing_features():
+    cache = FeatureCache(history_size=2, capacity=2)
+    for i in range(5):
+        cache.update(message(f'PAIR{i}/USD', 0, 0))
+    # A message without a feature of the first one, and with a new one
+    cache.update({**message('PAIR5/USD', 0, 0, adx=1.0), 'macd': None})
+
+    assert len(cache) == 6
+    assert cache.get('PAIR4/USD', 60)['values'] == [0.0, -0.0]
+    rsi, macd = cache.get('PAIR5/USD', 60)['values']
+    assert rsi == 0.0 and math.isnan(macd)
@@ -0,0 +1,78 @@
+"""
+The offsets the cache is rebuilt from on start, and when it has caught up.
+"""
+
+from types import SimpleNamespace
+
+from confluent_kafka import OFFSET_END, TopicPartition
+from run import _drop_caught_up, replay_offsets
+
+TOPIC = 'technical-indicators'
+
+
+class FakeConsumer:
+    """
+    A topic with 3 partitions: empty, with the offsets [2, 10), and [0, 3).
+    """
+
+    watermarks = {0: (0, 0), 1: (2, 10), 2: (0, 3)}
+
+    def __init__(self):
+        self.positions = {}
+
+    def list_topics(self, topic, timeout):
+        metadata = SimpleNamespace(
+            error=None, partitions=dict.fromkeys(self.watermarks)
+        )
+        return SimpleNamespace(topics={topic: metadata})
+
+    def get_watermark_offsets(self, partition, timeout):
+        return self.watermarks[partition.partition]
+
+    def offsets_for_times(self, partitions, timeout):
+        # Only partition 1 has messages that recent, from offset 7
+        offsets = {0: OFFSET_END, 1: 7, 2: OFFSET_END}
+        return [
+            TopicPartition(p.topic, p.partition, offsets[p.partition])
+            for p in partitions
+        ]
+
+    def position(self, partitions):
+        return [
+            TopicPartition(p.topic, p.partition, self.positions.get(p.partition, -1001))
+            for p in partitions
+        ]
+
+
+def test_replay_the_whole_topic():
+    starts, ends = replay_offsets(FakeConsumer(), TOPIC, replay_seconds=0)
+
+    assert [(p.partition, p.offset) for p in starts] == [(0, 0), (1, 2), (2, 0)]
+    # The last offset of each partition with messages
+    assert ends == {1: 9, 2: 2}
+
+
+def test_replay_the_last_seconds():
+    starts, ends = replay_offsets(FakeConsumer(), TOPIC, replay_seconds=3600)
+
+    # From the end of the partitions without messages that recent
+    assert [(p.partition, p.offset) for p in starts] == [(0, 0), (1, 7), (2, 3)]
+    assert ends == {1: 9}
+
+
+def test_caught_up_once_past_the_last_offsets():
+    consumer = FakeConsumer()
+    ends = {1: 9, 2: 2}
+
+    # Before the first message
+    _drop_caught_up(consumer, TOPIC, ends)
+    assert ends == {1: 9, 2: 2}
+
+    consumer.positions = {1: 9, 2: 3}
+    _drop_caught_up(consumer, TOPIC, ends)
+    assert ends == {1: 9}
+
+    # Past a transaction marker at the last offset
+    consumer.positions = {1: 11, 2: 3}
+    _drop_caught_up(consumer, TOPIC, ends)
+    assert ends == {}
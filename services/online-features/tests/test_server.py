@@ -0,0 +1,138 @@
+"""
+The requests of the feature server, its readiness, and its keep-alive connections.
+"""
+
+import asyncio
+import json
+import threading
+
+import pytest
+from feature_cache import FeatureCache
+from server import FeatureServer
+
+
+@pytest.fixture
+def cache() -> FeatureCache:
+    cache = FeatureCache(history_size=2)
+    for window in range(3):
+        for pair in ('BTC/USD', 'ETH/USD'):
+            for candle_seconds in (60, 300):
+                cache.update(
+                    {
+                        'pair': pair,
+                        'candle_seconds': candle_seconds,
+                        'timestamp_ms': 1_700_000_000_000 + window * 60_000,
+                        'window_start_ms': 1_700_000_000_000 + window * 60_000,
+                        'rsi': float(window),
+                    }
+                )
+    return cache
+
+
+def get(server: FeatureServer, target: str):
+    status, body = server.handle(target)
+    return status, json.loads(body)
+
+
+def test_single_lookup(cache):
+    server = FeatureServer(cache)
+
+    status, body = get(server, '/features?pair=BTC/USD&candle_seconds=60&history=5')
+
+    assert status == 200
+    assert body['names'] == ['rsi']
+    assert body['pair'] == 'BTC/USD' and body['candle_seconds'] == 60
+    assert body['values'] == [2.0]
+    assert [past['values'] for past in body['history']] == [[1.0], [0.0]]
+
+
+def test_batch_lookups(cache):
+    server = FeatureServer(cache)
+
+    status, body = get(
+        server, '/features?pair=BTC%2FUSD&pair=XRP/USD&pair=ETH/USD&candle_seconds=300'
+    )
+    assert status == 200
+    btc, xrp, eth = body['features']
+    assert (btc['pair'], btc['candle_seconds']) == ('BTC/USD', 300)
+    assert xrp is None
+    assert eth['pair'] == 'ETH/USD'
+
+    # Keys of different timeframes, with a pair containing the separator
+    status, body = get(server, '/features?key=BTC/USD:60&key=ETH/USD:300&key=A:B:60')
+    assert status == 200
+    assert [
+        (features['pair'], features['candle_seconds'])
+        for features in body['features'][:2]
+    ] == [('BTC/USD', 60), ('ETH/USD', 300)]
+    assert body['features'][2] is None
+
+
+@pytest.mark.parametrize(
+    'target, status',
+    [
+        ('/features', 400),
+        ('/features?pair=BTC/USD', 400),
+        ('/features?pair=BTC/USD&candle_seconds=sixty', 400),
+        ('/features?key=BTC/USD', 400),
+        ('/features?pair=BTC/USD&candle_seconds=60&history=x', 400),
+        ('/features?' + '&'.join(f'key=P{i}:60' for i in range(3)), 400),
+        ('/features?pair=XRP/USD&candle_seconds=60', 404),
+        ('/other', 404),
+    ],
+)
+def test_bad_requests(cache, target, status):
+    server = FeatureServer(cache, max_batch_keys=2)
+
+    assert get(server, target)[0] == status
+
+
+def test_not_ready_until_caught_up(cache):
+    ready = threading.Event()
+    server = FeatureServer(cache, ready=ready)
+
+    assert get(server, '/health') == (503, {'status': 'starting', 'keys': 4})
+    # The features can already be looked up
+    assert get(server, '/features?pair=BTC/USD&candle_seconds=60')[0] == 200
+    ready.set()
+    assert get(server, '/health') == (200, {'status': 'ok', 'keys': 4})
+
+    # Always ready without an event
+    assert get(FeatureServer(cache), '/health')[0] == 200
+
+
+async def request(reader, writer, target: str, headers: str = '') -> tuple:
+    writer.write(f'GET {target} HTTP/1.1\r\nHost: test\r\n{headers}\r\n'.encode())
+    await writer.drain()
+    head = (await reader.readuntil(b'\r\n\r\n')).decode()
+    status_line, *header_lines = head.strip().split('\r\n')
+    response_headers = dict(line.lower().split(': ', 1) for line in header_lines)
+    body = await reader.readexactly(int(response_headers['content-length']))
+    return int(status_line.split(' ')[1]), response_headers, body
+
+
+def test_keep_alive_connection(cache):
+    server = FeatureServer(cache)
+
+    async def run():
+        tcp_server = await asyncio.start_server(
+            server._handle_connection, '127.0.0.1', 0
+        )
+        port = tcp_server.sockets[0].getsockname()[1]
+        async with tcp_server:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            # Several requests on the same connection
+            first = await request(reader, writer, '/features?key=BTC/USD:60')
+            second = await request(reader, writer, '/metrics')
+            last = await request(reader, writer, '/health', 'Connection: close\r\n')
+            closed = await reader.read()
+            writer.close()
+        return first, second, last, closed
+
+    first, second, last, closed = asyncio.run(run())
+
+    assert first[0] == 200 and first[1]['connection'] == 'keep-alive'
+    assert json.loads(first[2])['values'] == [2.0]
+    assert second[0] == 200 and b'requests_total' in second[2]
+    assert last[0] == 200 and last[1]['connection'] == 'close'
+    assert closed == b''
@@ -0,0 +1,174 @@
+"""
+Offline backfill of candles and technical indicators from historical trades.
+
+It builds the tumbling-window candles of each pair with a vectorized group-by, and
+computes the technical indicators of the registry (`indicators.json`) with the batch
+evaluation of the micro-batches, with the same columns and values as the messages of
+the candles and technical-indicators services.
+
+The trades file (Parquet or CSV) needs the `pair`, `price`, `volume` and
+`timestamp_ms` columns of the trades topic, in the order the trades were received.
+
+Usage:
+    python backfill.py trades.parquet technical_indicators.parquet --candle-seconds 60
+"""
+
+import argparse
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from indicator_registry import DEFAULT_INDICATORS_FILE, IndicatorPlan, default_plan
+from loguru import logger
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Columns of the candles, in the order of the candles service messages
+CANDLE_COLUMNS = [
+    'pair',
+    'timestamp_ms',
+    'open',
+    'high',
+    'low',
+    'close',
+    'volume',
+    'window_start_ms',
+    'window_end_ms',
+    'candle_seconds',
+]
+
+
+def read_table(path: str) -> pd.DataFrame:
+    if path.endswith('.csv'):
+        return pd.read_csv(path)
+    return pd.read_parquet(path)
+
+
+def write_table(df: pd.DataFrame, path: str) -> None:
+    if path.endswith('.csv'):
+        df.to_csv(path, index=False)
+    else:
+        df.to_parquet(path, index=False)
+
+
+def build_candles(trades: pd.DataFrame, candle_seconds: int) -> pd.DataFrame:
+    """
+    Aggregate the trades into the final candle of each tumbling window, as the candles
+    service does.
+
+    Trades are taken in the order of the input. Like the streaming windows, a trade
+    is dropped if a trade of a later window of the same pair came before it.
+
+    Args:
+        trades (pd.DataFrame): The trades, with the columns of the trades topic.
+        candle_seconds (int): The number of seconds per candle.
+
+    Returns:
+        pd.DataFrame: The candles, sorted by pair and window.
+    """
+    window_ms = candle_seconds * 1000
+    trades = trades[['pair', 'price', 'volume', 'timestamp_ms']].reset_index(drop=True)
+    window_start_ms = trades['timestamp_ms'] // window_ms * window_ms
+
+    # Late trades, whose window was already closed by a previous trade
+    latest_window_start_ms = window_start_ms.groupby(trades['pair']).cummax()
+    on_time = (window_start_ms == latest_window_start_ms).to_numpy()
+    if not on_time.all():
+        logger.warning(f'Dropping {(~on_time).sum()} late trades')
+    trades = trades[on_time].assign(window_start_ms=window_start_ms[on_time])
+
+    grouped = trades.groupby(['pair', 'window_start_ms'], sort=True)
+    candles = grouped.agg(
+        open=('price', 'first'),
+        high=('price', 'max'),
+        low=('price', 'min'),
+        close=('price', 'last'),
+        volume=('volume', 'sum'),
+        timestamp_ms=('timestamp_ms', 'last'),
+    ).reset_index()
+    candles['window_end_ms'] = candles['window_start_ms'] + window_ms
+    candles['candle_seconds'] = candle_seconds
+
+    return candles[CANDLE_COLUMNS]
+
+
+def compute_indicators_batch(
+    candles: pd.DataFrame, plan: Optional[IndicatorPlan] = None
+) -> pd.DataFrame:
+    """
+    Compute the technical indicators of all the candles, one pass per pair.
+
+    The values are the ones of `compute_indicators` for each candle, provided the
+    state keeps at least `plan.window` candles (the longest lookback), see
+    `pair_indicators`.
+
+    Args:
+        candles (pd.DataFrame): The candles, sorted by pair and window.
+        plan (Optional[IndicatorPlan]): The indicators to compute, the default ones if None.
+
+    Returns:
+        pd.DataFrame: The candles with the technical indicators.
+    """
+    plan = plan or default_plan()
+    frames = []
+    for _, pair_candles in candles.groupby('pair', sort=False):
+        indicators = pair_indicators(
+            {name: pair_candles[name].to_numpy(np.float64) for name in plan.inputs},
+            plan,
+        )
+        frames.append(pair_candles.assign(**indicators))
+
+    if not frames:
+        return candles.reindex(columns=[*CANDLE_COLUMNS, *plan.names])
+    return pd.concat(frames, ignore_index=True)
+
+
+def pair_indicators(
+    columns: Dict[str, np.ndarray], plan: IndicatorPlan
+) -> Dict[str, np.ndarray]:
+    """
+    Compute the technical indicators of the candles of a single pair, with the same
+    keys and order as `compute_indicators`.
+
+    Each candle is a row of the micro-batches of the streaming service: the window of
+    the `plan.window` candles ending at it, right-aligned, so `plan.evaluate_batch`
+    computes the indicators of all the candles at once, with the NumPy kernels where
+    there are some and `talib.stream` on the window of each candle otherwise.
+
+    Args:
+        columns (Dict[str, np.ndarray]): The candle columns read by the plan, oldest candle first.
+        plan (IndicatorPlan): The indicators to compute.
+
+    Returns:
+        Dict[str, np.ndarray]: The indicators of each candle.
+    """
+    width = plan.window
+    n_candles = len(next(iter(columns.values())))
+    windows = {
+        name: sliding_window_view(
+            np.concatenate([np.full(width - 1, np.nan), values]), width
+        )
+        for name, values in columns.items()
+    }
+    counts = np.minimum(np.arange(1, n_candles + 1), width)
+    return plan.evaluate_batch(windows, counts)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('trades_file')
+    parser.add_argument('output_file')
+    parser.add_argument('--candle-seconds', type=int, default=60)
+    parser.add_argument('--indicators-file', default=str(DEFAULT_INDICATORS_FILE))
+    args = parser.parse_args()
+
+    # Compile the indicators first, so a typo in the file fails before reading trades
+    plan = IndicatorPlan.from_file(args.indicators_file)
+
+    trades = read_table(args.trades_file)
+    logger.info(f'Read {len(trades)} trades from {args.trades_file}')
+
+    candles = build_candles(trades, args.candle_seconds)
+    logger.info(f'Built {len(candles)} candles of {args.candle_seconds} seconds')
+
+    write_table(compute_indicators_batch(candles, plan), args.output_file)
+    logger.info(f'Wrote the technical indicators to {args.output_file}')
@@ -0,0 +1,149 @@
+"""
+Parity check of the offline backfill against the streaming path.
+
+It generates random trades, pushes them one by one through the tumbling-window
+reducers of the candles service and `update_candles` / `compute_indicators`, and
+checks the last message of each window equals the row of the backfill.
+
+Usage:
+    python backfill_parity.py --trades 200000 --pairs 3
+"""
+
+import argparse
+import importlib.util
+import math
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from backfill import build_candles, compute_indicators_batch
+from candle import update_candles
+from candle_buffer import state_dumps, state_loads
+from common.state import MemoryState
+from indicator_registry import IndicatorPlan
+from loguru import logger
+from technical_indicators import compute_indicators
+
+
+def make_trades(n_trades: int, n_pairs: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Random walk trades, with a few out-of-order ones.
+    """
+    rng = np.random.default_rng(seed)
+    pairs = rng.choice([f'PAIR{i}/USD' for i in range(n_pairs)], n_trades)
+    timestamps = 1_700_000_000_000 + np.cumsum(rng.exponential(500, n_trades)).astype(
+        np.int64
+    )
+    late = rng.random(n_trades) < 0.001
+    timestamps[late] -= 120_000
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, n_trades)))
+    volumes = rng.exponential(1.0, n_trades)
+    return pd.DataFrame(
+        {
+            'pair': pairs,
+            'price': prices,
+            'volume': volumes,
+            'timestamp_ms': timestamps,
+        }
+    )
+
+
+def stream_messages(
+    trades: pd.DataFrame,
+    candle_seconds: int,
+    max_candles_in_state: int,
+    plan: Optional[IndicatorPlan] = None,
+) -> List[Dict[str, Any]]:
+    """
+    The last message of each window in the technical-indicators topic, computed one
+    trade at a time as the candles and technical-indicators services do, with the
+    indicators of the `plan` (the default ones if None).
+    """
+    # The reducers of the candles service
+    candles_dir = Path(__file__).resolve().parent.parent / 'candles'
+    sys.path.append(str(candles_dir))
+    spec = importlib.util.spec_from_file_location('candles_run', candles_dir / 'run.py')
+    candles_run = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(candles_run)
+
+    window_ms = candle_seconds * 1000
+    windows: Dict[str, Dict[str, Any]] = {}
+    states: Dict[str, MemoryState] = {}
+    last_messages: Dict[tuple, Dict[str, Any]] = {}
+
+    for trade in trades.to_dict('records'):
+        pair = trade['pair']
+        start = trade['timestamp_ms'] // window_ms * window_ms
+
+        window = windows.get(pair)
+        if window is not None and start < window['window_start_ms']:
+            continue  # late trade
+        if window is None or start > window['window_start_ms']:
+            window = {
+                'window_start_ms': start,
+                'value': candles_run.init_candle(trade),
+            }
+            windows[pair] = window
+        else:
+            candles_run.update_candle(window['value'], trade)
+
+        candle = {
+            'pair': pair,
+            'timestamp_ms': window['value']['timestamp_ms'],
+            'open': window['value']['open'],
+            'high': window['value']['high'],
+            'low': window['value']['low'],
+            'close': window['value']['close'],
+            'volume': window['value']['volume'],
+            'window_start_ms': start,
+            'window_end_ms': start + window_ms,
+            'candle_seconds': candle_seconds,
+        }
+        state = states.get(pair)
+        if state is None:
+            state = states[pair] = MemoryState(state_dumps, state_loads)
+        candles = update_candles(candle, state, max_candles_in_state)
+        last_messages[pair, start] = compute_indicators(candle, state, plan, candles)
+
+    return [last_messages[key] for key in sorted(last_messages)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--trades', type=int, default=200_000)
+    parser.add_argument('--pairs', type=int, default=3)
+    parser.add_argument('--candle-seconds', type=int, default=60)
+    parser.add_argument('--max-candles-in-state', type=int, default=60)
+    args = parser.parse_args()
+
+    # Skip the debug logs of the streaming path
+    logger.remove()
+    logger.add(sys.stderr, level='INFO')
+
+    trades = make_trades(args.trades, args.pairs)
+    backfill = compute_indicators_batch(build_candles(trades, args.candle_seconds))
+    expected = stream_messages(trades, args.candle_seconds, args.max_candles_in_state)
+
+    assert len(backfill) == len(expected), (len(backfill), len(expected))
+    assert list(backfill.columns) == list(expected[0]), 'Different columns'
+
+    worst = 0.0
+    for row, message in zip(backfill.to_dict('records'), expected, strict=True):
+        for column, value in message.items():
+            actual = row[column]
+            if isinstance(value, str) or value is None:
+                assert actual == value, (column, actual, value)
+                continue
+            if math.isnan(value):
+                assert math.isnan(actual), (message['pair'], column, actual, value)
+                continue
+            diff = abs(actual - value) / max(1.0, abs(value))
+            assert diff < 1e-9, (message['pair'], column, actual, value)
+            worst = max(worst, diff)
+
+    print(
+        f'{len(backfill)} candles match the streaming path, '
+        f'worst relative difference: {worst:.2e}'
+    )
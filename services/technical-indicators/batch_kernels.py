@@ -0,0 +1,104 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Vectorized versions of `talib.stream` functions, computing an indicator for many
+# pairs at once. The inputs are 2-D arrays (pairs x candles) with the candles of each
+# pair right-aligned, and `counts` is the number of candles of each pair.
+# Like `talib.stream`, they only read the minimum lookback of the function, and
+# return NaN for the pairs with fewer candles than that.
+# A kernel returns None for parameters it does not support, e.g. a BBANDS moving
+# average other than the SMA, and the plan then falls back to `talib.stream`.
+Kernel = Callable[..., Optional[Tuple[np.ndarray, ...]]]
+
+
+def _sma(inputs: List[np.ndarray], counts: np.ndarray, timeperiod: int):
+    (values,) = inputs
+    means = values[:, -timeperiod:].sum(axis=1) / timeperiod
+    return (_mask(means, counts < timeperiod),)
+
+
+def _rsi(inputs: List[np.ndarray], counts: np.ndarray, timeperiod: int):
+    (values,) = inputs
+    diffs = np.diff(values[:, -timeperiod - 1 :], axis=1)
+    avg_gain = np.where(diffs > 0, diffs, 0.0).sum(axis=1) / timeperiod
+    total = avg_gain + np.where(diffs < 0, -diffs, 0.0).sum(axis=1) / timeperiod
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rsi = np.where(_is_zero(total), 0.0, 100.0 * (avg_gain / total))
+    return (_mask(rsi, counts < timeperiod + 1),)
+
+
+def _bbands(
+    inputs: List[np.ndarray],
+    counts: np.ndarray,
+    timeperiod: int,
+    nbdevup: float,
+    nbdevdn: float,
+    matype: int,
+):
+    if matype != 0:
+        return None
+    (values,) = inputs
+    window = values[:, -timeperiod:]
+    middle = window.sum(axis=1) / timeperiod
+    # Population variance, as the mean of the squares minus the square of the mean
+    variance = (window * window).sum(axis=1) / timeperiod - middle * middle
+    stddev = np.sqrt(np.where(variance < 1e-14, 0.0, variance))
+    missing = counts < timeperiod
+    return (
+        _mask(middle + nbdevup * stddev, missing),
+        _mask(middle, missing),
+        _mask(middle - nbdevdn * stddev, missing),
+    )
+
+
+def _roc(inputs: List[np.ndarray], counts: np.ndarray, timeperiod: int):
+    (values,) = inputs
+    previous = values[:, -timeperiod - 1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        roc = np.where(previous != 0, ((values[:, -1] / previous) - 1.0) * 100.0, 0.0)
+    return (_mask(roc, counts < timeperiod + 1),)
+
+
+def _atr(inputs: List[np.ndarray], counts: np.ndarray, timeperiod: int):
+    highs, lows, closes = (values[:, -timeperiod:] for values in inputs)
+    previous_closes = inputs[2][:, -timeperiod - 1 : -1]
+    true_range = np.maximum(
+        highs - lows,
+        np.maximum(np.abs(highs - previous_closes), np.abs(lows - previous_closes)),
+    )
+    atr = true_range.sum(axis=1) / timeperiod
+    return (_mask(atr, counts < timeperiod + 1),)
+
+
+def _mfi(inputs: List[np.ndarray], counts: np.ndarray, timeperiod: int):
+    highs, lows, closes, volumes = (values[:, -timeperiod - 1 :] for values in inputs)
+    typical_prices = (highs + lows + closes) / 3.0
+    money_flows = (typical_prices * volumes)[:, 1:]
+    diffs = np.diff(typical_prices, axis=1)
+    positive = np.where(diffs > 0, money_flows, 0.0).sum(axis=1)
+    negative = np.where(diffs < 0, money_flows, 0.0).sum(axis=1)
+    total = positive + negative
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mfi = np.where(total < 1.0, 0.0, 100.0 * (positive / total))
+    return (_mask(mfi, counts < timeperiod + 1),)
+
+
+def _mask(values: np.ndarray, missing: np.ndarray) -> np.ndarray:
+    values[missing] = np.nan
+    return values
+
+
+def _is_zero(values: np.ndarray) -> np.ndarray:
+    # Same threshold as TA_IS_ZERO in talib
+    return (-1e-14 < values) & (values < 1e-14)
+
+
+BATCH_KERNELS: Dict[str, Kernel] = {
+    'SMA': _sma,
+    'RSI': _rsi,
+    'BBANDS': _bbands,
+    'ROC': _roc,
+    'ATR': _atr,
+    'MFI': _mfi,
+}
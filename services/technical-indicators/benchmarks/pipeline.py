@@ -0,0 +1,355 @@
+"""
+Latency, throughput and memory benchmark of the candles, technical-indicators and feature-store sink steps.
+
+It generates a synthetic stream of trades, with a fixed number of trades per candle
+window, and pushes it through the three steps one after the other, without Kafka:
+1. candles: the tumbling-window reducers of the candles service
+2. technical-indicators: `update_candles` + `compute_indicators` (or the incremental
+   indicators) on every candle, including the incomplete ones
+3. to-feature-store: the collapsing of the sink batches to the last update of each
+   candle, and their transform into a DataFrame
+
+The state is an in-memory stand-in for the quixstreams `State` (`common.state`), which
+serializes the values on `set` and deserializes them on `get` like the RocksDB state
+does.
+Every combination of the parameters is run, and the results are written as JSON so
+runs can be compared.
+
+Usage:
+    python -m benchmarks.pipeline --pairs 10 100 --max-candles 60 240 --updates-per-window 1 10 --output results.json
+"""
+
+import argparse
+import importlib.util
+import itertools
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from candle_buffer import state_dumps, state_loads
+from common.state import MemoryState
+from incremental_indicators import compute_indicators_incremental
+from indicator_registry import default_plan
+from loguru import logger
+from technical_indicators import update_candles_and_compute_indicators
+
+SERVICES_DIR = Path(__file__).resolve().parents[2]
+# The default FEATURE_GROUP_DEDUP_KEYS of the to-feature-store service
+SINK_DEDUP_KEYS = ['pair', 'candle_seconds', 'window_start_ms']
+
+
+@lru_cache
+def load_module(name: str, path: Path):
+    """
+    Load a module of another service, with the directory of that service on the path.
+    """
+    sys.path.append(str(path.parent))
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_trades(
+    n_pairs: int,
+    n_windows: int,
+    updates_per_window: int,
+    candle_seconds: int = 60,
+    seed: int = 42,
+) -> List[Dict[str, Any]]:
+    """
+    Random walk trades, `updates_per_window` per pair and window, interleaved across
+    the pairs.
+    """
+    rng = np.random.default_rng(seed)
+    n_per_pair = n_windows * updates_per_window
+    prices = 100 * np.exp(
+        np.cumsum(rng.normal(0, 0.001, (n_pairs, n_per_pair)), axis=1)
+    )
+    volumes = rng.exponential(0.5, (n_pairs, n_per_pair))
+    window_ms = candle_seconds * 1000
+    step_ms = window_ms // (updates_per_window + 1)
+
+    trades = []
+    for i in range(n_per_pair):
+        window, update = divmod(i, updates_per_window)
+        timestamp_ms = 1_700_000_000_000 + window * window_ms + (update + 1) * step_ms
+        for pair in range(n_pairs):
+            trades.append(
+                {
+                    'pair': f'PAIR{pair}/USD',
+                    'price': float(prices[pair, i]),
+                    'volume': float(volumes[pair, i]),
+                    'timestamp_ms': timestamp_ms,
+                }
+            )
+    return trades
+
+
+def candles_step(candle_seconds: int) -> Callable:
+    """
+    The tumbling-window aggregation of the candles service, for one trade.
+    """
+    candles_run = load_module('candles_run', SERVICES_DIR / 'candles' / 'run.py')
+    window_ms = candle_seconds * 1000
+
+    def step(trade: Dict[str, Any], state: MemoryState) -> Dict[str, Any]:
+        start = trade['timestamp_ms'] // window_ms * window_ms
+        window = state.get('window')
+        if window is None or window['start'] != start:
+            window = {'start': start, 'value': candles_run.init_candle(trade)}
+        else:
+            candles_run.update_candle(window['value'], trade)
+        state.set('window', window)
+        return {
+            **window['value'],
+            'window_start_ms': start,
+            'window_end_ms': start + window_ms,
+            'candle_seconds': candle_seconds,
+        }
+
+    return step
+
+
+def run_stream(
+    step: Callable,
+    messages: List[Dict[str, Any]],
+    state_factory: Callable[[], MemoryState],
+    keep_outputs: bool = True,
+) -> Dict[str, Any]:
+    """
+    Push the messages one by one through a stateful step, with a state per pair.
+
+    Returns:
+        Dict[str, Any]: The latency and throughput, the output messages if
+            `keep_outputs`, and the states.
+    """
+    states: Dict[str, MemoryState] = {}
+    latencies = np.empty(len(messages), dtype=np.int64)
+    outputs = []
+    perf_counter_ns = time.perf_counter_ns
+
+    start = time.perf_counter()
+    for i, message in enumerate(messages):
+        state = states.get(message['pair'])
+        if state is None:
+            state = states[message['pair']] = state_factory()
+        t0 = perf_counter_ns()
+        output = step(dict(message), state)
+        latencies[i] = perf_counter_ns() - t0
+        if keep_outputs:
+            outputs.append(output)
+    elapsed = time.perf_counter() - start
+
+    return {
+        **_latency_stats(latencies, len(messages), elapsed),
+        'outputs': outputs,
+        'states': states,
+    }
+
+
+def run_batches(
+    step: Callable, messages: List[Dict[str, Any]], batch_size: int
+) -> Dict[str, Any]:
+    """
+    Push the messages through a step taking a batch of messages at a time.
+    The latency per message is the latency of its batch divided by its size.
+    """
+    latencies = np.empty(len(messages), dtype=np.int64)
+    perf_counter_ns = time.perf_counter_ns
+
+    start = time.perf_counter()
+    for i in range(0, len(messages), batch_size):
+        batch = messages[i : i + batch_size]
+        t0 = perf_counter_ns()
+        step(batch)
+        latencies[i : i + len(batch)] = (perf_counter_ns() - t0) // len(batch)
+    elapsed = time.perf_counter() - start
+
+    return _latency_stats(latencies, len(messages), elapsed)
+
+
+def measure_memory(run: Callable[[], Any]) -> Dict[str, int]:
+    """
+    The peak memory allocated while running, and the memory still allocated by what
+    it returns, e.g. the states.
+    """
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        result = run()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return {'peak_bytes': peak - before, 'retained_bytes': after - before}
+
+
+def run_scenario(
+    n_pairs: int,
+    n_windows: int,
+    max_candles_in_state: int,
+    updates_per_window: int,
+    incremental: bool,
+    batch_size: int,
+    sink_transform: Callable,
+) -> List[Dict[str, Any]]:
+    """
+    Benchmark the three steps on the same stream.
+    """
+    scenario = {
+        'pairs': n_pairs,
+        'windows': n_windows,
+        'max_candles_in_state': max_candles_in_state,
+        'updates_per_window': updates_per_window,
+        'incomplete_ratio': 1 - 1 / updates_per_window,
+        'incremental_indicators': incremental,
+    }
+    trades = make_trades(n_pairs, n_windows, updates_per_window)
+
+    candles = candles_step(candle_seconds=60)
+    if incremental:
+        indicators = partial(
+            compute_indicators_incremental, max_candles_in_state=max_candles_in_state
+        )
+    else:
+        indicators = partial(
+            update_candles_and_compute_indicators,
+            max_candles_in_state=max_candles_in_state,
+            plan=default_plan(),
+        )
+
+    def indicators_state() -> MemoryState:
+        return MemoryState(state_dumps, state_loads)
+
+    results = []
+
+    candles_result = run_stream(candles, trades, MemoryState)
+    candle_messages = candles_result.pop('outputs')
+    del candles_result['states']
+    candles_result.update(
+        measure_memory(
+            lambda: run_stream(candles, trades, MemoryState, keep_outputs=False)
+        )
+    )
+    results.append({'step': 'candles', **scenario, **candles_result})
+
+    indicators_result = run_stream(indicators, candle_messages, indicators_state)
+    indicator_messages = indicators_result.pop('outputs')
+    del indicators_result['states']
+    indicators_result.update(
+        measure_memory(
+            lambda: run_stream(
+                indicators, candle_messages, indicators_state, keep_outputs=False
+            )
+        )
+    )
+    results.append({'step': 'technical-indicators', **scenario, **indicators_result})
+
+    sink_result = run_batches(sink_transform, indicator_messages, batch_size)
+    sink_result.update(
+        measure_memory(
+            lambda: run_batches(sink_transform, indicator_messages, batch_size)
+        )
+    )
+    results.append(
+        {
+            'step': 'to-feature-store',
+            **scenario,
+            'batch_size': batch_size,
+            **sink_result,
+        }
+    )
+
+    return results
+
+
+def _latency_stats(
+    latencies: np.ndarray, n_messages: int, elapsed: float
+) -> Dict[str, Any]:
+    p50, p99 = np.percentile(latencies, [50, 99])
+    return {
+        'messages': n_messages,
+        'p50_us': p50 / 1000,
+        'p99_us': p99 / 1000,
+        'messages_per_second': n_messages / elapsed,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=SERVICES_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--pairs', type=int, nargs='+', default=[10, 100])
+    parser.add_argument('--windows', type=int, default=100)
+    parser.add_argument('--max-candles', type=int, nargs='+', default=[60, 240])
+    parser.add_argument('--updates-per-window', type=int, nargs='+', default=[1, 10])
+    parser.add_argument('--incremental', action='store_true')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    # The update_candles debug logs would dominate the latencies
+    logger.remove()
+
+    transform = load_module(
+        'feature_store_transform', SERVICES_DIR / 'to-feature-store' / 'transform.py'
+    )
+
+    def sink_transform(values: List[Dict[str, Any]]):
+        latest = transform.latest_by_key(values, SINK_DEDUP_KEYS)
+        return transform.to_dataframe(latest)
+
+    results = []
+    for n_pairs, max_candles, updates in itertools.product(
+        args.pairs, args.max_candles, args.updates_per_window
+    ):
+        for result in run_scenario(
+            n_pairs=n_pairs,
+            n_windows=args.windows,
+            max_candles_in_state=max_candles,
+            updates_per_window=updates,
+            incremental=args.incremental,
+            batch_size=args.batch_size,
+            sink_transform=sink_transform,
+        ):
+            print(
+                f'{result["step"]:>20} pairs={n_pairs:<5} max_candles={max_candles:<4} '
+                f'updates={updates:<3} p50={result["p50_us"]:8.1f}us '
+                f'p99={result["p99_us"]:8.1f}us '
+                f'{result["messages_per_second"]:>10,.0f} msg/s '
+                f'peak={result["peak_bytes"] / 1e6:7.1f}MB '
+                f'retained={result["retained_bytes"] / 1e6:7.1f}MB'
+            )
+            results.append(result)
+
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'args': vars(args),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {args.output}')
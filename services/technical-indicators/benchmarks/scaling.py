@@ -0,0 +1,257 @@
+"""
+Scaling benchmark of the candles and technical-indicators services with several replicas.
+
+It generates synthetic trades with the trades service, where a few hot pairs get most
+of the trades, assigns the pairs to the partitions like the trades service does
+(common.partitioning), and splits the partitions between the replicas like the Kafka
+range assignor. The candles and indicators stay in the partition of their trades, so a
+replica of the candles service and a replica of the technical-indicators service with
+the same partitions see the same pairs: each replica is a process running the steps of
+both services (the fused pipeline) on the trades of its partitions, with its own state.
+
+For each number of replicas, with the weighted partitioner and with the Kafka default
+partitioner only (no weights), it reports:
+- the throughput with one core per replica: the trades over the CPU time of the
+  slowest replica, and its speedup and efficiency over a single replica
+- the throughput of the replicas running at once on this machine (wall time)
+- the share of the trades of the busiest replica
+and checks the messages of the replicas are the ones of all the trades in a single
+process, i.e. the state is sharded correctly.
+
+Usage:
+    python -m benchmarks.scaling --trades 100000 --pairs 100 --partitions 4 --replicas 1 2 4
+"""
+
+import argparse
+import hashlib
+import importlib
+import json
+import multiprocessing
+import platform
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from benchmarks.pipeline import SERVICES_DIR, _git_commit, load_module
+from common.partitioning import PairPartitioner
+from loguru import logger
+from quixstreams.utils.json import dumps as json_dumps
+
+# The trades of each partition, set before the replicas are forked so they don't have
+# to be sent to them
+PARTITION_TRADES: List[List[Dict[str, Any]]] = []
+
+
+def fused_pipeline():
+    """
+    The fused pipeline module, which loads the steps of the other services.
+    """
+    return load_module(
+        'fused_pipeline', SERVICES_DIR / 'fused-pipeline' / 'pipeline.py'
+    )
+
+
+def make_trades(n_trades: int, n_pairs: int, trades_per_second: float) -> tuple:
+    """
+    The synthetic trades of the trades service, and the share of the trades of each
+    pair.
+    """
+    fused_pipeline()
+    synthetic = importlib.import_module('kraken_api.synthetic')
+    api = synthetic.KrakenSyntheticAPI(
+        pairs=[],
+        trades_per_second=trades_per_second,
+        n_pairs=n_pairs,
+        start_ms=1_700_000_000_000,
+        paced=False,
+        max_trades=n_trades,
+    )
+    trades = []
+    while not api.is_done():
+        trades.extend(trade.to_dict() for trade in api.get_trades())
+    return trades[:n_trades], api.pair_weights
+
+
+def range_assignment(n_partitions: int, n_replicas: int) -> List[List[int]]:
+    """
+    The partitions of each replica with the Kafka range assignor: consecutive
+    partitions, the first replicas getting one more if they don't divide evenly.
+    """
+    size, extra = divmod(n_partitions, n_replicas)
+    assignment = []
+    start = 0
+    for replica in range(n_replicas):
+        end = start + size + (replica < extra)
+        assignment.append(list(range(start, end)))
+        start = end
+    return assignment
+
+
+def run_replica(partitions: List[int], pipeline_options: Dict[str, Any]) -> dict:
+    """
+    Push the trades of the partitions through the candles and technical-indicators
+    steps, in the order of the trades within each partition.
+
+    Returns:
+        dict: The number of trades, the CPU seconds and a digest of the messages of
+            each pair.
+    """
+    fused = fused_pipeline()
+    digests: Dict[str, Any] = defaultdict(hashlib.sha1)
+
+    class DigestSink:
+        def write(self, messages: List[Dict[str, Any]]) -> None:
+            for message in messages:
+                digests[message['pair']].update(json_dumps(message))
+
+        def flush(self) -> None:
+            pass
+
+    pipeline = fused.FusedPipeline(**pipeline_options, sinks=[DigestSink()])
+    # The partitions one after the other, only the order of the trades of each pair
+    # changes the messages
+    trades = [
+        trade for partition in partitions for trade in PARTITION_TRADES[partition]
+    ]
+    start = time.process_time()
+    for trade in trades:
+        pipeline.process(trade)
+    cpu_seconds = time.process_time() - start
+
+    return {
+        'trades': len(trades),
+        'cpu_seconds': cpu_seconds,
+        'digests': {pair: digest.hexdigest() for pair, digest in digests.items()},
+    }
+
+
+def run_replicas(
+    n_partitions: int, n_replicas: int, pipeline_options: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Run the replicas at once, each in its own process.
+    """
+    assignment = range_assignment(n_partitions, n_replicas)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=n_replicas, mp_context=multiprocessing.get_context('fork')
+    ) as executor:
+        replicas = list(
+            executor.map(run_replica, assignment, [pipeline_options] * len(assignment))
+        )
+    wall_seconds = time.perf_counter() - start
+
+    n_trades = sum(replica['trades'] for replica in replicas)
+    digests = {}
+    for replica in replicas:
+        assert not digests.keys() & replica['digests'].keys(), 'Pair in two replicas'
+        digests.update(replica['digests'])
+    return {
+        'replicas': n_replicas,
+        'partitions_per_replica': [len(partitions) for partitions in assignment],
+        'trades': n_trades,
+        'max_trades_share': max(replica['trades'] for replica in replicas) / n_trades,
+        'trades_per_second': n_trades
+        / max(replica['cpu_seconds'] for replica in replicas),
+        'wall_trades_per_second': n_trades / wall_seconds,
+        'digests': digests,
+    }
+
+
+def run_partitioner(
+    trades: List[Dict[str, Any]],
+    partitioner: PairPartitioner,
+    replica_counts: List[int],
+    pipeline_options: Dict[str, Any],
+    expected_digests: Dict[str, str],
+) -> List[Dict[str, Any]]:
+    """
+    Partition the trades, and run every number of replicas on them, checking their
+    messages are the expected ones.
+    """
+    PARTITION_TRADES[:] = [[] for _ in range(partitioner.n_partitions)]
+    for trade in trades:
+        PARTITION_TRADES[partitioner(trade['pair'])].append(trade)
+
+    results = []
+    for n_replicas in replica_counts:
+        result = run_replicas(partitioner.n_partitions, n_replicas, pipeline_options)
+        digests = result.pop('digests')
+        assert digests == expected_digests, (
+            f'Different messages with {n_replicas} replicas'
+        )
+        results.append(result)
+
+    baseline = results[0]['trades_per_second'] / results[0]['replicas']
+    for result in results:
+        result['speedup'] = result['trades_per_second'] / baseline
+        result['efficiency'] = result['speedup'] / result['replicas']
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--trades', type=int, default=100_000)
+    parser.add_argument('--pairs', type=int, default=100)
+    parser.add_argument('--trades-per-second', type=float, default=500)
+    parser.add_argument('--partitions', type=int, default=4)
+    parser.add_argument('--replicas', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--max-candles', type=int, default=60)
+    parser.add_argument('--incomplete-candles-interval-ms', type=int, default=1000)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    # The update_candles debug logs would dominate the time
+    logger.remove()
+
+    trades, pair_weights = make_trades(args.trades, args.pairs, args.trades_per_second)
+    pipeline_options = {
+        'candle_seconds': 60,
+        'max_candles_in_state': args.max_candles,
+        'incomplete_candles_interval_ms': args.incomplete_candles_interval_ms,
+    }
+    print(
+        f'{len(trades)} trades of {args.pairs} pairs, the hottest with '
+        f'{max(pair_weights.values()):.0%} of the trades, {args.partitions} partitions, '
+        f'{multiprocessing.cpu_count()} CPUs'
+    )
+
+    # The messages of all the trades in a single process, in their original order
+    PARTITION_TRADES[:] = [trades]
+    expected_digests = run_replica([0], pipeline_options)['digests']
+
+    results = []
+    for name, weights in [('weighted', pair_weights), ('hashed', None)]:
+        for result in run_partitioner(
+            trades,
+            PairPartitioner(args.partitions, weights),
+            args.replicas,
+            pipeline_options,
+            expected_digests,
+        ):
+            print(
+                f'{name:>8} replicas={result["replicas"]} '
+                f'busiest={result["max_trades_share"]:4.0%} of the trades '
+                f'{result["trades_per_second"]:>9,.0f} trades/s '
+                f'speedup={result["speedup"]:4.2f} '
+                f'efficiency={result["efficiency"]:4.0%} '
+                f'(wall {result["wall_trades_per_second"]:>9,.0f} trades/s)'
+            )
+            results.append({'partitioner': name, **result})
+
+    print('The messages of the replicas are the ones of all the trades in one process')
+    if args.output:
+        report = {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': multiprocessing.cpu_count(),
+            'args': vars(args),
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {args.output}')
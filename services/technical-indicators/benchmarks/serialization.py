@@ -0,0 +1,131 @@
+"""
+Size and speed of the JSON and binary wire formats of the trades, candles and technical-indicators topics.
+
+It generates the messages of each topic with the steps of the pipeline benchmark
+(random walk trades, their candles with the incomplete ones, and the default
+technical indicators of each candle), checks both formats give back the same
+messages, and reports the bytes per message and the encode and decode time per
+message of each format. The sizes are before the compression of the producer
+batches.
+
+Usage:
+    python -m benchmarks.serialization --pairs 10 --windows 300 --updates-per-window 5
+"""
+
+import argparse
+import time
+from datetime import datetime, timezone
+from functools import partial
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+from benchmarks.pipeline import candles_step, make_trades, run_stream
+from candle_buffer import state_dumps, state_loads
+from common.state import MemoryState
+from common.wire_format import MAGIC, decode, encode
+from indicator_registry import default_plan
+from loguru import logger
+from quixstreams.utils.json import dumps as json_dumps
+from quixstreams.utils.json import loads as json_loads
+from technical_indicators import update_candles_and_compute_indicators
+
+FORMATS: Dict[str, Callable[[Dict[str, Any]], bytes]] = {
+    'json': json_dumps,
+    'binary': encode,
+}
+
+
+def topic_messages(
+    n_pairs: int, n_windows: int, updates_per_window: int, max_candles_in_state: int
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    The messages of the trades, candles and technical-indicators topics.
+    """
+    trades = make_trades(n_pairs, n_windows, updates_per_window)
+    for trade in trades:
+        # The ISO timestamp of the trades service
+        trade['timestamp'] = (
+            datetime.fromtimestamp(trade['timestamp_ms'] / 1000, timezone.utc)
+            .isoformat(timespec='microseconds')
+            .replace('+00:00', 'Z')
+        )
+    candles = run_stream(candles_step(candle_seconds=60), trades, MemoryState)[
+        'outputs'
+    ]
+    indicators = run_stream(
+        partial(
+            update_candles_and_compute_indicators,
+            max_candles_in_state=max_candles_in_state,
+            plan=default_plan(),
+        ),
+        candles,
+        partial(MemoryState, state_dumps, state_loads),
+    )['outputs']
+    return {'trades': trades, 'candles': candles, 'technical-indicators': indicators}
+
+
+def measure(
+    messages: List[Dict[str, Any]], dumps: Callable[[Dict[str, Any]], bytes]
+) -> Dict[str, float]:
+    """
+    The bytes per message, the encode and decode time per message in microseconds,
+    and the fraction of messages in the binary format (the others fell back to JSON).
+    """
+    start = time.perf_counter()
+    encoded = [dumps(message) for message in messages]
+    encode_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for data in encoded:
+        decode(data)
+    decode_seconds = time.perf_counter() - start
+
+    n_messages = len(messages)
+    return {
+        'bytes_per_message': sum(map(len, encoded)) / n_messages,
+        'encode_us': encode_seconds / n_messages * 1e6,
+        'decode_us': decode_seconds / n_messages * 1e6,
+        'binary_ratio': sum(data[0] == MAGIC for data in encoded) / n_messages,
+    }
+
+
+def check_round_trip(messages: List[Dict[str, Any]]) -> None:
+    """
+    Both formats must give back the same messages (NaN is null in JSON).
+    """
+    for message in messages:
+        expected = json_loads(json_dumps(message))
+        assert json_loads(json_dumps(decode(encode(message)))) == expected, message
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--pairs', type=int, default=10)
+    parser.add_argument('--windows', type=int, default=300)
+    parser.add_argument('--updates-per-window', type=int, default=5)
+    parser.add_argument('--max-candles', type=int, default=60)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    # The update_candles debug logs
+    logger.remove()
+
+    topics = topic_messages(
+        args.pairs, args.windows, args.updates_per_window, args.max_candles
+    )
+    for topic, messages in topics.items():
+        check_round_trip(messages)
+
+        for wire_format, dumps in FORMATS.items():
+            # The median of the repeats, the first ones also build the layouts
+            runs = [measure(messages, dumps) for _ in range(args.repeat)]
+            result = {key: np.median([run[key] for run in runs]) for key in runs[0]}
+            print(
+                f'{topic:>20} {wire_format:>6}: '
+                f'{result["bytes_per_message"]:6.1f} bytes/message '
+                f'encode={result["encode_us"]:5.2f}us '
+                f'decode={result["decode_us"]:5.2f}us '
+                f'total={result["encode_us"] + result["decode_us"]:5.2f}us '
+                f'({len(messages)} messages, '
+                f'{result["binary_ratio"]:.0%} binary)'
+            )
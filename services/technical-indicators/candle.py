@@ -1,16 +1,24 @@
 from typing import Any, Dict
 
-from loguru import logger
+from candle_buffer import CandleBuffer, load_candle_buffer
+from common.instrumentation import REGISTRY, SIZE_BUCKETS
 from quixstreams import State
 
+# The number of candles in the state of a pair and timeframe, after each update
+STATE_CANDLES = REGISTRY.histogram(
+    'state_candles',
+    'Number of candles in the state after each update',
+    buckets=SIZE_BUCKETS,
+)
+
 
 def update_candles(
     candle: Dict[str, Any], state: State, max_candles_in_state: int
-) -> Dict[str, Any]:
+) -> CandleBuffer:
     """
-    Update the list of candles with the latest candle.
-    If the lastest candle corresponds to a new window, and the total number of candles in the state is less than the number of candles we want to keep, we just append it to the list.
-    If it corresponds to the last window, we replace the last candle in the list.
+    Update the buffer of candles with the latest candle.
+    If the lastest candle corresponds to a new window, we append it to the buffer, which evicts the oldest candle once the buffer holds `max_candles_in_state` candles.
+    If it corresponds to the last window, we replace the last candle in the buffer.
 
     Args:
         candle (Dict[str, Any]): The latest candle.
@@ -18,31 +26,59 @@ def update_candles(
         max_candles_in_state (int): The maximum number of candles we want to keep in the state.
 
     Returns:
-        None
+        CandleBuffer: The updated buffer of candles, to compute the indicators from
+            without reading it back from the state.
     """
-    # Get the list of candles from our state
-    candles = state.get('candles', default=[])
+    # Get the buffer of candles from our state
+    candles = load_candle_buffer(state, max_candles_in_state)
+    if candles is None:
+        candles = migrate_candles(state, max_candles_in_state)
 
-    # Append the new candle if the list is empty or it's a new window; otherwise, replace the last candle
-    if not candles or not is_same_window(candle, candles[-1]):
-        candles.append(candle)
+    # Append the new candle if the buffer is empty or it's a new window; otherwise, replace the last candle
+    if candles.is_same_window(candle):
+        candles.replace_last(candle)
     else:
-        candles[-1] = candle
-
-    # If the total number of candles in the state is greater than the number of
-    # candles we want to keep, we remove the oldest candle
-    if len(candles) > max_candles_in_state:
-        candles.pop(0)
+        candles.append(candle)
 
     # TODO: we should check the candles have no missing windows
     # This can happen for low volume pairs. In this case, we could interpolate the missing windows.
 
-    logger.debug(f'Number of candles in state: {len(candles)}')
+    STATE_CANDLES.observe(len(candles))
+
+    # Update the state with the new buffer of candles
+    state.set('candle_buffer', candles.to_bytes())
+
+    return candles
+
+
+def migrate_candles(state: State, max_candles_in_state: int) -> CandleBuffer:
+    """
+    Move the candles stored by previous versions into a buffer, and delete them.
+
+    They are the list of candles of the versions before the buffer (`candles`), and
+    the buffer of the versions without timeframes, without prefix (`candle_buffer`).
+    The state of a timeframe reads them from its `legacy_state`, if it has one.
+
+    Args:
+        state (State): The state of the streaming application, or of a timeframe.
+        max_candles_in_state (int): The maximum number of candles we want to keep in the state.
+
+    Returns:
+        CandleBuffer: The candles of the previous versions, possibly none.
+    """
+    legacy_state = getattr(state, 'legacy_state', state)
+    if legacy_state is None:
+        return CandleBuffer(max_candles_in_state)
 
-    # Update the state with the new list of candles
-    state.set('candles', candles)
+    candles = load_candle_buffer(legacy_state, max_candles_in_state)
+    if candles is not None:
+        legacy_state.delete('candle_buffer')
+        return candles
 
-    return candle
+    candles = legacy_state.get('candles', default=None)
+    if candles is not None:
+        legacy_state.delete('candles')
+    return CandleBuffer.from_candles(candles or [], max_candles_in_state)
 
 
 def is_same_window(candle_1: Dict[str, Any], candle_2: Dict[str, Any]) -> bool:
@@ -0,0 +1,212 @@
+import struct
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from quixstreams import State
+from quixstreams.utils.json import dumps as json_dumps
+from quixstreams.utils.json import loads as json_loads
+
+# Columns of the buffer, all stored as float64.
+# Timestamps in milliseconds fit exactly in a float64 (up to 2**53).
+COLUMNS = (
+    'open',
+    'high',
+    'low',
+    'close',
+    'volume',
+    'window_start_ms',
+    'window_end_ms',
+)
+_INDEX = {name: i for i, name in enumerate(COLUMNS)}
+
+# Binary layout: a header (format version, number of candles) followed by the
+# columns in chronological order, each one as `size` little-endian float64 values.
+FORMAT_VERSION = 1
+_HEADER = struct.Struct('<BI')
+
+# First byte of the state values stored as raw bytes instead of JSON.
+# JSON documents never start with a null byte, so both can live in the same store.
+_BINARY_MARKER = b'\x00'
+
+
+class CandleBuffer:
+    """
+    Fixed-capacity ring buffer of candles, stored column-wise in float64 arrays.
+
+    Every value is written twice, at `i` and `i + capacity`, so the candles in
+    chronological order are always a contiguous slice of the underlying array, and
+    the columns can be read as zero-copy NumPy views.
+    """
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError('The capacity of the buffer must be at least 1')
+        self.capacity = capacity
+        self._data = np.zeros((len(COLUMNS), 2 * capacity), dtype=np.float64)
+        # Position right after the last candle, and number of candles in the buffer
+        self._end = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, candle: Dict[str, Any]) -> None:
+        """
+        Append a candle, evicting the oldest one if the buffer is full.
+        """
+        self._write(self._end, candle)
+        self._end = (self._end + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def replace_last(self, candle: Dict[str, Any]) -> None:
+        """
+        Replace the last candle in the buffer.
+        """
+        if not self._size:
+            raise IndexError('Cannot replace the last candle of an empty buffer')
+        self._write((self._end - 1) % self.capacity, candle)
+
+    def is_same_window(self, candle: Dict[str, Any]) -> bool:
+        """
+        Check if the candle is in the same window as the last candle in the buffer.
+        """
+        if not self._size:
+            return False
+        last = (self._end - 1) % self.capacity
+        return (
+            candle['window_start_ms'] == self._data[_INDEX['window_start_ms'], last]
+            and candle['window_end_ms'] == self._data[_INDEX['window_end_ms'], last]
+        )
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Get a read-only view of a column, in chronological order.
+        """
+        start = self._end - self._size + self.capacity
+        view = self._data[_INDEX[name], start : self._end + self.capacity]
+        view.flags.writeable = False
+        return view
+
+    def columns(self) -> np.ndarray:
+        """
+        Get a read-only view of all the columns, in the order of `COLUMNS`, as an array
+        of shape (columns, candles) in chronological order.
+        """
+        start = self._end - self._size + self.capacity
+        view = self._data[:, start : self._end + self.capacity]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def opens(self) -> np.ndarray:
+        return self.column('open')
+
+    @property
+    def highs(self) -> np.ndarray:
+        return self.column('high')
+
+    @property
+    def lows(self) -> np.ndarray:
+        return self.column('low')
+
+    @property
+    def closes(self) -> np.ndarray:
+        return self.column('close')
+
+    @property
+    def volumes(self) -> np.ndarray:
+        return self.column('volume')
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialize the candles in the buffer to the binary format.
+        """
+        return _HEADER.pack(FORMAT_VERSION, self._size) + self.columns().astype(
+            '<f8', copy=False
+        ).tobytes(order='C')
+
+    @classmethod
+    def from_bytes(cls, data: bytes, capacity: Optional[int] = None) -> 'CandleBuffer':
+        """
+        Load a buffer from the binary format.
+        If there are more candles than the capacity, only the most recent ones are kept.
+
+        Args:
+            data (bytes): The serialized buffer.
+            capacity (Optional[int]): The capacity of the buffer. Defaults to the
+                number of candles in `data`, which is enough to only read them.
+
+        Returns:
+            CandleBuffer: The loaded buffer.
+        """
+        version, size = _HEADER.unpack_from(data)
+        if version != FORMAT_VERSION:
+            raise ValueError(f'Unsupported candle buffer format version: {version}')
+        if capacity is None:
+            capacity = max(size, 1)
+
+        columns = np.frombuffer(
+            data, dtype='<f8', count=len(COLUMNS) * size, offset=_HEADER.size
+        ).reshape(len(COLUMNS), size)
+        columns = columns[:, max(0, size - capacity) :]
+
+        buffer = cls(capacity)
+        buffer._size = columns.shape[1]
+        buffer._end = buffer._size % capacity
+        buffer._data[:, : buffer._size] = columns
+        buffer._data[:, capacity : capacity + buffer._size] = columns
+        return buffer
+
+    @classmethod
+    def from_candles(
+        cls, candles: List[Dict[str, Any]], capacity: int
+    ) -> 'CandleBuffer':
+        """
+        Build a buffer from a list of candles, e.g. the one stored by previous versions.
+        """
+        buffer = cls(capacity)
+        for candle in candles[-capacity:]:
+            buffer.append(candle)
+        return buffer
+
+    def _write(self, position: int, candle: Dict[str, Any]) -> None:
+        values = [candle[name] for name in COLUMNS]
+        self._data[:, position] = values
+        self._data[:, position + self.capacity] = values
+
+
+def state_dumps(value: Any) -> bytes:
+    """
+    Serialize a state value, storing bytes as they are and anything else as JSON.
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return _BINARY_MARKER + value
+    return json_dumps(value)
+
+
+def state_loads(value: bytes) -> Any:
+    """
+    Deserialize a state value written by `state_dumps`.
+    """
+    if value[:1] == _BINARY_MARKER:
+        return memoryview(value)[1:]
+    return json_loads(value)
+
+
+def load_candle_buffer(
+    state: State, capacity: Optional[int] = None
+) -> Optional[CandleBuffer]:
+    """
+    Load the candle buffer from the state.
+
+    Args:
+        state (State): The state of the streaming application.
+        capacity (Optional[int]): The capacity of the buffer, see `CandleBuffer.from_bytes`.
+
+    Returns:
+        Optional[CandleBuffer]: The candle buffer, or None if there are no candles yet.
+    """
+    data = state.get('candle_buffer', default=None)
+    if data is None:
+        return None
+    return CandleBuffer.from_bytes(data, capacity)
@@ -1,3 +1,8 @@
+from pathlib import Path
+from typing import Dict, List, Literal
+
+from indicator_registry import DEFAULT_INDICATORS_FILE
+from pydantic import field_validator, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -7,8 +12,78 @@ class Config(BaseSettings):
     kafka_input_topic: str
     kafka_output_topic: str
     kafka_consumer_group: str
+    # The partitions and replication factor of the topics, if they are created. The
+    # indicators go to the partition of their candles, so the output topic needs at
+    # least as many partitions as the input one
+    kafka_topic_partitions: int = 1
+    kafka_topic_replication_factor: int = 1
     max_candles_in_state: int
-    candle_seconds: int
+    # The candle seconds of each timeframe to compute, e.g. [60, 300, 3600]
+    candle_seconds: List[int]
+    # The maximum number of candles in state of some timeframes, e.g. {"3600": 24}
+    max_candles_in_state_by_timeframe: Dict[int, int] = {}
+    # Not with the micro-batches, and only with the default indicators file
+    incremental_indicators: bool = False
+    # A relative path is relative to the directory of the service
+    indicators_file: str = str(DEFAULT_INDICATORS_FILE)
+    # Compute the indicators of all the pairs in micro-batches, 0 to disable
+    micro_batch_ms: int = 0
+    # Recompute the indicators of a pair at most once per interval within a window,
+    # 0 to recompute them on every candle update. Not with the micro-batches
+    debounce_interval_ms: int = 0
+    # Add the in and out times to the headers of the messages, see common/tracing.py
+    latency_tracing: bool = True
+    # The port of the Prometheus metrics endpoint, 0 to disable it
+    metrics_port: int = 9103
+    # The fraction of the messages logged, at most 10 per second
+    log_sample_rate: float = 0.001
+    # The format of the indicators, see common/wire_format.py
+    wire_format: Literal['json', 'binary'] = 'binary'
+
+    @field_validator('candle_seconds', mode='before')
+    @classmethod
+    def single_candle_seconds(cls, value):
+        # A single timeframe can still be given as CANDLE_SECONDS=60
+        return [value] if isinstance(value, (int, str)) else value
+
+    @field_validator('indicators_file')
+    @classmethod
+    def resolve_indicators_file(cls, value):
+        # Not relative to the current directory, so the service can start from anywhere
+        return str(DEFAULT_INDICATORS_FILE.parent / value)
+
+    @model_validator(mode='after')
+    def check_debounce_without_micro_batches(self) -> 'Config':
+        if self.micro_batch_ms > 0 and self.debounce_interval_ms > 0:
+            raise ValueError(
+                'DEBOUNCE_INTERVAL_MS is not supported with MICRO_BATCH_MS, the '
+                'micro-batches compute every candle: set one of them to 0'
+            )
+        return self
+
+    @model_validator(mode='after')
+    def check_incremental_indicators_without_micro_batches(self) -> 'Config':
+        if self.micro_batch_ms > 0 and self.incremental_indicators:
+            raise ValueError(
+                'INCREMENTAL_INDICATORS is not supported with MICRO_BATCH_MS, the '
+                'micro-batches compute the indicators from the buffers of candles: set '
+                'one of them to false or 0'
+            )
+        return self
+
+    @model_validator(mode='after')
+    def check_incremental_indicators_with_default_file(self) -> 'Config':
+        default_file = DEFAULT_INDICATORS_FILE.resolve()
+        if (
+            self.incremental_indicators
+            and Path(self.indicators_file).resolve() != default_file
+        ):
+            raise ValueError(
+                'INCREMENTAL_INDICATORS only computes the default indicators, not the '
+                f'ones of INDICATORS_FILE={self.indicators_file}: set one of them back '
+                'to its default'
+            )
+        return self
 
 
 config = Config()
@@ -0,0 +1,124 @@
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List
+
+from candle import is_same_window
+from common.instrumentation import REGISTRY
+from loguru import logger
+from quixstreams import State
+
+COMPUTED = REGISTRY.counter(
+    'debounce_computed_total', 'Candles whose indicators the debouncer computed'
+)
+SKIPPED = REGISTRY.counter(
+    'debounce_skipped_total',
+    'Candle updates superseded by a newer one before their indicators were computed',
+    ['pair'],
+)
+
+
+class IndicatorDebouncer:
+    """
+    Recompute the technical indicators of a pair at most once per interval within a
+    window, and always on the first candle of a new window and on every candle of the
+    last interval of a window, which the next computation would be after.
+
+    So the final candle of a window is computed as soon as it arrives if its last trade
+    is in the last interval of the window. Otherwise it is kept in the state, and
+    computed as the final candle of its window when the next candle of the same pair
+    and timeframe arrives, in a later window: there is no timer, and the windows
+    advance per pair. So every window gets its final indicators as long as the pair
+    keeps trading, and the ones of the last window of a pair that stops trading before
+    the last interval of that window are never computed.
+    """
+
+    def __init__(
+        self,
+        interval_ms: int,
+        compute: Callable[[Dict[str, Any], State], Dict[str, Any]],
+        log_interval_seconds: float = 60.0,
+    ):
+        """
+        Args:
+            interval_ms (int): Minimum event time between two computations for the same pair and window.
+            compute (Callable): Update the state with a candle and compute its indicators.
+            log_interval_seconds (float): How often to log the counters.
+        """
+        self.interval_ms = interval_ms
+        self.compute = compute
+        self.log_interval_seconds = log_interval_seconds
+
+        # Counters of the candles computed, and of the updates that were superseded by
+        # a newer one before being computed, for the logs (the metrics are COMPUTED and
+        # SKIPPED)
+        self.computed = 0
+        self.skipped = 0
+        self.skipped_by_pair: Counter = Counter()
+        self._last_log_time = time.monotonic()
+
+    def __call__(self, candle: Dict[str, Any], state: State) -> List[Dict[str, Any]]:
+        """
+        Args:
+            candle (Dict[str, Any]): The latest candle.
+            state (State): The state of the streaming application.
+
+        Returns:
+            List[Dict[str, Any]]: The candles with their indicators, possibly empty.
+        """
+        pending = state.get('debounce_pending', default=None)
+        last_computed = state.get('debounce_last_computed', default=None)
+        messages = []
+
+        new_window = last_computed is None or not is_same_window(candle, last_computed)
+        if new_window and pending is not None:
+            # The window of the pending candle is over, so it is the final candle
+            messages.append(self.compute(pending, state))
+            state.delete('debounce_pending')
+            pending = None
+
+        # A later update of the window could only be computed after its end
+        closing = candle['timestamp_ms'] + self.interval_ms >= candle['window_end_ms']
+        if (
+            new_window
+            or closing
+            or candle['timestamp_ms'] - last_computed['timestamp_ms']
+            >= self.interval_ms
+        ):
+            messages.append(self.compute(candle, state))
+            state.set('debounce_last_computed', _window_and_time(candle))
+            if pending is not None:
+                self._skip(pending)
+                state.delete('debounce_pending')
+        else:
+            if pending is not None:
+                self._skip(pending)
+            state.set('debounce_pending', candle)
+
+        self.computed += len(messages)
+        COMPUTED.inc(len(messages))
+        self._maybe_log()
+
+        return messages
+
+    def _skip(self, candle: Dict[str, Any]) -> None:
+        self.skipped += 1
+        self.skipped_by_pair[candle['pair']] += 1
+        SKIPPED.labels(candle['pair']).inc()
+
+    def _maybe_log(self) -> None:
+        now = time.monotonic()
+        if now - self._last_log_time < self.log_interval_seconds:
+            return
+        self._last_log_time = now
+        logger.info(
+            f'Debounced indicators: computed={self.computed}, skipped={self.skipped}, '
+            f'top skipped pairs={self.skipped_by_pair.most_common(5)}'
+        )
+
+
+def _window_and_time(candle: Dict[str, Any]) -> Dict[str, int]:
+    return {
+        'window_start_ms': candle['window_start_ms'],
+        'window_end_ms': candle['window_end_ms'],
+        'timestamp_ms': candle['timestamp_ms'],
+    }
@@ -0,0 +1,299 @@
+from math import sqrt
+from typing import Any, Dict
+
+import numpy as np
+from candle import is_same_window
+from quixstreams import State
+from talib import stream
+
+# Running sums kept by the engine, as series name -> window lengths.
+# Note that `talib.stream` only looks at the minimum lookback of each function, so
+# stream.EMA(n) is the mean of the last n values, and RSI/ATR/MFI are plain sums
+# over the last n differences. Keeping these sums up to date is O(1) per candle.
+ROLLING_WINDOWS: Dict[str, tuple] = {
+    'close': (7, 9, 14, 20, 21, 40),
+    'gain': (9, 14, 21),
+    'loss': (9, 14, 21),
+    'true_range': (10,),
+    'money_flow_pos': (10,),
+    'money_flow_neg': (10,),
+    'volume': (10,),
+}
+
+# Number of raw values kept per series. It covers the longest rolling window (plus
+# the value leaving it), and the lookback of MACD (32), ADX (28) and STOCHRSI (17),
+# which are evaluated with talib on this bounded tail instead of the full history.
+TAIL_SIZES: Dict[str, int] = {
+    'close': 41,
+    'high': 28,
+    'low': 28,
+    'typical_price': 1,
+    **{
+        series: max(windows) + 1
+        for series, windows in ROLLING_WINDOWS.items()
+        if series != 'close'
+    },
+}
+
+# The running sums add and subtract a value per candle, so their rounding errors add
+# up over the life of a pair: they are recomputed from the tails every this many
+# candles.
+RESUM_INTERVAL = 1_000
+
+
+def compute_indicators_incremental(
+    candle: Dict[str, Any], state: State, max_candles_in_state: int
+) -> Dict[str, Any]:
+    """
+    Compute the technical indicators with running sums kept in the state, so the cost
+    per message does not depend on the number of candles in the state.
+
+    Only closed windows are pushed into the engine stored in the state. The candle of
+    the current window is applied to a copy of it, so an update of the same window
+    rolls back that step by simply being applied again to the stored engine.
+
+    Args:
+        candle (Dict[str, Any]): The latest candle.
+        state (State): The state of the streaming application.
+        max_candles_in_state (int): The maximum number of candles we want to keep in the state.
+
+    Returns:
+        Dict[str, Any]: The candle with the technical indicators.
+    """
+    engine = state.get('indicator_engine', default=None) or init_engine()
+    last_candle = state.get('indicator_last_candle', default=None)
+
+    # The previous window is closed, so its candle becomes part of the history
+    if last_candle is not None and not is_same_window(candle, last_candle):
+        push_candle(engine, last_candle)
+        state.set('indicator_engine', engine)
+
+    state.set('indicator_last_candle', candle)
+
+    current = copy_engine(engine)
+    push_candle(current, candle)
+
+    return {
+        **candle,
+        **engine_indicators(current, max_candles_in_state),
+    }
+
+
+def init_engine() -> Dict[str, Any]:
+    """
+    Initialize an empty engine.
+    """
+    return {
+        'count': 0,
+        'tails': {series: [] for series in TAIL_SIZES},
+        'sums': {
+            _sum_key(series, window): 0.0
+            for series, windows in ROLLING_WINDOWS.items()
+            for window in windows
+        },
+    }
+
+
+def copy_engine(engine: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy the engine, so it can be updated without modifying the original one.
+    """
+    return {
+        'count': engine['count'],
+        'tails': {series: list(tail) for series, tail in engine['tails'].items()},
+        'sums': dict(engine['sums']),
+    }
+
+
+def push_candle(engine: Dict[str, Any], candle: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Push a new candle into the engine, updating the tails and the running sums.
+
+    Args:
+        engine (Dict[str, Any]): The engine to update in place.
+        candle (Dict[str, Any]): The candle to push.
+
+    Returns:
+        Dict[str, Any]: The updated engine.
+    """
+    tails = engine['tails']
+    high, low, close = candle['high'], candle['low'], candle['close']
+    typical_price = (high + low + close) / 3.0
+    money_flow = typical_price * candle['volume']
+
+    values = {
+        'close': close,
+        'high': high,
+        'low': low,
+        'typical_price': typical_price,
+        'volume': candle['volume'],
+        'gain': 0.0,
+        'loss': 0.0,
+        'true_range': high - low,
+        'money_flow_pos': 0.0,
+        'money_flow_neg': 0.0,
+    }
+
+    # Values that depend on the previous candle, with the same definitions as talib
+    if engine['count'] > 0:
+        prev_close = tails['close'][-1]
+        diff = close - prev_close
+        if diff < 0:
+            values['loss'] = -diff
+        else:
+            values['gain'] = diff
+
+        values['true_range'] = max(
+            high - low, abs(high - prev_close), abs(low - prev_close)
+        )
+
+        diff = typical_price - tails['typical_price'][-1]
+        if diff < 0:
+            values['money_flow_neg'] = money_flow
+        elif diff > 0:
+            values['money_flow_pos'] = money_flow
+
+    for series, value in values.items():
+        tail = tails[series]
+        tail.append(value)
+
+        # Add the new value to the running sums and remove the one leaving the window
+        for window in ROLLING_WINDOWS.get(series, ()):
+            key = _sum_key(series, window)
+            engine['sums'][key] += value
+            if len(tail) > window:
+                engine['sums'][key] -= tail[-window - 1]
+
+        if len(tail) > TAIL_SIZES[series]:
+            del tail[0]
+
+    engine['count'] += 1
+
+    if engine['count'] % RESUM_INTERVAL == 0:
+        for series, windows in ROLLING_WINDOWS.items():
+            for window in windows:
+                engine['sums'][_sum_key(series, window)] = sum(tails[series][-window:])
+
+    return engine
+
+
+def engine_indicators(
+    engine: Dict[str, Any], max_candles_in_state: int
+) -> Dict[str, float]:
+    """
+    Compute the technical indicators from the engine, with the same keys and values
+    as `compute_indicators`.
+
+    Args:
+        engine (Dict[str, Any]): The engine with the latest candle pushed.
+        max_candles_in_state (int): The maximum number of candles we want to keep in the state.
+
+    Returns:
+        Dict[str, float]: The technical indicators.
+    """
+    # talib only sees the candles kept in the state
+    n_candles = min(engine['count'], max_candles_in_state)
+    sums = engine['sums']
+    tails = engine['tails']
+
+    def mean(series: str, window: int) -> float:
+        if n_candles < window:
+            return np.nan
+        return sums[_sum_key(series, window)] / window
+
+    def rsi(window: int) -> float:
+        if n_candles < window + 1:
+            return np.nan
+        avg_gain = sums[_sum_key('gain', window)] / window
+        avg_loss = sums[_sum_key('loss', window)] / window
+        total = avg_gain + avg_loss
+        return 0.0 if _is_zero(total) else 100.0 * (avg_gain / total)
+
+    def tail_array(series: str) -> np.ndarray:
+        return np.array(tails[series][-n_candles:])
+
+    indicators = {}
+
+    # 1. RSI (Relative Strength Index) at 9, 14 and 21
+    indicators['rsi_9'] = rsi(9)
+    indicators['rsi_14'] = rsi(14)
+    indicators['rsi_21'] = rsi(21)
+
+    # 2. MACD, on the bounded tail of closes
+    closes = tail_array('close')
+    indicators['macd'], indicators['macd_signal'], indicators['macd_hist'] = (
+        stream.MACD(closes, fastperiod=10, slowperiod=24, signalperiod=9)
+    )
+
+    # 3. Bollinger Bands, with the population standard deviation as in talib. The
+    # variance is a small difference of large numbers when the price is far from 0,
+    # so it is computed from the last 20 closes instead of running sums
+    middle = mean('close', 20)
+    stddev = np.nan
+    if n_candles >= 20:
+        last_closes = tails['close'][-20:]
+        mean_close = sum(last_closes) / 20
+        mean_square = sum(close * close for close in last_closes) / 20
+        variance = mean_square - mean_close * mean_close
+        stddev = sqrt(variance) if variance >= 1e-14 else 0.0
+    indicators['bbands_upper'] = middle + 2 * stddev
+    indicators['bbands_middle'] = middle
+    indicators['bbands_lower'] = middle - 2 * stddev
+
+    # 4. Stochastic RSI, on the bounded tail of closes
+    indicators['stochrsi_fastk'], indicators['stochrsi_fastd'] = stream.STOCHRSI(
+        closes, timeperiod=10, fastk_period=5, fastd_period=3, fastd_matype=0
+    )
+
+    # 5. ADX, on the bounded tails of highs, lows and closes
+    indicators['adx'] = stream.ADX(
+        tail_array('high'),
+        tail_array('low'),
+        closes[-TAIL_SIZES['high'] :],
+        timeperiod=14,
+    )
+
+    # 6. Volume EMA
+    indicators['volume_ema'] = mean('volume', 10)
+
+    # 7. Ichimoku Cloud
+    indicators['ichimoku_conv'] = mean('close', 9)
+    indicators['ichimoku_base'] = mean('close', 20)
+    indicators['ichimoku_span_a'] = (
+        indicators['ichimoku_conv'] + indicators['ichimoku_base']
+    ) / 2
+    indicators['ichimoku_span_b'] = mean('close', 40)
+
+    # 8. MFI (Money Flow Index)
+    indicators['mfi'] = np.nan
+    if n_candles >= 11:
+        pos = sums[_sum_key('money_flow_pos', 10)]
+        neg = sums[_sum_key('money_flow_neg', 10)]
+        indicators['mfi'] = 0.0 if pos + neg < 1.0 else 100.0 * (pos / (pos + neg))
+
+    # 9. ATR (Average True Range)
+    indicators['atr'] = np.nan if n_candles < 11 else mean('true_range', 10)
+
+    # 10. Price ROC (Rate of Change)
+    indicators['price_roc'] = np.nan
+    if n_candles >= 7:
+        prev_close = tails['close'][-7]
+        indicators['price_roc'] = (
+            ((tails['close'][-1] / prev_close) - 1.0) * 100.0 if prev_close else 0.0
+        )
+
+    # SMA at 7, 14 and 21
+    indicators['sma_7'] = mean('close', 7)
+    indicators['sma_14'] = mean('close', 14)
+    indicators['sma_21'] = mean('close', 21)
+
+    return indicators
+
+
+def _sum_key(series: str, window: int) -> str:
+    return f'{series}_{window}'
+
+
+def _is_zero(value: float) -> bool:
+    # Same threshold as TA_IS_ZERO in talib
+    return -1e-14 < value < 1e-14
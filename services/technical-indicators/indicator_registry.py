@@ -0,0 +1,274 @@
+import inspect
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+from batch_kernels import BATCH_KERNELS
+from pydantic import BaseModel, model_validator
+from talib import abstract, stream
+from talib._ta_lib import _ta_getOptInputParameterInfo
+
+# Columns of the candles the indicators can read
+PRICE_INPUTS = ('open', 'high', 'low', 'close', 'volume')
+
+# The indicators computed by default, the same as before the registry
+DEFAULT_INDICATORS_FILE = Path(__file__).parent / 'indicators.json'
+
+# `talib.stream` only reads the minimum lookback of each function, so stream.EMA(n)
+# is the mean of the last n values, like stream.SMA(n), and both share a computation.
+WINDOW_MEAN_FUNCTIONS = ('SMA', 'EMA')
+
+# The TA_OptInput_IntegerRange and TA_OptInput_IntegerList types of the parameters of
+# TA-Lib, the other ones are floats
+INTEGER_PARAMETER_TYPES = (2, 3)
+
+
+class IndicatorSpec(BaseModel):
+    """
+    An indicator of the registry, computed with a `talib.stream` function.
+
+    The special `MEAN` function averages other indicators defined before it.
+    """
+
+    function: str
+    # The name of the indicator, or of each output for multi-output functions
+    name: Optional[str] = None
+    outputs: Optional[List[str]] = None
+    inputs: List[str] = ['close']
+    params: Dict[str, Union[int, float]] = {}
+
+    @model_validator(mode='after')
+    def check_names(self) -> 'IndicatorSpec':
+        if (self.name is None) == (self.outputs is None):
+            raise ValueError(
+                f'Indicator {self.function} needs either a name or a list of outputs'
+            )
+        return self
+
+    @property
+    def names(self) -> List[str]:
+        return self.outputs or [self.name]
+
+
+class IndicatorPlan:
+    """
+    The execution plan of a list of indicators, compiled once at startup.
+
+    - Identical computations are done once, whatever the names they are given, e.g.
+      EMA(20) and SMA(20) of the closes. The periods of a family, e.g. RSI(9) and
+      RSI(14), are still separate calls.
+    - Each computation is a `talib.stream` call with positional arguments, which
+      only reads the lookback of the function from the most recent values.
+    """
+
+    def __init__(self, specs: List[IndicatorSpec]):
+        self.names: List[str] = []
+        # The candle columns read by the indicators
+        self.inputs: List[str] = []
+        # The number of candles read by the indicator with the longest lookback
+        self.window = 1
+        self._steps: list = []
+        calls: Dict[tuple, _TalibCall] = {}
+
+        for spec in specs:
+            _validate(spec, self.names)
+            function = spec.function.upper()
+
+            if function == 'MEAN':
+                self._steps.append(_Mean(spec.name, spec.inputs))
+            else:
+                if function in WINDOW_MEAN_FUNCTIONS:
+                    function = 'SMA'
+                params = _bind_params(function, spec.params)
+                key = (function, tuple(spec.inputs), params)
+                if key in calls:
+                    self._steps.append(_Alias(calls[key].names, spec.names))
+                else:
+                    calls[key] = _TalibCall(function, spec.inputs, params, spec.names)
+                    self._steps.append(calls[key])
+                    self.window = max(self.window, calls[key].lookback + 1)
+
+            self.names.extend(spec.names)
+            self.inputs.extend(
+                name
+                for name in spec.inputs
+                if name in PRICE_INPUTS and name not in self.inputs
+            )
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path]) -> 'IndicatorPlan':
+        """
+        Compile the indicators of a JSON file, a list of `IndicatorSpec`.
+        """
+        with open(path) as f:
+            specs = [IndicatorSpec(**spec) for spec in json.load(f)]
+        return cls(specs)
+
+    def evaluate(self, columns: Dict[str, np.ndarray]) -> Dict[str, float]:
+        """
+        Compute all the indicators from the columns of the candles.
+
+        Args:
+            columns (Dict[str, np.ndarray]): The candle columns, oldest candle first.
+
+        Returns:
+            Dict[str, float]: The indicators, in the order of the specs.
+        """
+        results: Dict[str, float] = {}
+        for step in self._steps:
+            step.evaluate(columns, results)
+        return {name: results[name] for name in self.names}
+
+    def evaluate_batch(
+        self, columns: Dict[str, np.ndarray], counts: np.ndarray
+    ) -> Dict[str, np.ndarray]:
+        """
+        Compute all the indicators for many pairs at once, with the same values as
+        `evaluate` for each pair, up to floating-point rounding.
+
+        Args:
+            columns (Dict[str, np.ndarray]): The candle columns as 2-D arrays (pairs x candles),
+                with the candles of each pair right-aligned and at least `window` columns.
+            counts (np.ndarray): The number of candles of each pair.
+
+        Returns:
+            Dict[str, np.ndarray]: The indicators of each pair, in the order of the specs.
+        """
+        results: Dict[str, np.ndarray] = {}
+        for step in self._steps:
+            step.evaluate_batch(columns, counts, results)
+        return {name: results[name] for name in self.names}
+
+
+@lru_cache(maxsize=None)
+def default_plan() -> IndicatorPlan:
+    return IndicatorPlan.from_file(DEFAULT_INDICATORS_FILE)
+
+
+def _validate(spec: IndicatorSpec, defined: List[str]) -> None:
+    for name in spec.names:
+        if name in defined:
+            raise ValueError(f'Indicator {name} is defined twice')
+        if name in PRICE_INPUTS:
+            raise ValueError(f'Indicator {name} has the name of a candle column')
+
+    function = spec.function.upper()
+    if function == 'MEAN':
+        if spec.outputs or not spec.inputs:
+            raise ValueError(f'MEAN indicator {spec.name} needs a name and inputs')
+        for name in spec.inputs:
+            if name not in defined:
+                raise ValueError(
+                    f'{spec.name} reads {name}, defined after it or not at all'
+                )
+        return
+
+    for name in spec.inputs:
+        if name not in PRICE_INPUTS:
+            raise ValueError(f'Unknown input {name} of {spec.names}')
+    if not hasattr(stream, function):
+        raise ValueError(f'Unknown talib function {spec.function}')
+
+    info = abstract.Function(function).info
+    if len(spec.names) != len(info['output_names']):
+        raise ValueError(
+            f'{function} has {len(info["output_names"])} outputs, got {spec.names}'
+        )
+    n_inputs = sum(
+        len(value) if isinstance(value, list) else 1
+        for value in info['input_names'].values()
+    )
+    if len(spec.inputs) != n_inputs:
+        raise ValueError(f'{function} needs {n_inputs} inputs, got {spec.inputs}')
+    for param in spec.params:
+        if param not in info['parameters']:
+            raise ValueError(f'Unknown parameter {param} of {function}')
+
+
+def _bind_params(function: str, params: Dict[str, Union[int, float]]) -> tuple:
+    # All the parameters of a talib function in order, which are faster to pass as
+    # positional arguments and identify identical calls. They are cast to their type in
+    # TA-Lib, as some versions report the defaults of the integers as floats
+    defaults = abstract.Function(function).info['parameters']
+    bound = []
+    for index, (name, default) in enumerate(defaults.items()):
+        param_type = _ta_getOptInputParameterInfo(function.encode(), index)['type']
+        cast = int if param_type in INTEGER_PARAMETER_TYPES else float
+        bound.append(cast(params.get(name, default)))
+    return tuple(bound)
+
+
+class _TalibCall:
+    def __init__(
+        self, function: str, inputs: List[str], params: tuple, names: List[str]
+    ):
+        # Skip the wrapper converting pandas and polars series, we only pass arrays
+        self.function = inspect.unwrap(getattr(stream, function))
+        self.kernel = BATCH_KERNELS.get(function)
+        self.inputs = inputs
+        self.args = params
+        self.names = names
+        info = abstract.Function(function)
+        info.set_parameters(dict(zip(info.parameters, params, strict=True)))
+        self.lookback = info.lookback
+
+    def evaluate(self, columns: Dict[str, np.ndarray], results: dict) -> None:
+        outputs = self.function(*[columns[name] for name in self.inputs], *self.args)
+        if len(self.names) == 1:
+            results[self.names[0]] = outputs
+        else:
+            results.update(zip(self.names, outputs, strict=True))
+
+    def evaluate_batch(
+        self, columns: Dict[str, np.ndarray], counts: np.ndarray, results: dict
+    ) -> None:
+        inputs = [columns[name] for name in self.inputs]
+        outputs = self.kernel(inputs, counts, *self.args) if self.kernel else None
+
+        if outputs is None:
+            # No vectorized version, call talib on the candles of each pair
+            width = inputs[0].shape[1]
+            outputs = tuple(np.empty(len(counts)) for _ in self.names)
+            for row, count in enumerate(counts):
+                values = self.function(
+                    *[column[row, width - count :] for column in inputs], *self.args
+                )
+                if len(self.names) == 1:
+                    values = (values,)
+                for output, value in zip(outputs, values, strict=True):
+                    output[row] = value
+
+        results.update(zip(self.names, outputs, strict=True))
+
+
+class _Alias:
+    def __init__(self, sources: List[str], names: List[str]):
+        self.sources = sources
+        self.names = names
+
+    def evaluate(self, columns: Dict[str, np.ndarray], results: dict) -> None:
+        for source, name in zip(self.sources, self.names, strict=True):
+            results[name] = results[source]
+
+    def evaluate_batch(
+        self, columns: Dict[str, np.ndarray], counts: np.ndarray, results: dict
+    ) -> None:
+        self.evaluate(columns, results)
+
+
+class _Mean:
+    def __init__(self, name: str, inputs: List[str]):
+        self.name = name
+        self.inputs = inputs
+
+    def evaluate(self, columns: Dict[str, np.ndarray], results: dict) -> None:
+        results[self.name] = sum(results[name] for name in self.inputs) / len(
+            self.inputs
+        )
+
+    def evaluate_batch(
+        self, columns: Dict[str, np.ndarray], counts: np.ndarray, results: dict
+    ) -> None:
+        self.evaluate(columns, results)
@@ -0,0 +1,489 @@
+import struct
+import time
+from collections import defaultdict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from candle_buffer import COLUMNS, CandleBuffer
+from common.instrumentation import REGISTRY, SampledLogger, StageMetrics
+from common.tracing import LatencyRecorder, now_us, stamp
+from common.wire_format import decode
+from confluent_kafka import KafkaException, TopicPartition
+from indicator_registry import IndicatorPlan
+from loguru import logger
+from quixstreams import Application
+from quixstreams.kafka import Consumer, Producer
+from quixstreams.models import Topic, TopicConfig
+
+# Key of a buffer of candles: the key of the candles (the pair) and the candle seconds
+BufferKey = Tuple[bytes, int]
+
+# Offset of the last candle applied to a buffer, before the buffer in the changelog
+_OFFSET = struct.Struct('<q')
+
+
+def compute_indicators_for_pairs(
+    candles: List[Tuple[Hashable, Dict[str, Any]]],
+    buffers: Dict[Hashable, CandleBuffer],
+    plan: IndicatorPlan,
+    max_candles_in_state: int,
+) -> List[Dict[str, Any]]:
+    """
+    Update the buffers of candles and compute the technical indicators of many pairs at
+    once, with the same values as `update_candles` + `compute_indicators` message by
+    message.
+
+    The candles of a pair are applied in order: the first candle of each pair is
+    computed in a first vectorized pass, the second one in a second pass, and so on.
+
+    Args:
+        candles (List[Tuple[Hashable, Dict[str, Any]]]): The buffer keys and candles.
+        buffers (Dict[Hashable, CandleBuffer]): The buffer of candles of each key, updated in place.
+        plan (IndicatorPlan): The indicators to compute.
+        max_candles_in_state (int): The maximum number of candles to keep per pair.
+
+    Returns:
+        List[Dict[str, Any]]: The candles with the technical indicators, in the input order.
+    """
+    # Split the candles into passes with at most one candle per key
+    passes: List[List[int]] = []
+    n_seen: Dict[Hashable, int] = {}
+    for i, (key, _) in enumerate(candles):
+        n = n_seen.get(key, 0)
+        n_seen[key] = n + 1
+        if n == len(passes):
+            passes.append([])
+        passes[n].append(i)
+
+    messages: List[Dict[str, Any]] = [{} for _ in candles]
+    width = max(max_candles_in_state, plan.window)
+    for indexes in passes:
+        stacked = np.full((len(COLUMNS), len(indexes), width), np.nan)
+        counts = np.empty(len(indexes), dtype=np.int64)
+
+        for row, i in enumerate(indexes):
+            key, candle = candles[i]
+            buffer = buffers.get(key)
+            if buffer is None:
+                buffer = buffers[key] = CandleBuffer(max_candles_in_state)
+            if buffer.is_same_window(candle):
+                buffer.replace_last(candle)
+            else:
+                buffer.append(candle)
+
+            # Stack the history of the pair, right-aligned
+            counts[row] = len(buffer)
+            stacked[:, row, width - len(buffer) :] = buffer.columns()
+
+        columns = {name: stacked[COLUMNS.index(name)] for name in plan.inputs}
+        indicators = plan.evaluate_batch(columns, counts)
+        # Python floats per pair, as in the messages computed one by one
+        rows = zip(*[values.tolist() for values in indicators.values()], strict=True)
+        for i, values in zip(indexes, rows, strict=True):
+            messages[i] = {
+                **candles[i][1],
+                **dict(zip(indicators, values, strict=True)),
+            }
+
+    return messages
+
+
+def buffers_topic_config(input_topic_config: TopicConfig) -> TopicConfig:
+    """
+    The config of the changelog topic of the buffers of candles: compacted, with the
+    partitions of the candles topic.
+    """
+    return TopicConfig(
+        num_partitions=input_topic_config.num_partitions,
+        replication_factor=input_topic_config.replication_factor,
+        extra_config={'cleanup.policy': 'compact'},
+    )
+
+
+def buffers_topic_name(consumer_group: str, input_topic_name: str) -> str:
+    """
+    The name of the changelog topic of the buffers of candles, like the changelog
+    topics of the state stores.
+    """
+    return f'changelog__{consumer_group}--{input_topic_name}--micro-batch-buffers'
+
+
+def _changelog_key(key: BufferKey) -> bytes:
+    pair, seconds = key
+    return b'%d:' % seconds + pair
+
+
+def _parse_changelog_key(data: bytes) -> BufferKey:
+    seconds, _, pair = data.partition(b':')
+    return pair, int(seconds)
+
+
+class MicroBatchRunner:
+    """
+    Consume the candles in micro-batches, compute the technical indicators of all the
+    pairs of a batch at once, and produce them.
+
+    The buffers of candles are kept in memory, and written to a compacted changelog
+    topic before the offsets are committed, in the partition of their candles, with
+    the offset of the last candle applied to them. When partitions are assigned, their
+    buffers are restored from the changelog, and the candles already applied to them
+    are skipped, so a restart or a rebalance doesn't reset the indicators. The buffers
+    of revoked or lost partitions are dropped.
+    """
+
+    def __init__(
+        self,
+        app: Application,
+        input_topic: Topic,
+        output_topic: Topic,
+        buffers_topic: Topic,
+        max_candles_in_state: Dict[int, int],
+        plan: IndicatorPlan,
+        batch_ms: int,
+        max_batch_size: int = 10_000,
+        commit_interval_seconds: float = 5.0,
+        recorder: Optional[LatencyRecorder] = None,
+        stage_metrics: Optional[StageMetrics] = None,
+        sampled_logger: Optional[SampledLogger] = None,
+    ):
+        """
+        Args:
+            app (Application): The application, to create the consumers and the producer.
+            input_topic (Topic): The topic of the candles.
+            output_topic (Topic): The topic of the technical indicators.
+            buffers_topic (Topic): The compacted changelog topic of the buffers of candles, see `buffers_topic_config`.
+            max_candles_in_state (Dict[int, int]): The maximum number of candles to keep for each candle seconds to compute.
+            plan (IndicatorPlan): The indicators to compute.
+            batch_ms (int): The maximum duration of a micro-batch.
+            max_batch_size (int): The maximum number of candles of a micro-batch.
+            commit_interval_seconds (float): How often to write the buffers and commit the offsets.
+            recorder (Optional[LatencyRecorder]): Add the in and out times of the stage to the headers, and record its latencies.
+            stage_metrics (Optional[StageMetrics]): Count the messages and time the computation of each batch.
+            sampled_logger (Optional[SampledLogger]): Log a sample of the messages.
+        """
+        self.app = app
+        self.input_topic = input_topic
+        self.output_topic = output_topic
+        self.buffers_topic = buffers_topic
+        self.max_candles_in_state = max_candles_in_state
+        self.plan = plan
+        self.batch_ms = batch_ms
+        self.max_batch_size = max_batch_size
+        self.commit_interval_seconds = commit_interval_seconds
+        self.recorder = recorder
+        self.stage_metrics = stage_metrics
+        self.sampled_logger = sampled_logger
+
+        self.buffers: Dict[BufferKey, CandleBuffer] = {}
+        # The partition and offset of the last candle applied to each buffer, and the
+        # buffers updated since they were last written to the changelog
+        self.applied: Dict[BufferKey, Tuple[int, int]] = {}
+        self.dirty: Set[BufferKey] = set()
+        # The candles of the current batch, and the offset of the last message of each
+        # partition processed in the previous batches, not committed yet
+        self.batch: List[Tuple[bytes, Dict[str, Any], Any, int, int]] = []
+        self.batch_offsets: Dict[int, int] = {}
+        self.processed_offsets: Dict[int, int] = {}
+
+        self._consumer: Optional[Consumer] = None
+        self._producer: Optional[Producer] = None
+
+        REGISTRY.gauge(
+            'candle_buffers', 'Number of buffers of candles, one per pair and timeframe'
+        ).set_function(lambda: len(self.buffers))
+
+    def run(self) -> None:
+        """
+        Process the micro-batches until the process is stopped.
+        """
+        # Create the topics with their partitions if they don't exist yet, as `app.run` does
+        self.app.setup_topics()
+
+        last_commit_time = time.monotonic()
+        with (
+            self.app.get_consumer(auto_commit_enable=False) as consumer,
+            self.app.get_producer() as producer,
+        ):
+            self._consumer, self._producer = consumer, producer
+            consumer.subscribe(
+                [self.input_topic.name],
+                on_assign=self._on_assign,
+                on_revoke=self._on_revoke,
+                on_lost=self._on_lost,
+            )
+
+            while True:
+                self._collect_batch()
+                self._process_batch()
+
+                if time.monotonic() - last_commit_time >= self.commit_interval_seconds:
+                    self._checkpoint(list(self.processed_offsets))
+                    last_commit_time = time.monotonic()
+
+    def _collect_batch(self) -> None:
+        # Collect the candles until the batch is full or the time is up
+        self.batch = []
+        self.batch_offsets = {}
+        deadline = time.monotonic() + self.batch_ms / 1000
+        while len(self.batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            msg = self._consumer.poll(timeout=timeout)
+            if msg is None:
+                continue
+            if msg.error():
+                logger.error(f'Kafka error: {msg.error()}')
+                continue
+
+            partition, offset = msg.partition(), msg.offset()
+            self.batch_offsets[partition] = offset
+            candle = decode(msg.value())
+            # Only keep candles with one of the window sizes to compute, and skip the
+            # ones already applied to a restored buffer (their messages were produced)
+            seconds = candle.get('candle_seconds')
+            if seconds not in self.max_candles_in_state:
+                continue
+            applied = self.applied.get((msg.key(), seconds))
+            if applied is not None and applied[0] == partition and offset <= applied[1]:
+                continue
+
+            headers = msg.headers()
+            if self.recorder is not None:
+                headers = stamp(headers, self.recorder.stage, 'in')
+            self.batch.append((msg.key(), candle, headers, partition, offset))
+
+    def _process_batch(self) -> None:
+        start = time.perf_counter()
+        produced = 0
+
+        # Group the candles by timeframe, keeping their order within each one
+        timeframes: Dict[int, list] = defaultdict(list)
+        timeframe_candles: Dict[int, list] = defaultdict(list)
+        for key, candle, headers, partition, offset in self.batch:
+            seconds = candle['candle_seconds']
+            timeframes[seconds].append(((key, seconds), candle))
+            timeframe_candles[seconds].append((headers, partition, offset))
+
+        for seconds, candles in timeframes.items():
+            messages = compute_indicators_for_pairs(
+                candles, self.buffers, self.plan, self.max_candles_in_state[seconds]
+            )
+            for (buffer_key, _), (headers, partition, offset), message in zip(
+                candles, timeframe_candles[seconds], messages, strict=True
+            ):
+                self.applied[buffer_key] = (partition, offset)
+                self.dirty.add(buffer_key)
+
+                if self.sampled_logger is not None:
+                    self.sampled_logger.log('final message', message)
+                if self.recorder is not None:
+                    out_us = now_us()
+                    self.recorder.record(headers, message, out_us)
+                    headers = stamp(headers, self.recorder.stage, 'out', out_us)
+                serialized = self.output_topic.serialize(
+                    key=buffer_key[0], value=message
+                )
+                self._producer.produce(
+                    topic=self.output_topic.name,
+                    key=serialized.key,
+                    value=serialized.value,
+                    headers=headers,
+                    # The partition of the candle, see common.partitioning
+                    partition=partition,
+                )
+                produced += 1
+
+        if self.stage_metrics is not None and self.batch:
+            self.stage_metrics.batch(
+                len(self.batch), produced, time.perf_counter() - start
+            )
+
+        self.processed_offsets.update(self.batch_offsets)
+        self.batch = []
+        self.batch_offsets = {}
+
+    def _checkpoint(self, partitions: Iterable[int]) -> None:
+        """
+        Write the updated buffers of the partitions to the changelog, then commit the
+        offsets of their processed candles, once the messages are delivered.
+        """
+        partitions = set(partitions)
+        if not partitions:
+            return
+
+        # The indicators of the candles first, so the candles applied to a buffer in
+        # the changelog are never produced again
+        self._producer.flush()
+        for key in [key for key in self.dirty if self.applied[key][0] in partitions]:
+            partition, offset = self.applied[key]
+            self._producer.produce(
+                topic=self.buffers_topic.name,
+                key=_changelog_key(key),
+                value=_OFFSET.pack(offset) + self.buffers[key].to_bytes(),
+                partition=partition,
+            )
+            self.dirty.discard(key)
+        self._producer.flush()
+
+        offsets = [
+            TopicPartition(self.input_topic.name, partition, offset + 1)
+            for partition, offset in self.processed_offsets.items()
+            if partition in partitions
+        ]
+        if offsets:
+            try:
+                self._consumer.commit(offsets=offsets, asynchronous=False)
+            except KafkaException as e:
+                # E.g. during a rebalance. The candles are consumed again, and the ones
+                # in the buffers written above are skipped
+                logger.warning(f'Failed to commit the offsets {offsets}: {e}')
+        for partition in partitions:
+            self.processed_offsets.pop(partition, None)
+
+    def _on_assign(self, _, partitions: List[TopicPartition]) -> None:
+        assigned = [partition.partition for partition in partitions]
+        if not assigned:
+            return
+        restored = self._restore(assigned)
+        logger.info(f'Restored {restored} buffers of candles of partitions {assigned}')
+
+    def _on_revoke(self, _, partitions: List[TopicPartition]) -> None:
+        revoked = {partition.partition for partition in partitions}
+        # The candles of the current batch are consumed again by the next owner
+        self._drop_batch(revoked)
+        self._checkpoint(revoked)
+        self._drop_buffers(revoked)
+        logger.info(f'Dropped the buffers of candles of revoked partitions {revoked}')
+
+    def _on_lost(self, _, partitions: List[TopicPartition]) -> None:
+        lost = {partition.partition for partition in partitions}
+        # Another consumer may own them already, so nothing is committed
+        self._drop_batch(lost)
+        for partition in lost:
+            self.processed_offsets.pop(partition, None)
+        self._drop_buffers(lost)
+        logger.warning(f'Dropped the buffers of candles of lost partitions {lost}')
+
+    def _drop_batch(self, partitions: Set[int]) -> None:
+        self.batch = [candle for candle in self.batch if candle[3] not in partitions]
+        for partition in partitions:
+            self.batch_offsets.pop(partition, None)
+
+    def _drop_buffers(self, partitions: Set[int]) -> None:
+        for key in [key for key, (p, _) in self.applied.items() if p in partitions]:
+            self.buffers.pop(key, None)
+            self.applied.pop(key)
+            self.dirty.discard(key)
+
+    def _restore(self, partitions: List[int]) -> int:
+        """
+        Read the buffers of the partitions from the changelog, up to its end.
+
+        Returns:
+            int: The number of buffers restored.
+        """
+        restored: Set[BufferKey] = set()
+        with Consumer(
+            broker_address=self.app.config.broker_address,
+            consumer_group=self.app.config.consumer_group,
+            auto_offset_reset='earliest',
+            auto_commit_enable=False,
+        ) as consumer:
+            # The offset of the last message of each partition when the restore starts
+            ends: Dict[int, int] = {}
+            starts = []
+            for partition in partitions:
+                low, high = consumer.get_watermark_offsets(
+                    TopicPartition(self.buffers_topic.name, partition), timeout=30
+                )
+                if high > low:
+                    ends[partition] = high - 1
+                    starts.append(
+                        TopicPartition(self.buffers_topic.name, partition, low)
+                    )
+            if not ends:
+                return 0
+            consumer.incremental_assign(starts)
+
+            while ends:
+                msg = consumer.poll(timeout=1.0)
+                if msg is None:
+                    continue
+                if msg.error():
+                    logger.error(
+                        f'Kafka error while restoring the buffers: {msg.error()}'
+                    )
+                    continue
+
+                partition = msg.partition()
+                end = ends.get(partition)
+                if end is None:
+                    continue
+                if msg.offset() >= end:
+                    del ends[partition]
+                    consumer.incremental_unassign(
+                        [TopicPartition(self.buffers_topic.name, partition)]
+                    )
+                key = _parse_changelog_key(msg.key())
+                capacity = self.max_candles_in_state.get(key[1])
+                if capacity is None:
+                    # A timeframe that is not computed anymore
+                    continue
+
+                value = msg.value()
+                (offset,) = _OFFSET.unpack_from(value)
+                self.buffers[key] = CandleBuffer.from_bytes(
+                    value[_OFFSET.size :], capacity
+                )
+                self.applied[key] = (partition, offset)
+                self.dirty.discard(key)
+                restored.add(key)
+
+        return len(restored)
+
+
+def run_micro_batches(
+    app: Application,
+    input_topic: Topic,
+    output_topic: Topic,
+    buffers_topic: Topic,
+    max_candles_in_state: Dict[int, int],
+    plan: IndicatorPlan,
+    batch_ms: int,
+    max_batch_size: int = 10_000,
+    commit_interval_seconds: float = 5.0,
+    recorder: Optional[LatencyRecorder] = None,
+    stage_metrics: Optional[StageMetrics] = None,
+    sampled_logger: Optional[SampledLogger] = None,
+):
+    """
+    Consume the candles in micro-batches of up to `batch_ms` milliseconds, compute the
+    technical indicators of all the pairs of a batch at once, and produce them.
+
+    `max_candles_in_state` is the maximum number of candles to keep for each candle
+    seconds to compute. The candles of each timeframe are computed in their own
+    vectorized calls, with a buffer per pair and timeframe.
+
+    The buffers of candles are written to the `buffers_topic` changelog and restored
+    from it, see `MicroBatchRunner`. The offsets are committed once the messages are
+    delivered, so messages are produced at least once.
+
+    With a `recorder`, the in and out times of the stage are added to the headers of
+    each candle, and its latencies are recorded. The `stage_metrics` count the
+    messages and time the computation of each batch.
+    """
+    MicroBatchRunner(
+        app,
+        input_topic,
+        output_topic,
+        buffers_topic,
+        max_candles_in_state,
+        plan,
+        batch_ms,
+        max_batch_size=max_batch_size,
+        commit_interval_seconds=commit_interval_seconds,
+        recorder=recorder,
+        stage_metrics=stage_metrics,
+        sampled_logger=sampled_logger,
+    ).run()
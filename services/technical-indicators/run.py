@@ -1,9 +1,31 @@
 from functools import partial
+from typing import Dict, List, Optional
 
-from candle import update_candles
+from candle_buffer import state_dumps, state_loads
+from common.instrumentation import (
+    REGISTRY,
+    SampledLogger,
+    StageMetrics,
+    consumer_stats_config,
+    directory_bytes,
+    start_metrics_server,
+)
+from common.partitioning import (
+    check_copartitioned,
+    to_topic_copartitioned,
+    topic_config,
+)
+from common.tracing import LatencyRecorder, stamp_in, stamp_out
+from common.wire_format import WireDeserializer, WireFormat, WireSerializer
+from debounce import IndicatorDebouncer
+from incremental_indicators import compute_indicators_incremental
+from indicator_registry import DEFAULT_INDICATORS_FILE, IndicatorPlan
 from loguru import logger
+from micro_batch import buffers_topic_config, buffers_topic_name, run_micro_batches
 from quixstreams import Application
-from technical_indicators import compute_indicators
+from quixstreams.state.rocksdb import RocksDBOptions
+from technical_indicators import update_candles_and_compute_indicators
+from timeframes import TimeframeRouter, parse_max_candles
 
 
 def main(
@@ -12,7 +34,18 @@ def main(
     kafka_output_topic: str,
     kafka_consumer_group: str,
     max_candles_in_state: int,
-    candle_seconds: int,
+    candle_seconds: List[int],
+    incremental_indicators: bool = False,
+    indicators_file: str = str(DEFAULT_INDICATORS_FILE),
+    micro_batch_ms: int = 0,
+    debounce_interval_ms: int = 0,
+    max_candles_in_state_by_timeframe: Optional[Dict[int, int]] = None,
+    latency_tracing: bool = True,
+    metrics_port: int = 0,
+    log_sample_rate: float = 0.001,
+    wire_format: WireFormat = 'binary',
+    topic_partitions: int = 1,
+    topic_replication_factor: int = 1,
 ):
     """
     3 steps:
@@ -26,7 +59,18 @@ def main(
         kafka_output_topic (str): The topic to send technical indicators to
         kafka_consumer_group (str): The consumer group to use
         max_candles_in_state (int): The maximum number of candles to keep in the state
-        candle_seconds (int): The number of seconds per candle
+        candle_seconds (List[int]): The number of seconds per candle of each timeframe to compute
+        incremental_indicators (bool): Compute the indicators from running sums kept in the state instead of the list of candles
+        indicators_file (str): The JSON file defining the indicators, not used by the incremental indicators
+        micro_batch_ms (int): Compute the indicators of all the pairs in micro-batches of this many milliseconds, 0 to compute them message by message. Not with the incremental indicators
+        debounce_interval_ms (int): Recompute the indicators of a pair at most once per this many milliseconds within a window, 0 to recompute them on every candle
+        max_candles_in_state_by_timeframe (Optional[Dict[int, int]]): The maximum number of candles to keep in the state for some of the timeframes, instead of `max_candles_in_state`
+        latency_tracing (bool): Add the in and out times of the service to the headers of the messages, and log its latency
+        metrics_port (int): The port of the Prometheus metrics endpoint, 0 to disable it
+        log_sample_rate (float): The fraction of the messages logged
+        wire_format (WireFormat): The format of the indicators, 'binary' or 'json'. The candles can be in both
+        topic_partitions (int): The number of partitions of the topics, if they are created
+        topic_replication_factor (int): The replication factor of the topics, if they are created
     Returns:
         None
     """
@@ -37,38 +81,137 @@ def main(
     logger.info(f'Kafka consumer group: {kafka_consumer_group}')
     logger.info(f'Number of candles in state: {max_candles_in_state}')
     logger.info(f'Candle seconds: {candle_seconds}')
+    logger.info(f'Incremental indicators: {incremental_indicators}')
+    logger.info(f'Indicators file: {indicators_file}')
+    logger.info(f'Micro-batch ms: {micro_batch_ms}')
+    logger.info(f'Debounce interval ms: {debounce_interval_ms}')
+    logger.info(f'Latency tracing: {latency_tracing}')
+    logger.info(f'Metrics port: {metrics_port}')
+    logger.info(f'Log sample rate: {log_sample_rate}')
+    logger.info(f'Wire format: {wire_format}')
+    logger.info(f'Topic partitions: {topic_partitions}')
+
+    max_candles = parse_max_candles(
+        candle_seconds, max_candles_in_state, max_candles_in_state_by_timeframe or {}
+    )
+    logger.info(f'Number of candles in state by timeframe: {max_candles}')
+
+    # Compile the indicators once, so a typo in the file fails at startup
+    plan = IndicatorPlan.from_file(indicators_file)
+    logger.info(f'Indicators: {plan.names}')
+
     app = Application(
         broker_address=kafka_broker_address,
         consumer_group=kafka_consumer_group,
+        # Store the candle buffer as raw bytes instead of JSON
+        rocksdb_options=RocksDBOptions(dumps=state_dumps, loads=state_loads),
+        # Report the consumer lag to the metrics
+        consumer_extra_config=consumer_stats_config(),
     )
 
-    # Define the input and output topics of our streaming application
+    if metrics_port:
+        REGISTRY.gauge('state_bytes', 'Size of the state on disk').set_function(
+            lambda: directory_bytes(app.config.state_dir)
+        )
+        start_metrics_server(metrics_port)
+    stage_metrics = StageMetrics('technical-indicators')
+    sampled_logger = SampledLogger(log_sample_rate)
+
+    # Define the input and output topics of our streaming application, created with the
+    # same partitions if they don't exist yet
+    new_topic_config = topic_config(topic_partitions, topic_replication_factor)
     input_topic = app.topic(
         name=kafka_input_topic,
-        value_serializer='json',
+        value_deserializer=WireDeserializer(),
+        config=new_topic_config,
     )
     output_topic = app.topic(
         name=kafka_output_topic,
-        value_serializer='json',
+        value_serializer=WireSerializer(wire_format),
+        config=new_topic_config,
     )
 
+    # The indicators are produced to the partition of their candle, so the output
+    # topic can't have fewer partitions, e.g. if it existed before
+    app.setup_topics()
+    check_copartitioned(app, input_topic, output_topic)
+
+    recorder = LatencyRecorder('technical-indicators') if latency_tracing else None
+
+    if micro_batch_ms > 0:
+        # Consume the candles in micro-batches and compute the indicators of all the
+        # pairs of a batch in a few vectorized calls, with the buffers of candles in a
+        # compacted changelog topic, to restore them after a restart or a rebalance
+        buffers_topic = app.topic(
+            name=buffers_topic_name(kafka_consumer_group, kafka_input_topic),
+            key_serializer='bytes',
+            value_serializer='bytes',
+            key_deserializer='bytes',
+            value_deserializer='bytes',
+            config=buffers_topic_config(new_topic_config),
+        )
+        run_micro_batches(
+            app,
+            input_topic,
+            output_topic,
+            buffers_topic,
+            max_candles_in_state=max_candles,
+            plan=plan,
+            batch_ms=micro_batch_ms,
+            recorder=recorder,
+            stage_metrics=stage_metrics,
+            sampled_logger=sampled_logger,
+        )
+        return
+
     # Create a streaming dataframe from the input topic, so we can start transforming the data in real-time
     sdf = app.dataframe(topic=input_topic)
+    sdf = sdf.update(stage_metrics.message_in)
 
-    # Only keep candles with the same window size as the candle_seconds
-    sdf = sdf[sdf['candle_seconds'] == candle_seconds]
+    if recorder is not None:
+        sdf = sdf.set_headers(stamp_in(recorder.stage))
 
-    # Update the list of candles in the state
-    sdf = sdf.apply(
-        partial(update_candles, max_candles_in_state=max_candles_in_state),
-        stateful=True,
-    )
+    # Build the function of each timeframe, with its own number of candles in state
+    functions = {}
+    for seconds, max_candles_of_timeframe in max_candles.items():
+        if incremental_indicators:
+            # Update the running sums in the state and compute the technical
+            # indicators from them, in constant time per candle
+            compute = partial(
+                compute_indicators_incremental,
+                max_candles_in_state=max_candles_of_timeframe,
+            )
+        else:
+            # Update the list of candles in the state and compute the technical
+            # indicators from them
+            compute = partial(
+                update_candles_and_compute_indicators,
+                max_candles_in_state=max_candles_of_timeframe,
+                plan=plan,
+            )
+
+        if debounce_interval_ms > 0:
+            # Skip the intermediate updates of a candle that arrive less than the
+            # interval after the last computed one, except in the last interval of the
+            # window, and compute the skipped last one with the next candle of the pair
+            compute = IndicatorDebouncer(debounce_interval_ms, compute)
+        functions[seconds] = compute
+
+    # Each candle is computed with the state of its pair and timeframe. The first one
+    # takes over the candles of the versions with a single timeframe
+    router = TimeframeRouter(functions, legacy_candle_seconds=candle_seconds[0])
+
+    # Only keep candles with one of the window sizes of candle_seconds
+    sdf = sdf.filter(router.accepts)
 
-    # Compute the technical indicators from the candles in the state
-    sdf = sdf.apply(compute_indicators, stateful=True)
+    sdf = sdf.apply(router, stateful=True, expand=debounce_interval_ms > 0)
 
-    sdf = sdf.update(lambda value: logger.info(f'final message: {value}'))
-    sdf = sdf.to_topic(output_topic)
+    sdf = sdf.update(lambda value: sampled_logger.log('final message', value))
+    sdf = sdf.update(stage_metrics.message_out)
+    if recorder is not None:
+        sdf = sdf.set_headers(stamp_out(recorder))
+    # Keep the indicators of a pair in the partition of its candles
+    sdf = to_topic_copartitioned(sdf, output_topic)
 
     app.run()
 
@@ -83,4 +226,15 @@ if __name__ == '__main__':
         kafka_consumer_group=config.kafka_consumer_group,
         max_candles_in_state=config.max_candles_in_state,
         candle_seconds=config.candle_seconds,
+        incremental_indicators=config.incremental_indicators,
+        indicators_file=config.indicators_file,
+        micro_batch_ms=config.micro_batch_ms,
+        debounce_interval_ms=config.debounce_interval_ms,
+        max_candles_in_state_by_timeframe=config.max_candles_in_state_by_timeframe,
+        latency_tracing=config.latency_tracing,
+        metrics_port=config.metrics_port,
+        log_sample_rate=config.log_sample_rate,
+        wire_format=config.wire_format,
+        topic_partitions=config.kafka_topic_partitions,
+        topic_replication_factor=config.kafka_topic_replication_factor,
     )
@@ -0,0 +1,77 @@
+"""
+The candles and states shared by the tests.
+"""
+
+import math
+from functools import partial
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import pytest
+from candle_buffer import state_dumps, state_loads
+from common.state import MemoryState
+
+
+def candle_updates(
+    n_windows: int,
+    max_updates_per_window: int,
+    seed: int = 42,
+    start_price: float = 100.0,
+    volatility: float = 0.002,
+) -> List[Dict[str, Any]]:
+    """
+    The candles of a pair as emitted by the candles service: a random number of
+    updates of the candle of each window, each one with the trades so far, whose
+    prices follow a random walk from `start_price`. The updates of a window are evenly
+    spread over it.
+    """
+    rng = np.random.default_rng(seed)
+    window_ms = 60_000
+    price = start_price
+    candles = []
+    for window in range(n_windows):
+        start = 1_700_000_000_000 + window * window_ms
+        candle = None
+        n_updates = int(rng.integers(1, max_updates_per_window + 1))
+        for update in range(n_updates):
+            price *= math.exp(rng.normal(0, volatility))
+            volume = float(rng.exponential(0.5))
+            if candle is None:
+                candle = {
+                    'pair': 'BTC/USD',
+                    'open': price,
+                    'high': price,
+                    'low': price,
+                    'close': price,
+                    'volume': volume,
+                    'window_start_ms': start,
+                    'window_end_ms': start + window_ms,
+                    'candle_seconds': 60,
+                }
+            else:
+                candle = {
+                    **candle,
+                    'high': max(candle['high'], price),
+                    'low': min(candle['low'], price),
+                    'close': price,
+                    'volume': candle['volume'] + volume,
+                }
+            candle['timestamp_ms'] = start + window_ms * (update + 1) // (n_updates + 1)
+            candles.append(candle)
+    return candles
+
+
+@pytest.fixture
+def make_candle_updates() -> Callable[..., List[Dict[str, Any]]]:
+    """
+    The candle updates of a pair, see `candle_updates`.
+    """
+    return candle_updates
+
+
+@pytest.fixture
+def make_state() -> Callable[[], MemoryState]:
+    """
+    Empty states of a pair, serialized like the state store.
+    """
+    return partial(MemoryState, state_dumps, state_loads)
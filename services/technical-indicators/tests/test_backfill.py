@@ -0,0 +1,57 @@
+"""
+The offline backfill against the streaming path, on random trades.
+"""
+
+import json
+
+import pytest
+from backfill import CANDLE_COLUMNS, build_candles, compute_indicators_batch
+from backfill_parity import make_trades, stream_messages
+from indicator_registry import DEFAULT_INDICATORS_FILE, IndicatorPlan, default_plan
+
+CANDLE_SECONDS = 60
+
+
+def assert_same_messages(backfill, messages) -> None:
+    assert len(backfill) == len(messages)
+    assert list(backfill.columns) == list(messages[0])
+    for row, message in zip(backfill.to_dict('records'), messages, strict=True):
+        for column, value in message.items():
+            if isinstance(value, str):
+                assert row[column] == value
+            else:
+                assert row[column] == pytest.approx(
+                    value, rel=1e-9, abs=1e-9, nan_ok=True
+                ), (message['pair'], message['window_start_ms'], column)
+
+
+def test_matches_stream_messages():
+    trades = make_trades(n_trades=20_000, n_pairs=3)
+
+    backfill = compute_indicators_batch(build_candles(trades, CANDLE_SECONDS))
+
+    assert list(backfill.columns) == [*CANDLE_COLUMNS, *default_plan().names]
+    assert_same_messages(
+        backfill,
+        stream_messages(trades, CANDLE_SECONDS, max_candles_in_state=60),
+    )
+
+
+def test_follows_the_registry(tmp_path):
+    # A registry with an indicator added and one removed
+    with open(DEFAULT_INDICATORS_FILE) as f:
+        specs = [spec for spec in json.load(f) if spec.get('name') != 'sma_7']
+    specs.append({'name': 'wma_5', 'function': 'WMA', 'params': {'timeperiod': 5}})
+    indicators_file = tmp_path / 'indicators.json'
+    indicators_file.write_text(json.dumps(specs))
+    plan = IndicatorPlan.from_file(indicators_file)
+
+    trades = make_trades(n_trades=5_000, n_pairs=2)
+    backfill = compute_indicators_batch(build_candles(trades, CANDLE_SECONDS), plan)
+
+    assert list(backfill.columns) == [*CANDLE_COLUMNS, *plan.names]
+    assert 'wma_5' in backfill and 'sma_7' not in backfill
+    assert_same_messages(
+        backfill,
+        stream_messages(trades, CANDLE_SECONDS, max_candles_in_state=60, plan=plan),
+    )
@@ -0,0 +1,82 @@
+"""
+The debounced indicators against the indicators of every candle update.
+"""
+
+from functools import partial
+from typing import Any, Dict, List
+
+import pytest
+from debounce import IndicatorDebouncer
+from technical_indicators import update_candles_and_compute_indicators
+
+INTERVAL_MS = 15_000
+
+
+def last_message_by_window(messages: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    return {message['window_start_ms']: message for message in messages}
+
+
+@pytest.mark.parametrize('clustered', [False, True])
+def test_last_message_of_each_window(make_candle_updates, make_state, clustered):
+    candles = make_candle_updates(n_windows=200, max_updates_per_window=8)
+    if clustered:
+        # All the updates at the start of their window, so the final candles are
+        # skipped and computed with the first candle of the next window
+        candles = [
+            {
+                **candle,
+                'timestamp_ms': candle['window_start_ms']
+                + (candle['timestamp_ms'] - candle['window_start_ms']) // 100,
+            }
+            for candle in candles
+        ]
+    compute = partial(update_candles_and_compute_indicators, max_candles_in_state=30)
+    debouncer = IndicatorDebouncer(INTERVAL_MS, compute)
+
+    state = make_state()
+    expected = [compute(dict(candle), state) for candle in candles]
+    state = make_state()
+    actual = [
+        message for candle in candles for message in debouncer(dict(candle), state)
+    ]
+
+    # Fewer computations, with the final ones of each window
+    assert debouncer.skipped > 0
+    assert len(actual) == debouncer.computed < len(expected)
+    expected_last = last_message_by_window(expected)
+    actual_last = last_message_by_window(actual)
+    if clustered:
+        # The final candle of the last window waits for a candle of a later one
+        last_window_start_ms = max(expected_last)
+        assert state.get('debounce_pending')['window_start_ms'] == last_window_start_ms
+        del expected_last[last_window_start_ms]
+    for window_start_ms, message in expected_last.items():
+        assert actual_last[window_start_ms] == pytest.approx(message, nan_ok=True)
+
+
+def test_final_candle_in_last_interval_is_computed_at_once(
+    make_candle_updates, make_state
+):
+    # Each update of a window is less than the interval after the previous one, and
+    # the last one is in the last interval of the window
+    candles = make_candle_updates(n_windows=3, max_updates_per_window=1)
+    window_ms = candles[0]['window_end_ms'] - candles[0]['window_start_ms']
+    updates = []
+    for candle in candles:
+        for offset_ms in range(1_000, window_ms, 4_000):
+            updates.append(
+                {**candle, 'timestamp_ms': candle['window_start_ms'] + offset_ms}
+            )
+    compute = partial(update_candles_and_compute_indicators, max_candles_in_state=30)
+    debouncer = IndicatorDebouncer(INTERVAL_MS, compute)
+
+    state = make_state()
+    for update in updates:
+        messages = debouncer(dict(update), state)
+        if update['timestamp_ms'] + INTERVAL_MS >= update['window_end_ms']:
+            assert [message['timestamp_ms'] for message in messages] == [
+                update['timestamp_ms']
+            ]
+
+    # Nothing is left to compute with a later candle, even for the last window
+    assert state.get('debounce_pending') is None
@@ -0,0 +1,143 @@
+"""
+The incremental indicators against the talib values of the list of candles.
+"""
+
+from typing import Any, Dict, List
+
+import numpy as np
+import pytest
+from incremental_indicators import (
+    RESUM_INTERVAL,
+    ROLLING_WINDOWS,
+    compute_indicators_incremental,
+    init_engine,
+    push_candle,
+)
+from talib import stream
+
+# The running sums drift from the talib sums by a few ulps per candle, and the
+# indicators close to 0 (e.g. the MACD histogram) are compared in absolute terms
+RELATIVE_TOLERANCE = 1e-9
+ABSOLUTE_TOLERANCE = 1e-9
+
+
+def update_candles(
+    candles: List[Dict[str, Any]], candle: Dict[str, Any], max_candles: int
+) -> None:
+    """
+    Replace the last candle with an update of its window, or append a new window.
+    """
+    if candles and candles[-1]['window_start_ms'] == candle['window_start_ms']:
+        candles[-1] = candle
+    else:
+        candles.append(candle)
+    del candles[:-max_candles]
+
+
+def talib_indicators(candles: List[Dict[str, Any]]) -> Dict[str, float]:
+    """
+    The indicators computed with `talib.stream` over the whole list of candles, as
+    before the registry and the incremental engine, so a drift shared by both is seen.
+    """
+    highs, lows, closes, volumes = (
+        np.array([candle[name] for candle in candles])
+        for name in ('high', 'low', 'close', 'volume')
+    )
+    macd, macd_signal, macd_hist = stream.MACD(
+        closes, fastperiod=10, slowperiod=24, signalperiod=9
+    )
+    bbands_upper, bbands_middle, bbands_lower = stream.BBANDS(
+        closes, timeperiod=20, nbdevup=2, nbdevdn=2, matype=0
+    )
+    stochrsi_fastk, stochrsi_fastd = stream.STOCHRSI(
+        closes, timeperiod=10, fastk_period=5, fastd_period=3, fastd_matype=0
+    )
+    ichimoku_conv = stream.EMA(closes, timeperiod=9)
+    ichimoku_base = stream.EMA(closes, timeperiod=20)
+    return {
+        'rsi_9': stream.RSI(closes, timeperiod=9),
+        'rsi_14': stream.RSI(closes, timeperiod=14),
+        'rsi_21': stream.RSI(closes, timeperiod=21),
+        'macd': macd,
+        'macd_signal': macd_signal,
+        'macd_hist': macd_hist,
+        'bbands_upper': bbands_upper,
+        'bbands_middle': bbands_middle,
+        'bbands_lower': bbands_lower,
+        'stochrsi_fastk': stochrsi_fastk,
+        'stochrsi_fastd': stochrsi_fastd,
+        'adx': stream.ADX(highs, lows, closes, timeperiod=14),
+        'volume_ema': stream.EMA(volumes, timeperiod=10),
+        'ichimoku_conv': ichimoku_conv,
+        'ichimoku_base': ichimoku_base,
+        'ichimoku_span_a': (ichimoku_conv + ichimoku_base) / 2,
+        'ichimoku_span_b': stream.EMA(closes, timeperiod=40),
+        'mfi': stream.MFI(highs, lows, closes, volumes, timeperiod=10),
+        'atr': stream.ATR(highs, lows, closes, timeperiod=10),
+        'price_roc': stream.ROC(closes, timeperiod=6),
+        'sma_7': stream.SMA(closes, timeperiod=7),
+        'sma_14': stream.SMA(closes, timeperiod=14),
+        'sma_21': stream.SMA(closes, timeperiod=21),
+    }
+
+
+@pytest.mark.parametrize('max_candles_in_state', [30, 70])
+def test_matches_talib_with_same_window_updates(
+    max_candles_in_state: int, make_candle_updates, make_state
+):
+    candles = []
+    incremental_state = make_state()
+
+    for candle in make_candle_updates(n_windows=120, max_updates_per_window=4):
+        update_candles(candles, candle, max_candles_in_state)
+        expected = {**candle, **talib_indicators(candles)}
+        actual = compute_indicators_incremental(
+            dict(candle), incremental_state, max_candles_in_state
+        )
+
+        assert list(actual) == list(expected)
+        for name, value in expected.items():
+            if isinstance(value, str):
+                assert actual[name] == value
+            else:
+                assert actual[name] == pytest.approx(
+                    value, rel=RELATIVE_TOLERANCE, abs=ABSOLUTE_TOLERANCE, nan_ok=True
+                ), (name, candle['window_start_ms'])
+
+
+def test_bollinger_bands_of_high_prices(make_candle_updates, make_state):
+    # A pair trading far from 0 with a small spread, where the variance is a small
+    # difference of large sums of squares
+    candles = make_candle_updates(
+        n_windows=5_000, max_updates_per_window=1, start_price=1e6, volatility=1e-7
+    )
+    talib_candles = []
+    incremental_state = make_state()
+
+    for candle in candles:
+        update_candles(talib_candles, candle, 30)
+        expected = talib_indicators(talib_candles)
+        actual = compute_indicators_incremental(dict(candle), incremental_state, 30)
+
+        # The width of the bands, as the middle hides the errors of the deviation
+        assert actual['bbands_upper'] - actual['bbands_middle'] == pytest.approx(
+            expected['bbands_upper'] - expected['bbands_middle'],
+            rel=RELATIVE_TOLERANCE,
+            abs=ABSOLUTE_TOLERANCE,
+            nan_ok=True,
+        ), candle['window_start_ms']
+
+
+def test_running_sums_are_recomputed(make_candle_updates):
+    engine = init_engine()
+    for candle in make_candle_updates(
+        n_windows=2 * RESUM_INTERVAL, max_updates_per_window=1, start_price=1e6
+    ):
+        push_candle(engine, candle)
+
+    # Without the rounding errors of the additions and subtractions so far
+    for series, windows in ROLLING_WINDOWS.items():
+        for window in windows:
+            assert engine['sums'][f'{series}_{window}'] == sum(
+                engine['tails'][series][-window:]
+            )
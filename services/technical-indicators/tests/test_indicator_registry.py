@@ -0,0 +1,86 @@
+"""
+The plans of the indicator registry, whatever the version of talib.
+"""
+
+from types import SimpleNamespace
+
+import indicator_registry
+import numpy as np
+import pytest
+from indicator_registry import IndicatorPlan, IndicatorSpec, _bind_params
+from talib import abstract
+
+
+class FloatDefaultsFunction:
+    """
+    A talib abstract function reporting all its defaults as floats, like some
+    versions of talib do for the integer parameters.
+    """
+
+    def __init__(self, name: str):
+        self._function = abstract.Function(name)
+
+    @property
+    def info(self):
+        info = dict(self._function.info)
+        info['parameters'] = {
+            name: float(value) for name, value in info['parameters'].items()
+        }
+        return info
+
+    def __getattr__(self, name):
+        return getattr(self._function, name)
+
+
+@pytest.fixture
+def float_defaults(monkeypatch):
+    monkeypatch.setattr(
+        indicator_registry, 'abstract', SimpleNamespace(Function=FloatDefaultsFunction)
+    )
+
+
+def test_params_have_the_talib_types(float_defaults):
+    assert [type(value) for value in _bind_params('RSI', {})] == [int]
+    assert _bind_params('RSI', {'timeperiod': 9.0}) == (9,)
+    assert [type(value) for value in _bind_params('BBANDS', {'nbdevup': 2})] == [
+        int,
+        float,
+        float,
+        int,
+    ]
+
+
+def test_plan_with_float_defaults(float_defaults):
+    plan = IndicatorPlan(
+        [
+            IndicatorSpec(name='rsi', function='RSI'),
+            IndicatorSpec(
+                outputs=['upper', 'middle', 'lower'],
+                function='BBANDS',
+                params={'timeperiod': 20.0},
+            ),
+        ]
+    )
+    closes = 100 + np.cumsum(np.random.default_rng(0).normal(size=50))
+
+    indicators = plan.evaluate({'close': closes})
+
+    assert indicators['middle'] == pytest.approx(closes[-20:].mean())
+    assert 0 <= indicators['rsi'] <= 100
+
+
+def test_identical_calls_are_computed_once():
+    plan = IndicatorPlan(
+        [
+            IndicatorSpec(name='ema_20', function='EMA', params={'timeperiod': 20}),
+            IndicatorSpec(name='sma_20', function='SMA', params={'timeperiod': 20}),
+            IndicatorSpec(name='sma_21', function='SMA', params={'timeperiod': 21}),
+        ]
+    )
+    closes = np.arange(1.0, 31.0)
+
+    assert len(plan._steps) == 3
+    assert isinstance(plan._steps[1], indicator_registry._Alias)
+    assert plan.evaluate({'close': closes}) == pytest.approx(
+        {'ema_20': 20.5, 'sma_20': 20.5, 'sma_21': 20.0}
+    )
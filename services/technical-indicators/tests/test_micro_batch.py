@@ -0,0 +1,50 @@
+"""
+The indicators of the micro-batches against the ones computed message by message.
+"""
+
+import pytest
+from indicator_registry import default_plan
+from micro_batch import compute_indicators_for_pairs
+from technical_indicators import update_candles_and_compute_indicators
+
+MAX_CANDLES_IN_STATE = 50
+
+
+@pytest.mark.parametrize('batch_size', [1, 7, 64])
+def test_matches_compute_indicators(batch_size: int, make_candle_updates, make_state):
+    # Pairs with fewer candles than the lookbacks, and with more than the state keeps
+    candles = []
+    for pair, n_windows in enumerate([3, 12, 25, 45, 90]):
+        for candle in make_candle_updates(n_windows, 3, seed=pair):
+            candles.append((pair, {**candle, 'pair': f'PAIR{pair}/USD'}))
+    # Interleaved across the pairs by window, with the updates of a window of a pair
+    # in a row, so a batch often has several candles of the same pair
+    candles.sort(key=lambda key_candle: key_candle[1]['window_start_ms'])
+
+    plan = default_plan()
+    buffers = {}
+    batched = []
+    for start in range(0, len(candles), batch_size):
+        batched.extend(
+            compute_indicators_for_pairs(
+                candles[start : start + batch_size],
+                buffers,
+                plan,
+                MAX_CANDLES_IN_STATE,
+            )
+        )
+
+    states = {}
+    for (pair, candle), actual in zip(candles, batched, strict=True):
+        state = states.setdefault(pair, make_state())
+        expected = update_candles_and_compute_indicators(
+            dict(candle), state, MAX_CANDLES_IN_STATE, plan
+        )
+        assert list(actual) == list(expected)
+        for name, value in expected.items():
+            if isinstance(value, str):
+                assert actual[name] == value
+            else:
+                assert actual[name] == pytest.approx(
+                    value, rel=1e-9, abs=1e-9, nan_ok=True
+                ), (pair, candle['window_start_ms'], name)
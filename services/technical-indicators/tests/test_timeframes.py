@@ -0,0 +1,49 @@
+"""
+The state of the timeframes, and the migration of the state of the versions without
+timeframes.
+"""
+
+from functools import partial
+
+import pytest
+from candle import update_candles
+from candle_buffer import CandleBuffer
+from timeframes import TimeframeRouter
+
+MAX_CANDLES_IN_STATE = 10
+
+
+def make_router() -> TimeframeRouter:
+    update = partial(update_candles, max_candles_in_state=MAX_CANDLES_IN_STATE)
+    return TimeframeRouter({60: update, 300: update}, legacy_candle_seconds=60)
+
+
+@pytest.mark.parametrize('legacy_key', ['candles', 'candle_buffer'])
+def test_first_timeframe_takes_over_the_legacy_candles(
+    legacy_key: str, make_candle_updates, make_state
+):
+    candles = make_candle_updates(n_windows=5, max_updates_per_window=1)
+    state = make_state()
+    if legacy_key == 'candles':
+        state.set('candles', candles[:-1])
+    else:
+        buffer = CandleBuffer.from_candles(candles[:-1], MAX_CANDLES_IN_STATE)
+        state.set('candle_buffer', buffer.to_bytes())
+
+    buffer = make_router()(candles[-1], state)
+
+    assert buffer.closes.tolist() == [candle['close'] for candle in candles]
+    assert not state.exists(legacy_key)
+    assert state.exists('60s:candle_buffer')
+
+
+def test_other_timeframes_start_from_scratch(make_candle_updates, make_state):
+    candles = make_candle_updates(n_windows=5, max_updates_per_window=1)
+    state = make_state()
+    state.set('candles', candles[:-1])
+
+    buffer = make_router()({**candles[-1], 'candle_seconds': 300}, state)
+
+    assert len(buffer) == 1
+    # Left for the first timeframe
+    assert state.exists('candles')
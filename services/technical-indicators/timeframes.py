@@ -0,0 +1,89 @@
+from typing import Any, Callable, Dict, List, Optional
+
+from quixstreams import State
+
+
+class TimeframeState:
+    """
+    The state of a pair for a single timeframe.
+
+    The messages are keyed by pair, so the candles of all the timeframes of a pair
+    share the same state. The keys are prefixed with the candle seconds to keep them
+    apart, i.e. the state is keyed by pair and candle seconds.
+
+    The versions without timeframes stored the state of their single timeframe
+    without prefix. With `legacy=True`, that state is the `legacy_state` of this
+    timeframe, so the candles it holds can be migrated, see `update_candles`.
+    """
+
+    def __init__(self, state: State, candle_seconds: int, legacy: bool = False):
+        self._state = state
+        self._prefix = f'{candle_seconds}s:'
+        self.legacy_state: Optional[State] = state if legacy else None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._state.get(self._prefix + key, default=default)
+
+    def set(self, key: str, value: Any) -> None:
+        self._state.set(self._prefix + key, value)
+
+    def delete(self, key: str) -> None:
+        self._state.delete(self._prefix + key)
+
+    def exists(self, key: str) -> bool:
+        return self._state.exists(self._prefix + key)
+
+
+class TimeframeRouter:
+    """
+    Send each candle to the function of its timeframe, with the state of that
+    timeframe.
+    """
+
+    def __init__(
+        self,
+        functions: Dict[int, Callable[[Dict[str, Any], State], Any]],
+        legacy_candle_seconds: Optional[int] = None,
+    ):
+        """
+        Args:
+            functions (Dict[int, Callable]): The function of each candle seconds.
+            legacy_candle_seconds (Optional[int]): The timeframe that takes over the
+                state stored without prefix by the versions without timeframes.
+        """
+        self.functions = functions
+        self.legacy_candle_seconds = legacy_candle_seconds
+
+    def accepts(self, candle: Dict[str, Any]) -> bool:
+        return candle.get('candle_seconds') in self.functions
+
+    def __call__(self, candle: Dict[str, Any], state: State) -> Any:
+        candle_seconds = candle['candle_seconds']
+        return self.functions[candle_seconds](
+            candle,
+            TimeframeState(
+                state, candle_seconds, candle_seconds == self.legacy_candle_seconds
+            ),
+        )
+
+
+def parse_max_candles(
+    candle_seconds: List[int],
+    max_candles_in_state: int,
+    max_candles_in_state_by_timeframe: Dict[int, int],
+) -> Dict[int, int]:
+    """
+    The maximum number of candles to keep for each timeframe, `max_candles_in_state`
+    unless overridden.
+    """
+    unknown = set(max_candles_in_state_by_timeframe) - set(candle_seconds)
+    if unknown:
+        raise ValueError(
+            f'Max candles in state given for timeframes that are not computed: {sorted(unknown)}'
+        )
+    if len(set(candle_seconds)) != len(candle_seconds):
+        raise ValueError(f'Duplicate candle seconds: {candle_seconds}')
+    return {
+        seconds: max_candles_in_state_by_timeframe.get(seconds, max_candles_in_state)
+        for seconds in candle_seconds
+    }
@@ -0,0 +1,374 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Iterable, Optional, Protocol
+
+import pandas as pd
+from common.instrumentation import StageMetrics
+from common.tracing import LatencyRecorder, now_us, stamp
+from common.wire_format import decode
+from confluent_kafka import KafkaException, TopicPartition
+from loguru import logger
+from quixstreams import Application
+from quixstreams.models import Topic
+from transform import latest_by_key, to_dataframe
+
+
+class FeatureGroup(Protocol):
+    """
+    What the writer needs from a Hopsworks feature group, so it can be replaced by a
+    local fake.
+    """
+
+    def insert(self, data: pd.DataFrame) -> Any: ...
+
+
+class InsertError(Exception):
+    """
+    An insert that failed with an error that retrying does not fix, e.g. invalid data.
+    """
+
+
+class AdaptiveBackoff:
+    """
+    Exponential backoff shared by the inserts of all the threads.
+
+    Every failure doubles the delay (up to `max_seconds`) and every success halves it,
+    so the inserts slow down together while the feature store is overloaded and speed
+    up again as it recovers.
+    """
+
+    def __init__(
+        self,
+        initial_seconds: float = 0.5,
+        max_seconds: float = 60.0,
+        multiplier: float = 2.0,
+    ):
+        self.initial_seconds = initial_seconds
+        self.max_seconds = max_seconds
+        self.multiplier = multiplier
+        self.delay = 0.0
+        self._lock = threading.Lock()
+
+    def failure(self) -> float:
+        """
+        Record a failure, and return how long to wait before retrying, with jitter.
+        """
+        with self._lock:
+            self.delay = min(
+                max(self.delay * self.multiplier, self.initial_seconds),
+                self.max_seconds,
+            )
+            delay = self.delay
+        return delay * random.uniform(0.5, 1.0)
+
+    def success(self) -> None:
+        with self._lock:
+            self.delay /= self.multiplier
+            if self.delay < self.initial_seconds:
+                self.delay = 0.0
+
+
+class BackgroundWriter:
+    """
+    Insert batches of messages into a feature group from a pool of threads, with at
+    most `max_in_flight` batches being inserted at the same time.
+
+    The batches complete in any order, but their offsets are only handed back in the
+    order they were submitted, once the insert of every batch up to them succeeded.
+
+    The updates of a row (the same `dedup_keys`) usually span consecutive batches, so
+    the insert of a batch first waits for the inserts of the earlier batches in flight
+    with some of the same rows (all of them without `dedup_keys`), and the latest
+    update of a row is always the one inserted last. Batches of different rows are
+    still inserted at the same time.
+    """
+
+    def __init__(
+        self,
+        feature_group: FeatureGroup,
+        max_in_flight: int = 4,
+        dedup_keys: Optional[list[str]] = None,
+        float32_columns: Iterable[str] = (),
+        backoff: Optional[AdaptiveBackoff] = None,
+        max_attempts: int = 10,
+        recorder: Optional[LatencyRecorder] = None,
+        stage_metrics: Optional[StageMetrics] = None,
+    ):
+        """
+        Args:
+            feature_group (FeatureGroup): The feature group to insert into.
+            max_in_flight (int): The maximum number of batches being inserted at once.
+            dedup_keys (Optional[list[str]]): The columns identifying a row, see `latest_by_key`.
+            float32_columns (Iterable[str]): The float columns to store as float32.
+            backoff (Optional[AdaptiveBackoff]): The backoff between the attempts of an insert.
+            max_attempts (int): The number of attempts of an insert before giving up.
+            recorder (Optional[LatencyRecorder]): Records the latency of the messages once inserted, from the headers given to `submit`.
+            stage_metrics (Optional[StageMetrics]): Counts the messages and times the inserts, with the retries.
+        """
+        self.feature_group = feature_group
+        self.max_in_flight = max_in_flight
+        self.dedup_keys = dedup_keys or []
+        self.float32_columns = set(float32_columns)
+        self.backoff = backoff or AdaptiveBackoff()
+        self.max_attempts = max_attempts
+        self.recorder = recorder
+        self.stage_metrics = stage_metrics
+
+        # Counters of the messages received, and of the rows inserted after collapsing
+        self.received = 0
+        self.inserted = 0
+        self.retries = 0
+        self._counters_lock = threading.Lock()
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_in_flight, thread_name_prefix='feature-store-writer'
+        )
+        # The batches not handed back yet, in the order they were submitted, with the
+        # keys of their rows (None without `dedup_keys`)
+        self._in_flight: deque[
+            tuple[Future, dict[tuple[str, int], int], Optional[set[tuple]]]
+        ] = deque()
+
+    def submit(
+        self,
+        values: list[dict],
+        offsets: dict[tuple[str, int], int],
+        headers: Optional[list] = None,
+    ) -> dict[tuple[str, int], int]:
+        """
+        Start inserting a batch in the background, waiting first for the oldest batch
+        if `max_in_flight` batches are already being inserted.
+
+        Args:
+            values (list[dict]): The messages of the batch.
+            offsets (dict[tuple[str, int], int]): The offset of the last message of the batch for each topic and partition.
+            headers (Optional[list]): The headers of each message, for the `recorder`.
+
+        Returns:
+            dict[tuple[str, int], int]: The offsets that are safe to commit, see `completed`.
+        """
+        if len(self._in_flight) >= self.max_in_flight:
+            # Wait for the oldest batch, an error is raised by `raise_if_failed`
+            self._in_flight[0][0].exception()
+
+        keys = self._keys(values)
+        # The earlier inserts of some of the same rows, which must land first. They
+        # were submitted before, so they have a thread and never wait for this one
+        earlier = [
+            future
+            for future, _, batch_keys in self._in_flight
+            if keys is None or not keys.isdisjoint(batch_keys)
+        ]
+        future = self._executor.submit(self._insert, values, headers, earlier)
+        self._in_flight.append((future, offsets, keys))
+        return self.completed()
+
+    def completed(self, wait: bool = False) -> dict[tuple[str, int], int]:
+        """
+        Hand back the offsets of the batches inserted successfully, up to the first
+        batch still being inserted (or all of them if `wait`) or failed.
+        """
+        offsets: dict[tuple[str, int], int] = {}
+        while self._in_flight and (wait or self._in_flight[0][0].done()):
+            future, batch_offsets, _ = self._in_flight[0]
+            if future.exception() is not None:
+                break
+            self._in_flight.popleft()
+            offsets.update(batch_offsets)
+        return offsets
+
+    def raise_if_failed(self) -> None:
+        """
+        Raises:
+            InsertError: If the insert of the oldest batch not handed back failed for good.
+        """
+        if self._in_flight and self._in_flight[0][0].done():
+            self._in_flight[0][0].result()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def close(self) -> dict[tuple[str, int], int]:
+        """
+        Wait for the batches being inserted, and stop the threads.
+        """
+        try:
+            return self.completed(wait=True)
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def _keys(self, values: list[dict]) -> Optional[set[tuple]]:
+        if not self.dedup_keys:
+            return None
+        return {tuple(value[key] for key in self.dedup_keys) for value in values}
+
+    def _insert(
+        self,
+        values: list[dict],
+        headers: Optional[list] = None,
+        earlier: Iterable[Future] = (),
+    ) -> None:
+        for future in earlier:
+            if future.exception() is not None:
+                # Not inserted after an older update of its rows that is not, the
+                # batches from the failed one on are consumed again after a restart
+                raise InsertError('An earlier insert of the same rows failed')
+
+        latest = latest_by_key(values, self.dedup_keys)
+        data = to_dataframe(latest, self.float32_columns)
+
+        start = time.perf_counter()
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.feature_group.insert(data)
+                break
+            except (TimeoutError, ConnectionError) as err:
+                # The feature store is overloaded or unreachable, try again later
+                if attempt == self.max_attempts:
+                    raise InsertError(
+                        f'Insert failed after {attempt} attempts: {err}'
+                    ) from err
+                delay = self.backoff.failure()
+                with self._counters_lock:
+                    self.retries += 1
+                logger.warning(
+                    f'Insert failed ({err!r}), attempt {attempt}, retrying in {delay:.1f}s'
+                )
+                time.sleep(delay)
+            except ValueError as err:
+                raise InsertError(f'Invalid data format: {err}') from err
+            except Exception as err:
+                raise InsertError(
+                    f'Unexpected error during feature group insertion: {err}'
+                ) from err
+
+        self.backoff.success()
+        if self.stage_metrics is not None:
+            self.stage_metrics.batch(
+                len(values), len(latest), time.perf_counter() - start
+            )
+        with self._counters_lock:
+            self.received += len(values)
+            self.inserted += len(latest)
+
+        if self.recorder is not None and headers is not None:
+            out_us = now_us()
+            for value, message_headers in zip(values, headers, strict=True):
+                self.recorder.record(message_headers, value, out_us)
+
+
+def run_background_writes(
+    app: Application,
+    input_topic: Topic,
+    writer: BackgroundWriter,
+    batch_size: int = 1000,
+    batch_timeout_seconds: float = 1.0,
+    log_interval_seconds: float = 60.0,
+):
+    """
+    Consume the messages in batches of up to `batch_size` messages or
+    `batch_timeout_seconds` seconds, and insert them with the background writer while
+    the next batches are consumed.
+
+    The offsets are committed only once the inserts of all the messages up to them
+    succeeded, so messages are inserted at least once. If an insert fails for good, the
+    error is raised and the uncommitted messages are consumed again after a restart.
+    When partitions are revoked, the messages of the batch being consumed that come
+    from them are dropped, for the consumer that gets the partitions.
+    """
+    last_log_time = time.monotonic()
+    recorder = writer.recorder
+
+    # The batch being consumed, with the topic and partition of each message
+    values: list[dict] = []
+    headers: list = []
+    sources: list[tuple[str, int]] = []
+    offsets: dict[tuple[str, int], int] = {}
+
+    with app.get_consumer(auto_commit_enable=False) as consumer:
+
+        def commit(inserted: dict[tuple[str, int], int]) -> None:
+            if not inserted:
+                return
+            topic_partitions = [
+                TopicPartition(topic, partition, offset + 1)
+                for (topic, partition), offset in inserted.items()
+            ]
+            try:
+                consumer.commit(offsets=topic_partitions, asynchronous=False)
+            except KafkaException as e:
+                # E.g. during a rebalance. The messages are consumed and inserted
+                # again, and the last update of each row still wins
+                logger.warning(f'Failed to commit the offsets {topic_partitions}: {e}')
+
+        def on_revoke(_, partitions: list[TopicPartition]) -> None:
+            # Drop the messages of the revoked partitions not submitted yet, the
+            # consumer that gets them consumes them again from the last commit
+            revoked = {
+                (partition.topic, partition.partition) for partition in partitions
+            }
+            kept = [i for i, source in enumerate(sources) if source not in revoked]
+            values[:] = [values[i] for i in kept]
+            if recorder is not None:
+                headers[:] = [headers[i] for i in kept]
+            sources[:] = [sources[i] for i in kept]
+            for source in revoked:
+                offsets.pop(source, None)
+
+            # Commit what was inserted before another consumer takes the partitions
+            commit(writer.completed(wait=True))
+
+        consumer.subscribe([input_topic.name], on_revoke=on_revoke)
+
+        try:
+            while True:
+                values.clear()
+                headers.clear()
+                sources.clear()
+                offsets.clear()
+                deadline = time.monotonic() + batch_timeout_seconds
+                while len(values) < batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    msg = consumer.poll(timeout=timeout)
+                    if msg is None:
+                        continue
+                    if msg.error():
+                        logger.error(f'Kafka error: {msg.error()}')
+                        continue
+                    values.append(decode(msg.value()))
+                    if recorder is not None:
+                        # The time the message was consumed
+                        headers.append(stamp(msg.headers(), recorder.stage, 'in'))
+                    sources.append((msg.topic(), msg.partition()))
+                    offsets[msg.topic(), msg.partition()] = msg.offset()
+
+                if values:
+                    # Copies, as the batch is cleared and refilled while it is inserted
+                    commit(
+                        writer.submit(
+                            list(values),
+                            dict(offsets),
+                            list(headers) if recorder is not None else None,
+                        )
+                    )
+                else:
+                    commit(writer.completed())
+                writer.raise_if_failed()
+
+                now = time.monotonic()
+                if now - last_log_time >= log_interval_seconds:
+                    last_log_time = now
+                    logger.info(
+                        f'Feature store writer: received={writer.received}, '
+                        f'inserted={writer.inserted}, retries={writer.retries}, '
+                        f'in flight={writer.in_flight}, '
+                        f'backoff={writer.backoff.delay:.1f}s'
+                    )
+        finally:
+            commit(writer.close())
@@ -0,0 +1,321 @@
+"""
+Point-in-time training dataset of technical indicators, with the price N candles ahead as the target.
+
+It reads the local feature store (`FEATURE_STORE=local`) one time chunk at a time,
+and writes memory-mappable NumPy arrays:
+- X.npy: the features, float32 (rows x features)
+- y.npy: the target, float32
+- window_end_ms.npy: the time each row is available at, int64
+- pair_ids.npy: the index of the pair of each row in `pairs` of metadata.json, int32
+- metadata.json: the feature names, the pairs, the target and the arguments
+
+A row is the final candle of a window of `--candle-seconds` seconds, available when
+its window ends. Its features are the indicators of that candle, plus the indicators
+of the larger timeframes (`--extra-timeframes`) of the last of their candles closed
+at that time, so no row sees data from after it is available. The target is the
+return (or close) of the candle `--horizon` windows ahead. Rows without that candle
+(a gap in the data) are dropped rather than using another horizon.
+
+The rows are in time order, so the first ones can be used for training and the last
+ones for validation. Only a chunk of `--chunk-days` days (plus the horizon) is in
+memory at once.
+
+Usage:
+    python build_dataset.py feature_store dataset --features rsi_14 macd atr --horizon 5 --extra-timeframes 300 3600
+"""
+
+import argparse
+import json
+import struct
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+import numpy as np
+import pandas as pd
+from local_store import read_index, read_range
+from loguru import logger
+
+DAY_MS = 86_400_000
+
+# Size reserved for the header of the .npy files, written once the number of rows
+# is known
+NPY_HEADER_SIZE = 128
+
+
+class NpyWriter:
+    """
+    Write a .npy file one block of rows at a time, without knowing the number of rows
+    in advance.
+    """
+
+    def __init__(self, path: Path, dtype: np.dtype, row_shape: tuple = ()):
+        self.dtype = np.dtype(dtype)
+        self.row_shape = row_shape
+        self.rows = 0
+        self._file: BinaryIO = open(path, 'wb')
+        self._file.write(b'\0' * NPY_HEADER_SIZE)
+
+    def write(self, values: np.ndarray) -> None:
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        assert values.shape[1:] == self.row_shape
+        self._file.write(values.tobytes())
+        self.rows += len(values)
+
+    def close(self) -> None:
+        header = repr(
+            {
+                'descr': np.lib.format.dtype_to_descr(self.dtype),
+                'fortran_order': False,
+                'shape': (self.rows, *self.row_shape),
+            }
+        )
+        # Magic string, version 1.0, header length, then the header padded with
+        # spaces and ending with a newline
+        padding = NPY_HEADER_SIZE - 10 - len(header) - 1
+        self._file.seek(0)
+        self._file.write(b'\x93NUMPY\x01\x00')
+        self._file.write(struct.pack('<H', NPY_HEADER_SIZE - 10))
+        self._file.write((header + ' ' * padding + '\n').encode('latin1'))
+        self._file.close()
+
+
+def final_candles(rows: pd.DataFrame, event_time_column: str) -> pd.DataFrame:
+    """
+    The last update of each candle, i.e. its final version if it was stored.
+    """
+    return (
+        rows.sort_values(event_time_column, kind='stable')
+        .drop_duplicates(['pair', 'candle_seconds', 'window_start_ms'], keep='last')
+        .sort_values(['window_end_ms', 'pair'], kind='stable')
+    )
+
+
+def add_target(
+    candles: pd.DataFrame, candle_seconds: int, horizon: int, target: str
+) -> pd.DataFrame:
+    """
+    Add the target of each candle, from the candle exactly `horizon` windows ahead of
+    the same pair, NaN if that candle is missing.
+    """
+    ahead = candles[['pair', 'window_start_ms', 'close']].copy()
+    ahead['window_start_ms'] -= horizon * candle_seconds * 1000
+    ahead = ahead.rename(columns={'close': 'close_ahead'})
+    candles = candles.merge(ahead, on=['pair', 'window_start_ms'], how='left')
+    if target == 'return':
+        candles['target'] = candles['close_ahead'] / candles['close'] - 1.0
+    else:
+        candles['target'] = candles['close_ahead']
+    return candles
+
+
+def join_timeframe(
+    candles: pd.DataFrame,
+    other: pd.DataFrame,
+    candle_seconds: int,
+    features: list[str],
+) -> pd.DataFrame:
+    """
+    Join the features of the last candle of a larger timeframe closed at the time
+    each candle is available, as `<feature>_<candle_seconds>s`.
+    """
+    other = other[['pair', 'window_end_ms', *features]].rename(
+        columns={feature: f'{feature}_{candle_seconds}s' for feature in features}
+    )
+    return pd.merge_asof(
+        candles.sort_values('window_end_ms', kind='stable'),
+        other.sort_values('window_end_ms', kind='stable'),
+        on='window_end_ms',
+        by='pair',
+        direction='backward',
+        allow_exact_matches=True,
+    ).sort_values(['window_end_ms', 'pair'], kind='stable')
+
+
+def build_dataset(
+    store_path: str,
+    output_dir: str,
+    features: list[str],
+    candle_seconds: int = 60,
+    horizon: int = 1,
+    target: str = 'return',
+    extra_timeframes: Optional[list[int]] = None,
+    pairs: Optional[list[str]] = None,
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+    chunk_days: float = 1.0,
+    event_time_column: str = 'timestamp_ms',
+    dropna: bool = True,
+) -> int:
+    """
+    Build the dataset, see the module docstring.
+
+    Returns:
+        int: The number of rows written.
+    """
+    extra_timeframes = extra_timeframes or []
+    index = read_index(Path(store_path))
+    if not index:
+        raise ValueError(f'No features in {store_path}')
+    if start_ms is None:
+        start_ms = min(entry['min'] for entry in index.values())
+    if end_ms is None:
+        end_ms = max(entry['max'] for entry in index.values()) + 1
+
+    candle_ms = candle_seconds * 1000
+    columns = list(
+        dict.fromkeys(
+            [
+                'pair',
+                'candle_seconds',
+                'window_start_ms',
+                'window_end_ms',
+                event_time_column,
+                'close',
+                *features,
+            ]
+        )
+    )
+    feature_names = features + [
+        f'{feature}_{seconds}s' for seconds in extra_timeframes for feature in features
+    ]
+
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    x_writer = NpyWriter(output / 'X.npy', np.float32, (len(feature_names),))
+    y_writer = NpyWriter(output / 'y.npy', np.float32)
+    time_writer = NpyWriter(output / 'window_end_ms.npy', np.int64)
+    pair_writer = NpyWriter(output / 'pair_ids.npy', np.int32)
+    pair_ids: dict[str, int] = {}
+
+    chunk_ms = int(chunk_days * DAY_MS)
+    # Align the chunks on the windows, so a window is in a single chunk
+    chunk_start = start_ms // candle_ms * candle_ms
+    while chunk_start < end_ms:
+        chunk_end = min(chunk_start + chunk_ms, end_ms)
+
+        # The candles of the chunk, plus the ones `horizon` windows ahead for the
+        # target. The event time of a candle is within its window.
+        rows = read_range(
+            store_path,
+            event_time_column,
+            chunk_start,
+            chunk_end + (horizon + 1) * candle_ms,
+            pairs,
+            columns,
+        ).to_pandas()
+        if len(rows):
+            rows = rows[rows['candle_seconds'] == candle_seconds]
+        if len(rows) == 0:
+            chunk_start = chunk_end
+            continue
+
+        candles = add_target(
+            final_candles(rows, event_time_column), candle_seconds, horizon, target
+        )
+        candles = candles[
+            (candles['window_start_ms'] >= chunk_start)
+            & (candles['window_start_ms'] < chunk_end)
+        ]
+
+        for seconds in extra_timeframes:
+            # The larger candles closed by the end of the last window of the chunk,
+            # from two larger windows before its start
+            other = read_range(
+                store_path,
+                event_time_column,
+                chunk_start - 2 * seconds * 1000,
+                chunk_end + candle_ms,
+                pairs,
+                columns,
+            ).to_pandas()
+            other = final_candles(
+                other[other['candle_seconds'] == seconds], event_time_column
+            )
+            candles = join_timeframe(candles, other, seconds, features)
+
+        if dropna:
+            candles = candles.dropna(subset=[*feature_names, 'target'])
+        else:
+            candles = candles.dropna(subset=['target'])
+
+        x_writer.write(candles[feature_names].to_numpy(dtype=np.float32))
+        y_writer.write(candles['target'].to_numpy(dtype=np.float32))
+        time_writer.write(candles['window_end_ms'].to_numpy(dtype=np.int64))
+        pair_writer.write(
+            np.array(
+                [pair_ids.setdefault(pair, len(pair_ids)) for pair in candles['pair']],
+                dtype=np.int32,
+            )
+        )
+        logger.info(
+            f'Chunk {pd.Timestamp(chunk_start, unit="ms")}: {len(candles)} rows'
+        )
+        chunk_start = chunk_end
+
+    for writer in (x_writer, y_writer, time_writer, pair_writer):
+        writer.close()
+
+    with open(output / 'metadata.json', 'w') as f:
+        json.dump(
+            {
+                'features': feature_names,
+                'pairs': list(pair_ids),
+                'target': target,
+                'horizon': horizon,
+                'candle_seconds': candle_seconds,
+                'extra_timeframes': extra_timeframes,
+                'start_ms': start_ms,
+                'end_ms': end_ms,
+                'rows': x_writer.rows,
+            },
+            f,
+            indent=2,
+        )
+
+    return x_writer.rows
+
+
+def load_dataset(path: str) -> tuple[np.ndarray, np.ndarray, dict]:
+    """
+    Memory-map the features and target of a dataset, without reading them.
+    """
+    with open(Path(path) / 'metadata.json') as f:
+        metadata = json.load(f)
+    X = np.load(Path(path) / 'X.npy', mmap_mode='r')
+    y = np.load(Path(path) / 'y.npy', mmap_mode='r')
+    return X, y, metadata
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('store_path')
+    parser.add_argument('output_dir')
+    parser.add_argument('--features', nargs='+', required=True)
+    parser.add_argument('--candle-seconds', type=int, default=60)
+    parser.add_argument('--horizon', type=int, default=1)
+    parser.add_argument('--target', choices=['return', 'close'], default='return')
+    parser.add_argument('--extra-timeframes', type=int, nargs='*', default=[])
+    parser.add_argument('--pairs', nargs='*')
+    parser.add_argument('--start-ms', type=int)
+    parser.add_argument('--end-ms', type=int)
+    parser.add_argument('--chunk-days', type=float, default=1.0)
+    parser.add_argument('--event-time-column', default='timestamp_ms')
+    parser.add_argument('--keep-nan', action='store_true')
+    args = parser.parse_args()
+
+    n_rows = build_dataset(
+        args.store_path,
+        args.output_dir,
+        features=args.features,
+        candle_seconds=args.candle_seconds,
+        horizon=args.horizon,
+        target=args.target,
+        extra_timeframes=args.extra_timeframes,
+        pairs=args.pairs,
+        start_ms=args.start_ms,
+        end_ms=args.end_ms,
+        chunk_days=args.chunk_days,
+        event_time_column=args.event_time_column,
+        dropna=not args.keep_nan,
+    )
+    logger.info(f'Wrote {n_rows} rows to {args.output_dir}')
@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -10,6 +12,22 @@ class Config(BaseSettings):
     feature_group_version: int
     feature_group_primary_keys: list[str]
     feature_group_event_time: str
+    # Collapse each batch to the last message of each of these columns before the
+    # insert, the primary keys plus the candle window. Empty to insert every message
+    feature_group_dedup_keys: list[str] = ['pair', 'candle_seconds', 'window_start_ms']
+    # Insert from a pool of threads with up to this many batches in flight, 0 to
+    # insert synchronously in the quixstreams sink
+    writer_max_in_flight: int = 0
+    writer_batch_size: int = 1000
+    # Write to Hopsworks, or to a local partitioned Parquet store in LOCAL_STORE_PATH
+    feature_store: Literal['hopsworks', 'local'] = 'hopsworks'
+    local_store_path: str = 'feature_store'
+    local_store_compaction_min_files: int = 10
+    local_store_compaction_interval_seconds: float = 60.0
+    # Log the latency of the messages from their headers once inserted, see common/tracing.py
+    latency_tracing: bool = True
+    # The port of the Prometheus metrics endpoint, 0 to disable it
+    metrics_port: int = 9104
 
 
 class HopsworksCredentials(BaseSettings):
@@ -21,4 +39,3 @@ class HopsworksCredentials(BaseSettings):
 
 
 config = Config()
-hopsworks_credentials = HopsworksCredentials()
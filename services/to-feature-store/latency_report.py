@@ -0,0 +1,140 @@
+"""
+Latency of each stage of the pipeline, from the tracing headers of a topic's messages.
+
+It reads the messages of a topic (trades, candles or technical-indicators) without
+committing any offset, and reports the p50/p99/max latency of each step between two
+consecutive times of the headers, starting from the `timestamp_ms` of the trade (e.g.
+`trades.out -> candles.in` is the time in Kafka), and of the total, overall and per
+pair. See common/tracing.py for the headers.
+
+The times of different hosts are compared, so the latencies are only as accurate as
+their clocks are in sync.
+
+Usage:
+    python latency_report.py --topic technical-indicators --max-messages 100000
+    python latency_report.py --topic candles --offset-reset latest --idle-seconds 30 --by-pair
+"""
+
+import argparse
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+from common.tracing import read_stamps
+from common.wire_format import decode
+from loguru import logger
+from quixstreams import Application
+
+SOURCE = 'source'
+TOTAL = 'total'
+
+
+def latency_rows(
+    messages: Iterable[Tuple[Dict[str, Any], Optional[list]]],
+) -> pd.DataFrame:
+    """
+    One row per step of each message, with its pair, step and latency in microseconds.
+    The messages are (value, headers), those without tracing headers are skipped.
+    """
+    rows: Dict[str, List[Any]] = {'pair': [], 'step': [], 'latency_us': []}
+    for value, headers in messages:
+        stamps = read_stamps(headers)
+        if not stamps or 'timestamp_ms' not in value:
+            continue
+        pair = value.get('pair')
+        names = [SOURCE, *stamps]
+        times = [value['timestamp_ms'] * 1000, *stamps.values()]
+        for i in range(1, len(names)):
+            rows['pair'].append(pair)
+            rows['step'].append(f'{names[i - 1]} -> {names[i]}')
+            rows['latency_us'].append(times[i] - times[i - 1])
+        rows['pair'].append(pair)
+        rows['step'].append(TOTAL)
+        rows['latency_us'].append(times[-1] - times[0])
+    return pd.DataFrame(rows)
+
+
+def summarize(rows: pd.DataFrame, by: List[str]) -> pd.DataFrame:
+    """
+    The p50/p99/max latency (in milliseconds) and number of messages of each group.
+    """
+    latency_ms = rows['latency_us'] / 1000
+    grouped = latency_ms.groupby([rows[column] for column in by], sort=False)
+    return pd.DataFrame(
+        {
+            'p50_ms': grouped.quantile(0.5),
+            'p99_ms': grouped.quantile(0.99),
+            'max_ms': grouped.max(),
+            'messages': grouped.count(),
+        }
+    ).round(3)
+
+
+def read_messages(
+    broker_address: str,
+    topic_name: str,
+    max_messages: int,
+    idle_seconds: float,
+    offset_reset: str,
+) -> List[Tuple[Dict[str, Any], Optional[list]]]:
+    """
+    Read up to `max_messages` messages, or until none arrived for `idle_seconds`.
+    """
+    app = Application(
+        broker_address=broker_address,
+        # A new group every time, to read from `offset_reset` without committing
+        consumer_group=f'latency-report-{uuid.uuid4().hex[:8]}',
+        auto_offset_reset=offset_reset,
+    )
+    messages = []
+    with app.get_consumer(auto_commit_enable=False) as consumer:
+        consumer.subscribe([topic_name])
+        last_message_time = time.monotonic()
+        while (
+            len(messages) < max_messages
+            and time.monotonic() - last_message_time < idle_seconds
+        ):
+            msg = consumer.poll(timeout=1.0)
+            if msg is None:
+                continue
+            if msg.error():
+                logger.error(f'Kafka error: {msg.error()}')
+                continue
+            messages.append((decode(msg.value()), msg.headers()))
+            last_message_time = time.monotonic()
+    return messages
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--broker-address', default='localhost:19092')
+    parser.add_argument('--topic', default='technical-indicators')
+    parser.add_argument('--max-messages', type=int, default=100_000)
+    parser.add_argument('--idle-seconds', type=float, default=10.0)
+    parser.add_argument(
+        '--offset-reset', choices=['earliest', 'latest'], default='earliest'
+    )
+    parser.add_argument(
+        '--by-pair', action='store_true', help='Report every step per pair'
+    )
+    args = parser.parse_args()
+
+    messages = read_messages(
+        args.broker_address,
+        args.topic,
+        args.max_messages,
+        args.idle_seconds,
+        args.offset_reset,
+    )
+    rows = latency_rows(messages)
+    if rows.empty:
+        raise SystemExit(f'No messages with tracing headers in {args.topic}')
+
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(f'{len(messages)} messages of {args.topic}\n')
+        print(summarize(rows, ['step']).to_string(), end='\n\n')
+        if args.by_pair:
+            print(summarize(rows, ['pair', 'step']).to_string())
+        else:
+            print(summarize(rows[rows['step'] == TOTAL], ['pair']).to_string())
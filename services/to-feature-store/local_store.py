@@ -0,0 +1,378 @@
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from background_writer import BackgroundWriter
+from common.instrumentation import StageMetrics
+from common.tracing import LatencyRecorder, now_us, stamp
+from loguru import logger
+from quixstreams.sinks.base import BatchingSink, SinkBatch
+from transform import latest_by_key, to_dataframe
+
+INDEX_FILE = '_index.json'
+
+
+class ParquetFeatureStore:
+    """
+    A local feature store of Parquet files, partitioned by pair and date:
+
+        <path>/pair=BTC%2FUSD/date=2024-12-01/part-<id>.parquet
+
+    Every insert adds a file per partition, with a single row group, and the
+    compaction merges the small files of a partition into a single file with one row
+    group per `row_group_size` rows, sorted by event time, keeping only the latest row
+    of each `dedup_keys` (the updates of a candle inserted in different batches).
+
+    An index (`_index.json`) keeps the min/max event time and the number of rows of
+    every file, so reading a time range only opens the files that overlap it. It is
+    written atomically after the files, so readers only see complete files. A single
+    process writes to a store, other processes can read it at the same time (a read
+    can fail if a compaction deletes a file it selected, and is then retried).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        event_time_column: str,
+        partition_column: str = 'pair',
+        dedup_keys: Optional[list[str]] = None,
+        compaction_min_files: int = 10,
+        row_group_size: int = 100_000,
+    ):
+        """
+        Args:
+            path (str): The root directory of the store.
+            event_time_column (str): The column with the event time, in milliseconds since the epoch.
+            partition_column (str): The column to partition by, with the date of the event time.
+            dedup_keys (Optional[list[str]]): The columns identifying a row, whose latest row by event time is kept by the compaction, all the rows are kept if empty.
+            compaction_min_files (int): The number of files from which a partition is compacted.
+            row_group_size (int): The maximum number of rows per row group of the compacted files.
+        """
+        self.path = Path(path)
+        self.event_time_column = event_time_column
+        self.partition_column = partition_column
+        self.dedup_keys = dedup_keys or []
+        self.compaction_min_files = compaction_min_files
+        self.row_group_size = row_group_size
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._index = read_index(self.path)
+        self._lock = threading.Lock()
+        self._compaction_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def insert(self, data: pd.DataFrame) -> None:
+        """
+        Write the rows to a new file in each of their partitions.
+        """
+        if data.empty:
+            return
+        table = _cast_null_columns(
+            pa.Table.from_pandas(data, preserve_index=False)
+        ).replace_schema_metadata(None)
+        event_times = table[self.event_time_column].cast(pa.int64())
+        dates = pc.strftime(
+            event_times.cast(pa.timestamp('ms', tz='UTC')), format='%Y-%m-%d'
+        )
+        partitions = (
+            pa.table({'key': table[self.partition_column], 'date': dates})
+            .group_by(['key', 'date'], use_threads=False)
+            .aggregate([])
+        )
+
+        entries = {}
+        for key, date in zip(
+            partitions['key'].to_pylist(), partitions['date'].to_pylist(), strict=True
+        ):
+            mask = pc.and_(
+                pc.equal(table[self.partition_column], key), pc.equal(dates, date)
+            )
+            part = table.filter(mask)
+            relative_path = _new_file(self.partition_column, key, date)
+            (self.path / relative_path).parent.mkdir(parents=True, exist_ok=True)
+            pq.write_table(part, self.path / relative_path)
+            entries[relative_path] = _file_entry(part, self.event_time_column)
+
+        with self._lock:
+            self._index.update(entries)
+            write_index(self.path, self._index)
+
+    def compact(self) -> int:
+        """
+        Merge the files of the partitions with at least `compaction_min_files` files,
+        keeping the latest row of each key.
+
+        Returns:
+            int: The number of files merged.
+        """
+        with self._lock:
+            by_partition: dict[str, list[str]] = {}
+            for relative_path in self._index:
+                by_partition.setdefault(os.path.dirname(relative_path), []).append(
+                    relative_path
+                )
+
+        n_merged = 0
+        for partition, files in by_partition.items():
+            if len(files) < self.compaction_min_files:
+                continue
+            table = pa.concat_tables(
+                # Not partitioned, the pair is already a column of the files
+                [pq.read_table(self.path / file, partitioning=None) for file in files],
+                promote_options='default',
+            ).sort_by(self.event_time_column)
+            table = _latest_by_key(table, self.dedup_keys)
+            relative_path = os.path.join(partition, _file_name())
+            pq.write_table(
+                table, self.path / relative_path, row_group_size=self.row_group_size
+            )
+
+            # Swap the files in the index before deleting them
+            with self._lock:
+                for file in files:
+                    del self._index[file]
+                self._index[relative_path] = _file_entry(table, self.event_time_column)
+                write_index(self.path, self._index)
+            for file in files:
+                (self.path / file).unlink(missing_ok=True)
+            n_merged += len(files)
+
+        return n_merged
+
+    def start_compaction(self, interval_seconds: float) -> None:
+        """
+        Compact the partitions every `interval_seconds` seconds in a background thread.
+        """
+
+        def run():
+            while not self._stop.wait(interval_seconds):
+                try:
+                    start = time.monotonic()
+                    n_merged = self.compact()
+                    if n_merged:
+                        logger.info(
+                            f'Compacted {n_merged} files in {time.monotonic() - start:.1f}s'
+                        )
+                except Exception as err:
+                    logger.error(f'Compaction failed: {err!r}')
+
+        self._compaction_thread = threading.Thread(
+            target=run, name='feature-store-compaction', daemon=True
+        )
+        self._compaction_thread.start()
+
+    @property
+    def n_files(self) -> int:
+        return len(self._index)
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+
+
+def read_index(path: Path) -> dict[str, dict]:
+    """
+    The min/max event time and number of rows of every file of a store.
+    """
+    try:
+        with open(path / INDEX_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_index(path: Path, index: dict[str, dict]) -> None:
+    tmp_path = path / f'{INDEX_FILE}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path / INDEX_FILE)
+
+
+def select_files(
+    path: str,
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+    pairs: Optional[list[str]] = None,
+    partition_column: str = 'pair',
+) -> list[str]:
+    """
+    The files of a store that may have rows with an event time in [start_ms, end_ms)
+    for one of the pairs, from the index.
+    """
+    partitions = {f'{partition_column}={quote(pair, safe="")}' for pair in pairs or []}
+    files = []
+    for relative_path, entry in read_index(Path(path)).items():
+        if start_ms is not None and entry['max'] < start_ms:
+            continue
+        if end_ms is not None and entry['min'] >= end_ms:
+            continue
+        if partitions and relative_path.split('/')[0] not in partitions:
+            continue
+        files.append(os.path.join(path, relative_path))
+    return sorted(files)
+
+
+def read_range(
+    path: str,
+    event_time_column: str,
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+    pairs: Optional[list[str]] = None,
+    columns: Optional[list[str]] = None,
+    partition_column: str = 'pair',
+) -> pa.Table:
+    """
+    Read the rows with an event time in [start_ms, end_ms), skipping the files that do
+    not overlap the range.
+
+    The files are read with the union of their schemas, so a column that is null in
+    some files (e.g. written before `_cast_null_columns`) and float in others is read
+    as float. Their pandas metadata is dropped, it would convert such a column back to
+    null in `to_pandas`.
+    """
+    files = select_files(path, start_ms, end_ms, pairs, partition_column)
+    if not files:
+        return pa.table({})
+    schema = pa.unify_schemas(
+        [pq.read_schema(file).remove_metadata() for file in files]
+    )
+    condition = None
+    for expression in (
+        ds.field(event_time_column) >= start_ms if start_ms is not None else None,
+        ds.field(event_time_column) < end_ms if end_ms is not None else None,
+        ds.field(partition_column).isin(pairs) if pairs else None,
+    ):
+        if expression is not None:
+            condition = expression if condition is None else condition & expression
+    return ds.dataset(files, schema=schema, format='parquet').to_table(
+        columns=columns, filter=condition
+    )
+
+
+class LocalFeatureStoreSink(BatchingSink):
+    """
+    Write the batches to a local `ParquetFeatureStore` instead of Hopsworks, to
+    develop, load-test and train offline without any external service.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        event_time_column: str,
+        dedup_keys: Optional[list[str]] = None,
+        compaction_min_files: int = 10,
+        compaction_interval_seconds: float = 60.0,
+        latency_tracing: bool = False,
+    ):
+        self.dedup_keys = dedup_keys or []
+        self.recorder = LatencyRecorder('to-feature-store') if latency_tracing else None
+        self.stage_metrics = StageMetrics('to-feature-store')
+        self.store = ParquetFeatureStore(
+            path,
+            event_time_column,
+            dedup_keys=self.dedup_keys,
+            compaction_min_files=compaction_min_files,
+        )
+        self.store.start_compaction(compaction_interval_seconds)
+
+        # Counters of the messages received, and of the rows inserted after collapsing
+        self.received = 0
+        self.inserted = 0
+
+        # Call constructor of the parent class to make sure the batches are initialized
+        super().__init__()
+
+    def write(self, batch: SinkBatch):
+        values = [item.value for item in batch]
+        latest = latest_by_key(values, self.dedup_keys)
+        start = time.perf_counter()
+        self.store.insert(to_dataframe(latest))
+        self.stage_metrics.batch(len(values), len(latest), time.perf_counter() - start)
+        if self.recorder is not None:
+            out_us = now_us()
+            for item in batch:
+                self.recorder.record(item.headers, item.value, out_us)
+        self.received += len(values)
+        self.inserted += len(latest)
+
+    def background_writer(self, max_in_flight: int) -> BackgroundWriter:
+        """
+        A writer inserting into the same store from a pool of threads, see
+        `run_background_writes`.
+        """
+        return BackgroundWriter(
+            self.store,
+            max_in_flight=max_in_flight,
+            dedup_keys=self.dedup_keys,
+            recorder=self.recorder,
+            stage_metrics=self.stage_metrics,
+        )
+
+    def add(self, value, key, timestamp, headers, topic, partition, offset):
+        if self.recorder is not None:
+            # The time the message was consumed, before waiting for the batch
+            headers = stamp(headers, self.recorder.stage, 'in')
+        super().add(value, key, timestamp, headers, topic, partition, offset)
+
+
+def _cast_null_columns(table: pa.Table) -> pa.Table:
+    """
+    Cast the columns without any value to float64. The NaN indicators of the first
+    candles are serialized as null, so a batch of them would be written with null
+    columns, which can't be read together with the float columns of other files.
+    The pandas metadata of the table still has the null type, it is dropped by the
+    caller.
+    """
+    for i, field in enumerate(table.schema):
+        if pa.types.is_null(field.type):
+            table = table.set_column(
+                i, field.with_type(pa.float64()), table.column(i).cast(pa.float64())
+            )
+    return table
+
+
+def _latest_by_key(table: pa.Table, keys: list[str]) -> pa.Table:
+    """
+    The last row of each key of a table sorted by event time, in the same order. The
+    sort is stable, so of rows with the same event time the one of the latest file is
+    kept.
+    """
+    if not keys:
+        return table
+    last_rows = (
+        table.select(keys)
+        .append_column('_row', pa.array(range(table.num_rows), pa.int64()))
+        .group_by(keys, use_threads=False)
+        .aggregate([('_row', 'max')])['_row_max']
+    )
+    return table.take(last_rows.sort())
+
+
+def _new_file(partition_column: str, key: str, date: str) -> str:
+    return os.path.join(
+        f'{partition_column}={quote(str(key), safe="")}', f'date={date}', _file_name()
+    )
+
+
+def _file_name() -> str:
+    return f'part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet'
+
+
+def _file_entry(table: pa.Table, event_time_column: str) -> dict:
+    min_max = pc.min_max(table[event_time_column])
+    return {
+        'min': min_max['min'].as_py(),
+        'max': min_max['max'].as_py(),
+        'rows': table.num_rows,
+    }
@@ -1,3 +1,9 @@
+from typing import Union
+
+from background_writer import run_background_writes
+from common.instrumentation import REGISTRY, consumer_stats_config, start_metrics_server
+from common.wire_format import WireDeserializer
+from local_store import LocalFeatureStoreSink
 from loguru import logger
 from quixstreams import Application
 from sinks import HopsworksFeatureStoreSink
@@ -9,12 +15,22 @@ def main(
     kafka_input_topic: str,
     feature_group_name: str,
     feature_group_version: int,
-    output_sink: HopsworksFeatureStoreSink,
+    output_sink: Union[HopsworksFeatureStoreSink, LocalFeatureStoreSink],
+    writer_max_in_flight: int = 0,
+    writer_batch_size: int = 1000,
+    metrics_port: int = 0,
 ):
     """
     2 things:
     1. Read messages from Kafka topic
     2. Push messages to Feature Store
+
+    With `writer_max_in_flight` > 0, the messages are inserted from a pool of threads
+    with up to that many batches of `writer_batch_size` messages in flight, instead of
+    the quixstreams sink that stops consuming during each insert.
+
+    With `metrics_port` > 0, the messages, insert times, consumer lag and the size of
+    the local store are served as Prometheus metrics on that port.
     """
     logger.info('Hello from to-feature-store!')
     logger.info(f'Kafka broker address: {kafka_broker_address}')
@@ -22,12 +38,34 @@ def main(
     logger.info(f'Kafka input topic: {kafka_input_topic}')
     logger.info(f'Feature group name: {feature_group_name}')
     logger.info(f'Feature group version: {feature_group_version}')
+    logger.info(f'Writer max in flight: {writer_max_in_flight}')
+    logger.info(f'Metrics port: {metrics_port}')
 
     app = Application(
-        broker_address=kafka_broker_address, consumer_group=kafka_consumer_group
+        broker_address=kafka_broker_address,
+        consumer_group=kafka_consumer_group,
+        # Report the consumer lag to the metrics
+        consumer_extra_config=consumer_stats_config(),
     )
 
-    input_topic = app.topic(kafka_input_topic, value_deserializer='json')
+    if metrics_port:
+        if isinstance(output_sink, LocalFeatureStoreSink):
+            REGISTRY.gauge(
+                'store_files', 'Number of files of the local feature store'
+            ).set_function(lambda: output_sink.store.n_files)
+        start_metrics_server(metrics_port)
+
+    # The binary or JSON messages of the technical-indicators service
+    input_topic = app.topic(kafka_input_topic, value_deserializer=WireDeserializer())
+
+    if writer_max_in_flight > 0:
+        # Insert in the background and commit the offsets once the inserts succeeded
+        writer = output_sink.background_writer(writer_max_in_flight)
+        REGISTRY.gauge(
+            'writer_in_flight', 'Number of batches being inserted'
+        ).set_function(lambda: writer.in_flight)
+        run_background_writes(app, input_topic, writer, batch_size=writer_batch_size)
+        return
 
     sdf = app.dataframe(input_topic)
 
@@ -38,18 +76,32 @@ def main(
 
 
 if __name__ == '__main__':
-    from config import config, hopsworks_credentials
-
-    hopsworks_sink = HopsworksFeatureStoreSink(
-        # Hopsworks credentials
-        api_key=hopsworks_credentials.hopsworks_api_key,
-        project_name=hopsworks_credentials.hopsworks_project_name,
-        # Feature group config
-        feature_group_name=config.feature_group_name,
-        feature_group_version=config.feature_group_version,
-        feature_group_primary_keys=config.feature_group_primary_keys,
-        feature_group_event_time=config.feature_group_event_time,
-    )
+    from config import HopsworksCredentials, config
+
+    if config.feature_store == 'local':
+        # No credentials needed, the features are written to local Parquet files
+        output_sink = LocalFeatureStoreSink(
+            path=config.local_store_path,
+            event_time_column=config.feature_group_event_time,
+            dedup_keys=config.feature_group_dedup_keys,
+            compaction_min_files=config.local_store_compaction_min_files,
+            compaction_interval_seconds=config.local_store_compaction_interval_seconds,
+            latency_tracing=config.latency_tracing,
+        )
+    else:
+        hopsworks_credentials = HopsworksCredentials()
+        output_sink = HopsworksFeatureStoreSink(
+            # Hopsworks credentials
+            api_key=hopsworks_credentials.hopsworks_api_key,
+            project_name=hopsworks_credentials.hopsworks_project_name,
+            # Feature group config
+            feature_group_name=config.feature_group_name,
+            feature_group_version=config.feature_group_version,
+            feature_group_primary_keys=config.feature_group_primary_keys,
+            feature_group_event_time=config.feature_group_event_time,
+            dedup_keys=config.feature_group_dedup_keys,
+            latency_tracing=config.latency_tracing,
+        )
 
     main(
         config.kafka_broker_address,
@@ -57,5 +109,8 @@ if __name__ == '__main__':
         config.kafka_input_topic,
         config.feature_group_name,
         config.feature_group_version,
-        output_sink=hopsworks_sink,
+        output_sink=output_sink,
+        writer_max_in_flight=config.writer_max_in_flight,
+        writer_batch_size=config.writer_batch_size,
+        metrics_port=config.metrics_port,
     )
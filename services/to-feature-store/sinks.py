@@ -1,6 +1,12 @@
+import time
+
 import hopsworks
-import pandas as pd
+from background_writer import BackgroundWriter
+from common.instrumentation import StageMetrics
+from common.tracing import LatencyRecorder, now_us, stamp
+from loguru import logger
 from quixstreams.sinks.base import BatchingSink, SinkBackpressureError, SinkBatch
+from transform import latest_by_key, to_dataframe
 
 
 class SinkError(Exception):
@@ -19,12 +25,26 @@ class HopsworksFeatureStoreSink(BatchingSink):
         feature_group_version: int,
         feature_group_primary_keys: list[str],
         feature_group_event_time: str,
+        dedup_keys: list[str] | None = None,
+        latency_tracing: bool = False,
     ):
         """
         Initialize a connection to the Hopsworks Feature Store
+
+        Args:
+            dedup_keys (list[str] | None): The columns identifying a row, each batch is collapsed to the last message of each of them before the insert. No collapsing if None or empty.
+            latency_tracing (bool): Record the latency of the messages from their headers, once inserted, see common/tracing.py.
         """
         self.feature_group_name = feature_group_name
         self.feature_group_version = feature_group_version
+        self.dedup_keys = dedup_keys or []
+
+        # Counters of the messages received, and of the rows inserted after collapsing
+        self.received = 0
+        self.inserted = 0
+
+        self.recorder = LatencyRecorder('to-feature-store') if latency_tracing else None
+        self.stage_metrics = StageMetrics('to-feature-store')
 
         # Establish a connection to the Hopsworks Feature Store
         project = hopsworks.login(api_key_value=api_key, project=project_name)
@@ -39,15 +59,45 @@ class HopsworksFeatureStoreSink(BatchingSink):
             online_enabled=True,
         )
 
+        # Store as float32 the columns the feature group already declares as float
+        self._float32_columns = {
+            feature.name
+            for feature in (self._fg.features or [])
+            if feature.type == 'float'
+        }
+
         # Call constructor of the parent class to make sure the batches are initialized
         super().__init__()
 
+    def background_writer(self, max_in_flight: int) -> BackgroundWriter:
+        """
+        A writer inserting into the same feature group from a pool of threads, with
+        the same collapsing of the batches, see `run_background_writes`.
+        """
+        return BackgroundWriter(
+            self._fg,
+            max_in_flight=max_in_flight,
+            dedup_keys=self.dedup_keys,
+            float32_columns=self._float32_columns,
+            recorder=self.recorder,
+            stage_metrics=self.stage_metrics,
+        )
+
+    def add(self, value, key, timestamp, headers, topic, partition, offset):
+        if self.recorder is not None:
+            # The time the message was consumed, before waiting for the batch
+            headers = stamp(headers, self.recorder.stage, 'in')
+        super().add(value, key, timestamp, headers, topic, partition, offset)
+
     def write(self, batch: SinkBatch):
-        # Transform the batch into a pandas DataFrame
-        data = [item.value for item in batch]
-        data = pd.DataFrame(data)
+        # Keep the last update of each row, and transform the batch into a pandas
+        # DataFrame
+        values = [item.value for item in batch]
+        latest = latest_by_key(values, self.dedup_keys)
+        data = to_dataframe(latest, self._float32_columns)
 
         # Insert the data into the feature group
+        start = time.perf_counter()
         try:
             self._fg.insert(data)
         except TimeoutError as err:
@@ -80,3 +130,22 @@ class HopsworksFeatureStoreSink(BatchingSink):
                 topic=batch.topic,
                 partition=batch.partition,
             ) from err
+
+        self.stage_metrics.batch(len(values), len(latest), time.perf_counter() - start)
+        if self.recorder is not None:
+            out_us = now_us()
+            for item in batch:
+                self.recorder.record(item.headers, item.value, out_us)
+
+        self.received += len(values)
+        self.inserted += len(latest)
+        logger.info(
+            f'Inserted {len(latest)} rows from {len(values)} messages '
+            f'({len(values) - len(latest)} collapsed). '
+            f'Total: received={self.received}, inserted={self.inserted}, '
+            f'collapsed={self.collapsed}'
+        )
+
+    @property
+    def collapsed(self) -> int:
+        return self.received - self.inserted
@@ -0,0 +1,269 @@
+"""
+The background writer against a local fake feature group.
+"""
+
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Optional
+
+import pandas as pd
+import pytest
+from background_writer import (
+    AdaptiveBackoff,
+    BackgroundWriter,
+    InsertError,
+    run_background_writes,
+)
+from confluent_kafka import KafkaException, TopicPartition
+
+TOPIC_PARTITION = ('technical-indicators', 0)
+
+
+class FakeFeatureGroup:
+    """
+    A feature group keeping the inserted rows in memory, with inserts taking a random
+    time so they complete out of order.
+
+    Every `timeout_every`-th insert raises a TimeoutError, like an overloaded feature
+    store, and the inserts of a batch with the row `reject_id` raise a ValueError, like
+    invalid data. The last row inserted for each of the `primary_keys` is kept in
+    `rows`, like the online store.
+    """
+
+    def __init__(
+        self,
+        timeout_every: int = 0,
+        reject_id: Optional[int] = None,
+        max_delay_seconds: float = 0.01,
+        primary_keys: tuple[str, ...] = ('id',),
+    ):
+        self.timeout_every = timeout_every
+        self.reject_id = reject_id
+        self.max_delay_seconds = max_delay_seconds
+        self.primary_keys = primary_keys
+        self.ids: list[int] = []
+        self.rows: dict[tuple, dict] = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def insert(self, data: pd.DataFrame) -> None:
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        time.sleep(random.uniform(0, self.max_delay_seconds))
+
+        ids = data['id'].tolist()
+        if self.reject_id is not None and self.reject_id in ids:
+            raise ValueError(f'Invalid row {self.reject_id}')
+        if self.timeout_every and call % self.timeout_every == 0:
+            raise TimeoutError(f'Insert {call} timed out')
+        with self._lock:
+            self.ids.extend(ids)
+            for row in data.to_dict('records'):
+                self.rows[tuple(row[key] for key in self.primary_keys)] = row
+
+
+class FakeMessage:
+    def __init__(self, topic: str, partition: int, offset: int, value: dict):
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._value = json.dumps(value).encode()
+
+    def error(self) -> None:
+        return None
+
+    def value(self) -> bytes:
+        return self._value
+
+    def headers(self) -> None:
+        return None
+
+    def topic(self) -> str:
+        return self._topic
+
+    def partition(self) -> int:
+        return self._partition
+
+    def offset(self) -> int:
+        return self._offset
+
+
+class StopConsuming(Exception):
+    pass
+
+
+class FakeConsumer:
+    """
+    A consumer polling the messages of `events`, where 'revoke' revokes the partition
+    1 of the topic, then raising StopConsuming once the last batch is over.
+
+    The first commit raises a KafkaException, like during a rebalance, and the offsets
+    of the other ones are kept in `committed`.
+    """
+
+    def __init__(self, events: list):
+        self.events = list(events)
+        self.committed: list[dict[tuple[str, int], int]] = []
+        self.commits = 0
+        self.on_revoke = None
+        self.done = False
+
+    def __enter__(self) -> 'FakeConsumer':
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+    def subscribe(self, topics: list[str], on_revoke) -> None:
+        self.on_revoke = on_revoke
+
+    def poll(self, timeout: float) -> Optional[FakeMessage]:
+        if not self.events:
+            if self.done:
+                raise StopConsuming()
+            # Let the last batch time out
+            self.done = True
+            time.sleep(timeout)
+            return None
+        event = self.events.pop(0)
+        if event == 'revoke':
+            self.on_revoke(self, [TopicPartition(TOPIC_PARTITION[0], 1)])
+            return None
+        return event
+
+    def commit(self, offsets: list[TopicPartition], asynchronous: bool) -> None:
+        self.commits += 1
+        if self.commits == 1:
+            raise KafkaException('Rebalance in progress')
+        self.committed.append(
+            {(offset.topic, offset.partition): offset.offset for offset in offsets}
+        )
+
+
+def make_batch(batch: int, batch_size: int = 10) -> tuple[list[dict], dict]:
+    """
+    The messages of a batch, each with an `id` which is also its offset.
+    """
+    values = [
+        {'id': batch * batch_size + i, 'close': 100.0 + i} for i in range(batch_size)
+    ]
+    return values, {TOPIC_PARTITION: values[-1]['id']}
+
+
+def make_writer(
+    feature_group: FakeFeatureGroup, dedup_keys: Optional[list[str]] = None, **kwargs
+) -> BackgroundWriter:
+    return BackgroundWriter(
+        feature_group,
+        max_in_flight=4,
+        dedup_keys=dedup_keys or ['id'],
+        backoff=AdaptiveBackoff(initial_seconds=0.001, max_seconds=0.01),
+        **kwargs,
+    )
+
+
+def test_commits_in_order_with_retried_timeouts():
+    feature_group = FakeFeatureGroup(timeout_every=3)
+    writer = make_writer(feature_group)
+
+    committed = -1
+    for batch in range(50):
+        offsets = writer.submit(*make_batch(batch))
+        writer.raise_if_failed()
+        if offsets:
+            # Handed back in order, only once every message up to them was inserted
+            assert offsets[TOPIC_PARTITION] > committed
+            committed = offsets[TOPIC_PARTITION]
+            assert set(range(committed + 1)) <= set(feature_group.ids)
+    committed = writer.close().get(TOPIC_PARTITION, committed)
+
+    assert committed == 499
+    assert sorted(feature_group.ids) == list(range(500))
+    assert writer.retries > 0
+    assert writer.received == writer.inserted == 500
+
+
+def test_stops_at_rejected_batch():
+    # The row 205 is in the batch 20
+    feature_group = FakeFeatureGroup(timeout_every=3, reject_id=205)
+    writer = make_writer(feature_group)
+
+    committed = -1
+    with pytest.raises(InsertError, match='Invalid data format'):
+        for batch in range(50):
+            offsets = writer.submit(*make_batch(batch))
+            committed = offsets.get(TOPIC_PARTITION, committed)
+            writer.raise_if_failed()
+    committed = writer.close().get(TOPIC_PARTITION, committed)
+
+    # Nothing from the rejected batch on is committed, so it is consumed again
+    assert committed == 199
+    assert 205 not in feature_group.ids
+    # At most `max_in_flight` batches were submitted after the rejected one
+    assert batch <= 20 + writer.max_in_flight
+
+
+def test_last_update_of_each_row_wins():
+    # Updates of the candles of 3 pairs, each candle spanning about 3 batches
+    feature_group = FakeFeatureGroup(
+        timeout_every=5, primary_keys=('pair', 'window_start_ms')
+    )
+    writer = make_writer(feature_group, dedup_keys=['pair', 'window_start_ms'])
+
+    for batch in range(50):
+        values = [
+            {
+                'id': batch * 6 + i,
+                'pair': f'PAIR{i % 3}/USD',
+                'window_start_ms': (batch * 6 + i) // 18 * 60_000,
+            }
+            for i in range(6)
+        ]
+        writer.submit(values, {TOPIC_PARTITION: values[-1]['id']})
+        writer.raise_if_failed()
+    writer.close()
+
+    # Whatever order the inserts completed in, each row has its latest update
+    expected = {}
+    for id_ in range(300):
+        expected[f'PAIR{id_ % 3}/USD', id_ // 18 * 60_000] = id_
+    assert {key: row['id'] for key, row in feature_group.rows.items()} == expected
+
+
+def test_drops_the_messages_of_revoked_partitions():
+    topic = TOPIC_PARTITION[0]
+
+    def message(partition: int, offset: int) -> FakeMessage:
+        return FakeMessage(topic, partition, offset, {'id': partition * 100 + offset})
+
+    # A first batch from both partitions, and the partition 1 revoked in the middle
+    # of the second one
+    consumer = FakeConsumer(
+        [message(0, offset) for offset in range(5)]
+        + [message(1, offset) for offset in range(5)]
+        + [message(1, 5), message(1, 6), 'revoke']
+        + [message(0, offset) for offset in range(5, 10)]
+    )
+    app = SimpleNamespace(get_consumer=lambda auto_commit_enable: consumer)
+    feature_group = FakeFeatureGroup()
+
+    # The failed commit is logged, not raised
+    with pytest.raises(StopConsuming):
+        run_background_writes(
+            app,
+            SimpleNamespace(name=topic),
+            make_writer(feature_group),
+            batch_size=10,
+            batch_timeout_seconds=0.1,
+        )
+
+    # The messages of the partition 1 polled before it was revoked are left to the
+    # consumer that gets it
+    assert sorted(feature_group.ids) == [*range(10), *range(100, 105)]
+    assert consumer.commits > len(consumer.committed)
+    assert all(offsets.get((topic, 1), 0) <= 5 for offsets in consumer.committed)
+    assert consumer.committed[-1] == {(topic, 0): 10}
@@ -0,0 +1,126 @@
+"""
+The point-in-time training dataset, on a small synthetic store whose feature is the
+time its candle is available at, so a row reading data from its future is visible.
+"""
+
+import numpy as np
+import pytest
+from build_dataset import build_dataset, load_dataset
+from local_store import ParquetFeatureStore
+from transform import to_dataframe
+
+START_MS = 1_700_000_400_000
+MINUTE_MS = 60_000
+N_MINUTES = 180
+# A candle of BTC/USD missing from the store
+MISSING_MINUTE = 50
+
+
+def candle_rows(pair: str, candle_seconds: int, window: int) -> list[dict]:
+    """
+    An incomplete update and the final version of a candle, whose feature and close
+    are the minutes from START_MS to the end of its window.
+    """
+    window_ms = candle_seconds * 1000
+    window_start_ms = START_MS + window * window_ms
+    window_end_ms = window_start_ms + window_ms
+    minutes = (window_end_ms - START_MS) / MINUTE_MS
+    row = {
+        'pair': pair,
+        'candle_seconds': candle_seconds,
+        'window_start_ms': window_start_ms,
+        'window_end_ms': window_end_ms,
+    }
+    return [
+        {**row, 'timestamp_ms': window_start_ms + 1_000, 'close': -1.0, 'f': -1.0},
+        {
+            **row,
+            'timestamp_ms': window_end_ms - 1_000,
+            'close': 1_000.0 + minutes,
+            'f': minutes,
+        },
+    ]
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    store = ParquetFeatureStore(str(tmp_path / 'store'), 'timestamp_ms')
+    for pair in ('BTC/USD', 'ETH/USD'):
+        rows = []
+        for minute in range(N_MINUTES):
+            if pair == 'BTC/USD' and minute == MISSING_MINUTE:
+                continue
+            rows.extend(candle_rows(pair, 60, minute))
+        for window in range(N_MINUTES // 5):
+            rows.extend(candle_rows(pair, 300, window))
+        # Inserted in several batches, so the updates of a candle are in different files
+        for batch in range(0, len(rows), 97):
+            store.insert(to_dataframe(rows[batch : batch + 97]))
+    return str(tmp_path / 'store')
+
+
+def build(store_path, output_dir, chunk_days):
+    n_rows = build_dataset(
+        store_path,
+        str(output_dir),
+        features=['f'],
+        candle_seconds=60,
+        horizon=2,
+        target='close',
+        extra_timeframes=[300],
+        chunk_days=chunk_days,
+    )
+    X, y, metadata = load_dataset(str(output_dir))
+    times = np.load(output_dir / 'window_end_ms.npy', mmap_mode='r')
+    pair_ids = np.load(output_dir / 'pair_ids.npy', mmap_mode='r')
+    pairs = np.array(metadata['pairs'])[pair_ids]
+    assert len(X) == len(y) == len(times) == len(pairs) == n_rows == metadata['rows']
+    return X, y, times, pairs, metadata
+
+
+def test_no_row_sees_the_future(store_path, tmp_path):
+    X, y, times, pairs, metadata = build(store_path, tmp_path / 'dataset', 1.0)
+
+    assert metadata['features'] == ['f', 'f_300s']
+    minutes = (times - START_MS) // MINUTE_MS
+    # The final version of the candle of the row, available when its window ends
+    assert np.array_equal(X[:, 0], minutes)
+    # The last 300s candle closed at that time, never a later one nor an incomplete one
+    assert np.all(X[:, 1] <= minutes)
+    assert np.array_equal(X[:, 1], minutes // 5 * 5)
+    # The close of the candle exactly 2 windows ahead
+    assert np.array_equal(y, 1_000 + minutes + 2)
+    # In time order
+    assert np.all(np.diff(times) >= 0)
+
+
+def test_rows_without_the_horizon_candle_are_dropped(store_path, tmp_path):
+    _, _, times, pairs, _ = build(store_path, tmp_path / 'dataset', 1.0)
+
+    btc_minutes = set((times[pairs == 'BTC/USD'] - START_MS) // MINUTE_MS)
+    eth_minutes = set((times[pairs == 'ETH/USD'] - START_MS) // MINUTE_MS)
+    # From the close of the first 300s candle, to the last candle with a candle 2
+    # windows ahead
+    assert eth_minutes == set(range(5, N_MINUTES - 1))
+    # Without the missing candle, nor the one whose horizon candle is missing
+    assert btc_minutes == eth_minutes - {MISSING_MINUTE + 1, MISSING_MINUTE - 1}
+
+
+def test_chunks_neither_duplicate_nor_lose_rows(store_path, tmp_path):
+    expected = build(store_path, tmp_path / 'one_chunk', 1.0)
+    # Chunks of 7 minutes and 12 seconds, not aligned on the windows
+    chunked = build(store_path, tmp_path / 'chunks', 0.005)
+
+    for expected_array, array in zip(expected[:4], chunked[:4], strict=True):
+        assert np.array_equal(expected_array, array)
+
+
+def test_arrays_are_memory_mapped(store_path, tmp_path):
+    X, y, _, _, _ = build(store_path, tmp_path / 'dataset', 1.0)
+
+    assert isinstance(X, np.memmap) and isinstance(y, np.memmap)
+    assert X.dtype == np.float32 and y.dtype == np.float32
+    assert np.array_equal(
+        np.load(tmp_path / 'dataset' / 'X.npy', mmap_mode='r'),
+        np.load(tmp_path / 'dataset' / 'X.npy'),
+    )
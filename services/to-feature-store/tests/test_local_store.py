@@ -0,0 +1,141 @@
+"""
+The local Parquet feature store: the index, the compaction, the time ranges and the
+null indicators of the first candles.
+"""
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from local_store import ParquetFeatureStore, read_range, select_files
+from transform import to_dataframe
+
+START_MS = 1_700_000_000_000
+
+
+def make_rows(pair: str, start_ms: int, rsi: list) -> list[dict]:
+    return [
+        {'pair': pair, 'timestamp_ms': start_ms + i * 60_000, 'rsi': value}
+        for i, value in enumerate(rsi)
+    ]
+
+
+def test_null_columns_are_written_as_float(tmp_path):
+    store = ParquetFeatureStore(str(tmp_path), 'timestamp_ms')
+    # The NaN of the first candles are serialized as null
+    store.insert(to_dataframe(make_rows('BTC/USD', START_MS, [None, None])))
+    store.insert(to_dataframe(make_rows('BTC/USD', START_MS + 120_000, [50.0, 51.0])))
+
+    for file in tmp_path.glob('**/*.parquet'):
+        assert pq.read_schema(file).field('rsi').type == pa.float64()
+
+    table = read_range(str(tmp_path), 'timestamp_ms')
+    assert table.sort_by('timestamp_ms')['rsi'].to_pylist() == [None, None, 50.0, 51.0]
+
+    # And compacted together
+    store.compaction_min_files = 2
+    assert store.compact() == 2
+    table = read_range(str(tmp_path), 'timestamp_ms', START_MS + 60_000)
+    assert table['rsi'].to_pylist() == [None, 50.0, 51.0]
+    assert table.to_pandas()['rsi'].tolist()[1:] == [50.0, 51.0]
+
+
+def test_read_null_files_with_float_files(tmp_path):
+    store = ParquetFeatureStore(str(tmp_path), 'timestamp_ms')
+    store.insert(to_dataframe(make_rows('BTC/USD', START_MS, [50.0])))
+    store.insert(to_dataframe(make_rows('ETH/USD', START_MS, [40.0, 41.0])))
+
+    # A file with a null column, like the ones written before they were cast, read
+    # first
+    null_file = next((tmp_path / 'pair=BTC%2FUSD').glob('**/*.parquet'))
+    pq.write_table(
+        pa.Table.from_pandas(
+            to_dataframe(make_rows('BTC/USD', START_MS, [None])), preserve_index=False
+        ),
+        null_file,
+    )
+
+    table = read_range(str(tmp_path), 'timestamp_ms', pairs=['ETH/USD', 'BTC/USD'])
+    assert table.schema.field('rsi').type == pa.float64()
+    rows = table.sort_by([('pair', 'ascending'), ('timestamp_ms', 'ascending')])
+    assert rows['rsi'].to_pylist() == [None, 40.0, 41.0]
+    assert rows.to_pandas()['rsi'].tolist()[1:] == [40.0, 41.0]
+
+
+def test_select_files_from_the_index(tmp_path):
+    store = ParquetFeatureStore(str(tmp_path), 'timestamp_ms')
+    # A file per insert, with the candles of [0, 3) then [3, 6) minutes
+    store.insert(to_dataframe(make_rows('BTC/USD', START_MS, [1.0, 2.0, 3.0])))
+    store.insert(
+        to_dataframe(make_rows('BTC/USD', START_MS + 180_000, [4.0, 5.0, 6.0]))
+    )
+    store.insert(to_dataframe(make_rows('ETH/USD', START_MS, [7.0])))
+    path = str(tmp_path)
+
+    assert len(select_files(path)) == 3
+    assert len(select_files(path, pairs=['ETH/USD'])) == 1
+    # The first file ends at 2 minutes, the second starts at 3
+    assert len(select_files(path, START_MS + 150_000, START_MS + 180_000)) == 0
+    assert len(select_files(path, START_MS + 120_000, START_MS + 180_000)) == 1
+    assert len(select_files(path, START_MS, START_MS + 240_000)) == 3
+    assert len(select_files(path, START_MS + 150_000, pairs=['BTC/USD'])) == 1
+    # The end is excluded
+    assert len(select_files(path, end_ms=START_MS, pairs=['BTC/USD'])) == 0
+
+
+def test_read_range_bounds(tmp_path):
+    store = ParquetFeatureStore(str(tmp_path), 'timestamp_ms')
+    store.insert(to_dataframe(make_rows('BTC/USD', START_MS, [1.0, 2.0, 3.0, 4.0])))
+    store.insert(to_dataframe(make_rows('ETH/USD', START_MS, [5.0, 6.0])))
+
+    table = read_range(
+        str(tmp_path), 'timestamp_ms', START_MS + 60_000, START_MS + 180_000
+    )
+    rows = table.sort_by([('pair', 'ascending'), ('timestamp_ms', 'ascending')])
+    assert rows['rsi'].to_pylist() == [2.0, 3.0, 6.0]
+
+    table = read_range(
+        str(tmp_path), 'timestamp_ms', START_MS + 60_000, pairs=['BTC/USD']
+    )
+    assert sorted(table['rsi'].to_pylist()) == [2.0, 3.0, 4.0]
+    assert read_range(str(tmp_path), 'timestamp_ms', START_MS + 600_000).num_rows == 0
+
+
+def test_compaction_keeps_the_latest_update_of_each_key(tmp_path):
+    store = ParquetFeatureStore(
+        str(tmp_path),
+        'timestamp_ms',
+        dedup_keys=['pair', 'window_start_ms'],
+        compaction_min_files=3,
+    )
+    # The updates of 2 candles, inserted in different batches
+    for timestamp_ms, window_start_ms, rsi in [
+        (START_MS + 1_000, START_MS, 1.0),
+        (START_MS + 30_000, START_MS, 2.0),
+        (START_MS + 61_000, START_MS + 60_000, 3.0),
+        (START_MS + 59_000, START_MS, 4.0),
+        (START_MS + 90_000, START_MS + 60_000, 5.0),
+    ]:
+        store.insert(
+            to_dataframe(
+                [
+                    {
+                        'pair': 'BTC/USD',
+                        'timestamp_ms': timestamp_ms,
+                        'window_start_ms': window_start_ms,
+                        'rsi': rsi,
+                    }
+                ]
+            )
+        )
+    store.insert(to_dataframe(make_rows('ETH/USD', START_MS, [6.0])))
+
+    # Only the partition of BTC/USD has enough files
+    assert store.compact() == 5
+    assert store.n_files == 2
+    files = select_files(str(tmp_path), pairs=['BTC/USD'])
+    assert len(files) == 1
+    assert len(list(tmp_path.glob('pair=BTC%2FUSD/**/*.parquet'))) == 1
+
+    table = pq.read_table(files[0], partitioning=None)
+    assert table['timestamp_ms'].to_pylist() == [START_MS + 59_000, START_MS + 90_000]
+    assert table['rsi'].to_pylist() == [4.0, 5.0]
+    assert read_range(str(tmp_path), 'timestamp_ms').num_rows == 3
@@ -0,0 +1,56 @@
+from typing import Iterable
+
+import pandas as pd
+import pyarrow as pa
+
+
+def latest_by_key(values: list[dict], keys: list[str]) -> list[dict]:
+    """
+    Collapse the messages of a batch to the last one of each key.
+
+    The candles are emitted incrementally, so most of the messages of a batch are
+    updates of the same candle superseded by a later one. The messages are kept in
+    the order of the first message of each key.
+
+    Args:
+        values (list[dict]): The messages of the batch, in the order of the topic.
+        keys (list[str]): The columns identifying a row, no collapsing if empty.
+
+    Returns:
+        list[dict]: The last message of each key.
+    """
+    if not keys:
+        return values
+    latest = {}
+    for value in values:
+        latest[tuple(value[key] for key in keys)] = value
+    return list(latest.values())
+
+
+def to_dataframe(
+    values: list[dict], float32_columns: Iterable[str] = ()
+) -> pd.DataFrame:
+    """
+    Transform the messages of a batch into a pandas DataFrame to insert, built column
+    by column into Arrow arrays instead of row by row.
+
+    Args:
+        values (list[dict]): The messages of the batch, all with the same fields.
+        float32_columns (Iterable[str]): The float columns to store as float32.
+
+    Returns:
+        pd.DataFrame: An Arrow-backed DataFrame with a column per field.
+    """
+    if not values:
+        return pd.DataFrame()
+
+    float32_columns = set(float32_columns)
+    arrays = []
+    for name in values[0]:
+        array = pa.array([value.get(name) for value in values])
+        if name in float32_columns and pa.types.is_floating(array.type):
+            array = array.cast(pa.float32())
+        arrays.append(array)
+
+    table = pa.Table.from_arrays(arrays, names=list(values[0]))
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
@@ -0,0 +1,90 @@
+"""
+Microbenchmark of the trade parsing and serialization, with and without validation.
+
+Usage:
+    python -m benchmarks.parse_trades --frames 20000 --trades-per-frame 10
+"""
+
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from kraken_api.trade import FastTrade
+from kraken_api.websocket import parse_trades
+from quixstreams.models.topics import Topic
+
+
+def make_frames(n_frames: int, trades_per_frame: int, seed: int = 42) -> List[str]:
+    """
+    Build raw Kraken trade messages with random prices and volumes.
+    """
+    rng = random.Random(seed)
+    start = datetime(2024, 12, 1, tzinfo=timezone.utc)
+    frames = []
+    for i in range(n_frames):
+        trades = []
+        for j in range(trades_per_frame):
+            timestamp = start + timedelta(milliseconds=i * 37 + j)
+            trades.append(
+                {
+                    'symbol': rng.choice(['BTC/USD', 'ETH/USD', 'SOL/USD']),
+                    'side': rng.choice(['buy', 'sell']),
+                    'price': round(rng.uniform(100, 100_000), 2),
+                    'qty': round(rng.uniform(0.0001, 10), 8),
+                    'ord_type': 'market',
+                    'trade_id': i * trades_per_frame + j,
+                    'timestamp': timestamp.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+                }
+            )
+        frames.append(
+            json.dumps({'channel': 'trade', 'type': 'update', 'data': trades})
+        )
+    return frames
+
+
+def run(frames: List[str], validate: bool, topic: Topic) -> float:
+    """
+    Parse and serialize all the frames, as the trades service does.
+
+    Returns:
+        float: The number of trades per second.
+    """
+    n_trades = 0
+    start = time.perf_counter()
+    for frame in frames:
+        for trade in parse_trades(frame, validate=validate):
+            if isinstance(trade, FastTrade):
+                trade.to_json()
+            else:
+                topic.serialize(key=trade.pair, value=trade.to_dict())
+            n_trades += 1
+    return n_trades / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--frames', type=int, default=20_000)
+    parser.add_argument('--trades-per-frame', type=int, default=10)
+    args = parser.parse_args()
+
+    frames = make_frames(args.frames, args.trades_per_frame)
+    topic = Topic(name='trades', value_serializer='json')
+
+    # Both paths must produce the same messages
+    for frame in frames[:100]:
+        for strict, fast in zip(
+            parse_trades(frame, validate=True),
+            parse_trades(frame, validate=False),
+            strict=True,
+        ):
+            assert topic.serialize(value=strict.to_dict()).value == fast.to_json()
+
+    for validate in (True, False):
+        trades_per_second = run(frames, validate, topic)
+        print(
+            f'{"validated" if validate else "fast":>9} path: '
+            f'{trades_per_second:,.0f} trades/sec'
+        )
@@ -0,0 +1,133 @@
+"""
+Throughput benchmark of the trades producer against a local Redpanda.
+
+It pushes the same synthetic trades, parsed and serialized the same way, with the
+producer of the service before and after the batching and delivery tracking:
+- before: one `produce` per trade with the default producer config of the
+  application, and no delivery callback
+- tuned config: the same with the linger, batch size and compression of the service
+- after: `produce_trade` (delivery callbacks and backpressure) with the tuned config
+All the producers are created by a quixstreams `Application` like in the service, so
+they have its defaults (e.g. `enable.idempotence`). It reports the trades/sec until
+all of them are acknowledged.
+
+With `--mock-cluster`, each producer runs against its own in-process librdkafka mock
+cluster instead of a broker, which measures the client side only.
+
+Usage:
+    python -m benchmarks.produce_trades --broker-address localhost:19092 --frames 50000
+"""
+
+import argparse
+import time
+
+from benchmarks.parse_trades import make_frames
+from common.wire_format import WireSerializer
+from delivery import DeliveryTracker
+from kraken_api.websocket import parse_trades
+from quixstreams import Application
+from quixstreams.models.topics import Topic
+from run import _prepare_trade, produce_trade
+
+
+def run(
+    broker_address: str,
+    topic_name: str,
+    trades: list,
+    wire_format: str,
+    producer_extra_config: dict,
+    tracked: bool,
+    name: str,
+) -> float:
+    """
+    Produce the trades and wait until they are all delivered.
+
+    Returns:
+        float: The trades/sec.
+    """
+    app = Application(
+        broker_address=broker_address,
+        producer_extra_config=producer_extra_config,
+    )
+    # Not registered in the application, so it is not created beforehand
+    topic = Topic(name=topic_name, value_serializer=WireSerializer(wire_format))
+    tracker = DeliveryTracker(log_interval_seconds=float('inf'))
+
+    with app.get_producer() as producer:
+        start = time.perf_counter()
+        if tracked:
+            for trade in trades:
+                produce_trade(producer, topic, tracker, trade, wire_format=wire_format)
+        else:
+            # The produce loop of the service before the delivery tracking, with the
+            # same serialization
+            for trade in trades:
+                key, value, _, _ = _prepare_trade(
+                    topic, trade, None, None, None, wire_format, None
+                )
+                producer.produce(topic=topic.name, value=value, key=key)
+        remaining = producer.flush()
+        elapsed = time.perf_counter() - start
+
+    trades_per_second = len(trades) / elapsed
+    print(
+        f'{name:>12}: {trades_per_second:,.0f} trades/sec, not delivered={remaining}'
+        + (
+            f', acked={tracker.acked}, failed={tracker.failed}, '
+            f'backpressure waits={tracker.backpressure_waits}'
+            if tracked
+            else ''
+        )
+    )
+    return trades_per_second
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--broker-address', default='localhost:19092')
+    parser.add_argument('--mock-cluster', action='store_true')
+    parser.add_argument('--topic', default='trades_benchmark')
+    parser.add_argument('--frames', type=int, default=50_000)
+    parser.add_argument('--trades-per-frame', type=int, default=10)
+    # The defaults of the service, see config.py
+    parser.add_argument('--validate', action='store_true')
+    parser.add_argument('--wire-format', choices=['json', 'binary'], default='binary')
+    parser.add_argument('--linger-ms', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=1_000_000)
+    parser.add_argument('--compression-type', default='lz4')
+    args = parser.parse_args()
+
+    frames = make_frames(args.frames, args.trades_per_frame)
+    trades = [
+        trade
+        for frame in frames
+        for trade in parse_trades(frame, validate=args.validate)
+    ]
+    print(f'{len(trades)} trades, validate={args.validate}, {args.wire_format}')
+
+    base_config = {'test.mock.num.brokers': 1} if args.mock_cluster else {}
+    tuned_config = {
+        **base_config,
+        'linger.ms': args.linger_ms,
+        'batch.size': args.batch_size,
+        'compression.type': args.compression_type,
+    }
+    print(f'Tuned config: {tuned_config}')
+    runs = [
+        ('before', base_config, False),
+        ('tuned config', tuned_config, False),
+        ('after', tuned_config, True),
+    ]
+    results = [
+        run(
+            args.broker_address,
+            args.topic,
+            trades,
+            args.wire_format,
+            config,
+            tracked=tracked,
+            name=name,
+        )
+        for name, config, tracked in runs
+    ]
+    print(f'After / before: {results[-1] / results[0]:.2f}x')
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, List, Literal, Optional
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -7,7 +7,47 @@ class Config(BaseSettings):
     model_config = SettingsConfigDict(env_file='.env', env_file_encoding='utf-8')
     kafka_broker_address: str
     kafka_topic: str
+    # The partitions and replication factor of the topic, if it is created
+    kafka_topic_partitions: int = 1
+    kafka_topic_replication_factor: int = 1
+    # The load of the hot pairs (e.g. their share of the trades), spread evenly over
+    # the partitions, e.g. {"BTC/USD": 0.4, "ETH/USD": 0.2}. The other pairs are hashed
+    # like the Kafka default partitioner. The synthetic trades use their own shares.
+    pair_weights: Dict[str, float] = {}
     pairs: List[str]
+    kraken_websocket_url: str = 'wss://ws.kraken.com/v2'
+    websocket_mode: Literal['blocking', 'async'] = 'blocking'
+    websocket_connections: int = 1
+    trades_queue_size: int = 10_000
+    # Validate every trade with the pydantic model, for debugging
+    validate_trades: bool = False
+    # Batching and compression of the producer
+    producer_linger_ms: int = 20
+    producer_batch_size: int = 1_000_000
+    producer_compression_type: Literal['none', 'gzip', 'snappy', 'lz4', 'zstd'] = 'lz4'
+    # Record the raw websocket frames to this file
+    record_frames_path: Optional[str] = None
+    # Replay the trades of a recorded file instead of connecting to Kraken,
+    # REPLAY_SPEED times faster than real time (0 for as fast as possible)
+    replay_frames_path: Optional[str] = None
+    replay_speed: float = 1.0
+    # Generate synthetic trades at this aggregate rate instead of connecting to
+    # Kraken, for SYNTHETIC_PAIRS pairs (0 to disable)
+    synthetic_trades_per_second: float = 0
+    synthetic_pairs: int = 200
+    synthetic_seed: int = 42
+    # The timestamp of the first synthetic trade, in ms since the epoch, so the trades
+    # are the same from one run to the next (defaults to the start time of the run)
+    synthetic_start_ms: Optional[int] = None
+    synthetic_max_trades: Optional[int] = None
+    # Add the received and produced times to the headers of the trades, see common/tracing.py
+    latency_tracing: bool = True
+    # The port of the Prometheus metrics endpoint, 0 to disable it
+    metrics_port: int = 9101
+    # The fraction of the trades logged, at most 10 per second
+    log_sample_rate: float = 0.001
+    # The format of the trades, see common/wire_format.py
+    wire_format: Literal['json', 'binary'] = 'binary'
 
 
 config = Config()
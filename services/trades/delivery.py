@@ -0,0 +1,54 @@
+import time
+from typing import Optional
+
+from confluent_kafka import KafkaError, Message
+from loguru import logger
+
+
+class DeliveryTracker:
+    """
+    Count the trades acknowledged by Kafka, and the ones that failed to be delivered,
+    from the delivery callbacks of the producer.
+    """
+
+    def __init__(self, log_interval_seconds: float = 60.0):
+        """
+        Args:
+            log_interval_seconds (float): How often to log the counters.
+        """
+        self.log_interval_seconds = log_interval_seconds
+
+        self.produced = 0
+        self.acked = 0
+        self.failed = 0
+        # Number of times the local producer queue was full and we had to wait
+        self.backpressure_waits = 0
+        self._last_log_time = time.monotonic()
+
+    @property
+    def in_flight(self) -> int:
+        return self.produced - self.acked - self.failed
+
+    def on_delivery(self, err: Optional[KafkaError], msg: Message) -> None:
+        """
+        Delivery callback, called by the producer when polled.
+        """
+        if err is None:
+            self.acked += 1
+        else:
+            self.failed += 1
+            logger.error(f'Failed to deliver trade {msg.key()} to Kafka: {err}')
+
+    def maybe_log(self) -> None:
+        """
+        Log the counters if the log interval has passed.
+        """
+        now = time.monotonic()
+        if now - self._last_log_time < self.log_interval_seconds:
+            return
+        self._last_log_time = now
+        logger.info(
+            f'Trades produced={self.produced}, acked={self.acked}, '
+            f'failed={self.failed}, in flight={self.in_flight}, '
+            f'backpressure waits={self.backpressure_waits}'
+        )
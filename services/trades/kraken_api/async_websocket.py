@@ -0,0 +1,100 @@
+import asyncio
+import json
+from typing import List, Optional
+
+from loguru import logger
+from websockets.asyncio.client import ClientConnection, connect
+from websockets.exceptions import WebSocketException
+
+from .frame_log import FrameRecorder
+from .websocket import KrakenWebsocketAPI, parse_trades
+
+
+class KrakenAsyncWebsocketAPI:
+    """
+    Read trades from the Kraken Websocket API with asyncio, spreading the pairs over
+    several concurrent connections.
+
+    Each connection pushes its trades into a bounded queue, so a slow consumer of the
+    queue slows down the reads instead of buffering trades without limit.
+    Connections are re-established, and the pairs re-subscribed, when they drop.
+    """
+
+    def __init__(
+        self,
+        pairs: List[str],
+        n_connections: int = 1,
+        url: str = KrakenWebsocketAPI.URL,
+        max_reconnect_delay_seconds: float = 30.0,
+        validate: bool = True,
+        record_path: Optional[str] = None,
+    ):
+        """
+        Args:
+            pairs (List[str]): The pairs to subscribe to.
+            n_connections (int): The number of websocket connections to spread the pairs over.
+            url (str): The URL of the websocket API.
+            max_reconnect_delay_seconds (float): The maximum delay between two reconnection attempts.
+            validate (bool): Validate the trades with the `Trade` model, see `parse_trades`.
+            record_path (Optional[str]): Record the raw frames of all the connections to this log file.
+        """
+        self.pairs = pairs
+        self.url = url
+        self.max_reconnect_delay_seconds = max_reconnect_delay_seconds
+        self.validate = validate
+        self._recorder = FrameRecorder(record_path) if record_path else None
+
+        # Spread the pairs round-robin over the connections
+        n_connections = max(1, min(n_connections, len(pairs)))
+        self.shards = [pairs[i::n_connections] for i in range(n_connections)]
+
+    async def run(self, queue: asyncio.Queue) -> None:
+        """
+        Read the trades from all the connections and put them into the queue, until
+        the task is cancelled.
+
+        Args:
+            queue (asyncio.Queue): The queue to put the trades into.
+        """
+        await asyncio.gather(
+            *(self._run_connection(shard, queue) for shard in self.shards)
+        )
+
+    async def _run_connection(self, pairs: List[str], queue: asyncio.Queue) -> None:
+        initial_delay = min(1.0, self.max_reconnect_delay_seconds)
+        delay = initial_delay
+        while True:
+            try:
+                async with connect(self.url) as ws:
+                    await self._subscribe(ws, pairs)
+                    logger.info(f'Subscribed to {pairs} on {self.url}')
+                    delay = initial_delay
+
+                    async for data in ws:
+                        if self._recorder:
+                            self._recorder.write(data)
+                        for trade in parse_trades(data, validate=self.validate):
+                            await queue.put(trade)
+
+                logger.warning(f'Connection closed for {pairs}')
+            except (WebSocketException, OSError) as e:
+                logger.error(f'Connection error for {pairs}: {e}')
+
+            # Wait before reconnecting, backing off exponentially
+            logger.info(f'Reconnecting {pairs} in {delay:.1f} seconds')
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay_seconds)
+
+    async def _subscribe(self, ws: ClientConnection, pairs: List[str]) -> None:
+        await ws.send(
+            json.dumps(
+                {
+                    'method': 'subscribe',
+                    'params': {
+                        'channel': 'trade',
+                        'symbol': pairs,
+                        'snapshot': False,
+                    },
+                }
+            )
+        )
@@ -0,0 +1,132 @@
+import atexit
+import mmap
+import struct
+import time
+import zlib
+from typing import Iterator, Optional, Tuple
+
+from loguru import logger
+
+# Log file layout:
+# - a header with a magic number and the format version,
+# - zlib-compressed blocks, each one prefixed with its compressed length and its
+#   number of frames,
+# - inside a block, each frame is its receive time (ms since the epoch), its length,
+#   and the raw websocket message.
+# Blocks are only appended, so a log can be replayed while it is being written, and a
+# truncated last block (e.g. after a crash) is simply ignored.
+MAGIC = b'KRKNLOG'
+FORMAT_VERSION = 1
+_FILE_HEADER = struct.Struct('<7sB')
+_BLOCK_HEADER = struct.Struct('<II')
+_FRAME_HEADER = struct.Struct('<qI')
+
+
+class FrameRecorder:
+    """
+    Append raw websocket frames to a compressed, length-prefixed log file.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_frames_per_block: int = 256,
+        max_block_seconds: float = 1.0,
+    ):
+        """
+        Args:
+            path (str): The log file, created if it doesn't exist.
+            max_frames_per_block (int): Write a block once it has this many frames.
+            max_block_seconds (float): Write a block once its first frame is this old.
+        """
+        self.path = path
+        self.max_frames_per_block = max_frames_per_block
+        self.max_block_seconds = max_block_seconds
+
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(_FILE_HEADER.pack(MAGIC, FORMAT_VERSION))
+
+        self._block = bytearray()
+        self._n_frames = 0
+        self._block_start = 0.0
+
+        # Write the last block when the process exits
+        atexit.register(self.close)
+
+    def write(self, frame: str, received_ms: Optional[int] = None) -> None:
+        """
+        Add a frame to the current block, and write the block if it is full or old.
+
+        Args:
+            frame (str): The raw websocket message.
+            received_ms (Optional[int]): When the frame was received, defaults to now.
+        """
+        if received_ms is None:
+            received_ms = time.time_ns() // 1_000_000
+        payload = frame.encode()
+
+        if not self._n_frames:
+            self._block_start = time.monotonic()
+        self._block += _FRAME_HEADER.pack(received_ms, len(payload))
+        self._block += payload
+        self._n_frames += 1
+
+        if (
+            self._n_frames >= self.max_frames_per_block
+            or time.monotonic() - self._block_start >= self.max_block_seconds
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Compress and append the current block to the file.
+        """
+        if not self._n_frames:
+            return
+        compressed = zlib.compress(bytes(self._block))
+        self._file.write(_BLOCK_HEADER.pack(len(compressed), self._n_frames))
+        self._file.write(compressed)
+        self._file.flush()
+        self._block.clear()
+        self._n_frames = 0
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+
+def read_frames(path: str) -> Iterator[Tuple[int, str]]:
+    """
+    Read the frames of a log file written by `FrameRecorder`, with memory-mapped I/O.
+
+    Args:
+        path (str): The log file.
+
+    Yields:
+        Tuple[int, str]: The receive time (ms since the epoch) and the raw message.
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        magic, version = _FILE_HEADER.unpack_from(m)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f'{path} is not a frame log of version {FORMAT_VERSION}')
+
+        offset = _FILE_HEADER.size
+        while offset + _BLOCK_HEADER.size <= len(m):
+            compressed_size, n_frames = _BLOCK_HEADER.unpack_from(m, offset)
+            offset += _BLOCK_HEADER.size
+            if offset + compressed_size > len(m):
+                logger.warning(f'Ignoring the truncated last block of {path}')
+                return
+
+            block = zlib.decompress(m[offset : offset + compressed_size])
+            offset += compressed_size
+
+            position = 0
+            for _ in range(n_frames):
+                received_ms, size = _FRAME_HEADER.unpack_from(block, position)
+                position += _FRAME_HEADER.size
+                yield received_ms, block[position : position + size].decode()
+                position += size
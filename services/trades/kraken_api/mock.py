@@ -29,3 +29,6 @@ class KrakenMockAPI:
         time.sleep(1)
 
         return mock_trades
+
+    def is_done(self) -> bool:
+        return False
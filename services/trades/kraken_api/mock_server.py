@@ -0,0 +1,156 @@
+"""
+Local stand-in for the Kraken Websocket API, replaying recorded frames.
+
+The frames file has one raw websocket message per line, as received from Kraken,
+or is a frame log recorded by the trades service (any file not ending in .jsonl).
+Like Kraken, each connection gets a subscription status for each pair it subscribes
+to, followed by a snapshot of the last trades of the pair if requested, then the trade
+frames of its pairs, and heartbeats.
+
+Usage:
+    python -m kraken_api.mock_server frames.jsonl --port 8765 --disconnect-after 1000
+
+and point the trades service to it with KRAKEN_WEBSOCKET_URL=ws://localhost:8765.
+"""
+
+import argparse
+import asyncio
+import json
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+from websockets.asyncio.server import ServerConnection, serve
+
+from .frame_log import read_frames
+
+
+class KrakenMockServer:
+    # Number of past trades in a snapshot, as Kraken does
+    SNAPSHOT_SIZE = 50
+
+    def __init__(
+        self,
+        frames: List[str],
+        interval_seconds: float = 0.0,
+        disconnect_after: Optional[int] = None,
+    ):
+        """
+        Args:
+            frames (List[str]): The raw frames to replay.
+            interval_seconds (float): The delay between two frames, 0 to send them as fast as possible.
+            disconnect_after (Optional[int]): Close each connection after sending this many frames, to test reconnections.
+        """
+        self.frames = [json.loads(frame) for frame in frames]
+        self.interval_seconds = interval_seconds
+        self.disconnect_after = disconnect_after
+
+        # Position in the frames for each subscription, so a client that reconnects
+        # continues where it left off
+        self._cursors: Dict[Tuple[str, ...], int] = {}
+        self.connections = 0
+
+    async def handler(self, ws: ServerConnection) -> None:
+        self.connections += 1
+        request = json.loads(await ws.recv())
+        params = request['params']
+        pairs = tuple(sorted(params['symbol']))
+        snapshot = params.get('snapshot', True)
+        cursor = self._cursors.get(pairs, 0)
+
+        for pair in pairs:
+            await ws.send(
+                json.dumps(
+                    {
+                        'method': 'subscribe',
+                        'result': {
+                            'channel': 'trade',
+                            'snapshot': snapshot,
+                            'symbol': pair,
+                        },
+                        'success': True,
+                    }
+                )
+            )
+            if snapshot:
+                await ws.send(json.dumps(self._snapshot(pair, cursor)))
+
+        sent = 0
+        for frame in self.frames[cursor:]:
+            cursor += 1
+            frame = self._filter(frame, pairs)
+            if frame is None:
+                continue
+
+            await ws.send(json.dumps(frame))
+            self._cursors[pairs] = cursor
+            sent += 1
+
+            if self.disconnect_after and sent >= self.disconnect_after:
+                logger.info(f'Closing the connection of {pairs} after {sent} frames')
+                await ws.close()
+                return
+
+            if self.interval_seconds:
+                await asyncio.sleep(self.interval_seconds)
+
+        logger.info(f'Replayed all the frames for {pairs}')
+        await ws.wait_closed()
+
+    def _snapshot(self, pair: str, cursor: int) -> dict:
+        # The last trades of the pair before the position of the subscription
+        trades = [
+            trade
+            for frame in self.frames[:cursor]
+            if frame.get('channel') == 'trade'
+            for trade in frame.get('data', [])
+            if trade['symbol'] == pair
+        ]
+        return {
+            'channel': 'trade',
+            'type': 'snapshot',
+            'data': trades[-self.SNAPSHOT_SIZE :],
+        }
+
+    def _filter(self, frame: dict, pairs: Tuple[str, ...]) -> Optional[dict]:
+        # Keep the trades of the subscribed pairs only
+        if frame.get('channel') != 'trade':
+            return frame if frame.get('channel') == 'heartbeat' else None
+
+        data = [trade for trade in frame.get('data', []) if trade['symbol'] in pairs]
+        if not data:
+            return None
+        return {**frame, 'data': data}
+
+
+async def serve_frames(server: KrakenMockServer, host: str, port: int) -> None:
+    async with serve(server.handler, host, port):
+        logger.info(f'Replaying {len(server.frames)} frames on ws://{host}:{port}')
+        await asyncio.get_running_loop().create_future()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('frames_file')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--interval-seconds', type=float, default=0.0)
+    parser.add_argument('--disconnect-after', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.frames_file.endswith('.jsonl'):
+        with open(args.frames_file) as f:
+            frames = [line for line in f if line.strip()]
+    else:
+        frames = [frame for _, frame in read_frames(args.frames_file)]
+
+    asyncio.run(
+        serve_frames(
+            KrakenMockServer(
+                frames,
+                interval_seconds=args.interval_seconds,
+                disconnect_after=args.disconnect_after,
+            ),
+            host=args.host,
+            port=args.port,
+        )
+    )
@@ -0,0 +1,80 @@
+import time
+from typing import List, Optional, Union
+
+from loguru import logger
+
+from .frame_log import read_frames
+from .trade import FastTrade, Trade
+from .websocket import parse_trades
+
+
+class KrakenReplayAPI:
+    """
+    Replay the trades of a log file recorded from the Kraken Websocket API, with the
+    same interface as `KrakenWebsocketAPI`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        speed: Optional[float] = 1.0,
+        validate: bool = True,
+        max_frames_per_call: int = 1000,
+    ):
+        """
+        Args:
+            path (str): The log file to replay.
+            speed (Optional[float]): 1 to replay in real time, N to replay N times faster,
+                None or 0 to replay as fast as possible.
+            validate (bool): Validate the trades with the `Trade` model, see `parse_trades`.
+            max_frames_per_call (int): When replaying as fast as possible, the maximum
+                number of frames returned by each call to `get_trades`.
+        """
+        self.path = path
+        self.speed = speed or None
+        self.validate = validate
+        self.max_frames_per_call = max_frames_per_call
+
+        self._frames = read_frames(path)
+        self._done = False
+        # Receive time of the first frame, and when the replay started
+        self._first_frame_ms: Optional[int] = None
+        self._start_time = 0.0
+
+    def is_done(self) -> bool:
+        return self._done
+
+    def get_trades(self) -> List[Union[Trade, FastTrade]]:
+        """
+        Get the trades of the next frame, waiting until it is due at the replay speed.
+        When replaying as fast as possible, get the trades of the next frames at once.
+
+        Returns:
+            List[Union[Trade, FastTrade]]: A list of trades, empty at the end of the log.
+        """
+        trades = []
+        for _ in range(1 if self.speed else self.max_frames_per_call):
+            try:
+                received_ms, frame = next(self._frames)
+            except StopIteration:
+                logger.info(f'Replayed all the frames of {self.path}')
+                self._done = True
+                break
+
+            if self.speed:
+                self._wait(received_ms)
+            trades.extend(parse_trades(frame, validate=self.validate))
+
+        return trades
+
+    def _wait(self, received_ms: int) -> None:
+        if self._first_frame_ms is None:
+            self._first_frame_ms = received_ms
+            self._start_time = time.monotonic()
+
+        due_time = (
+            self._start_time + (received_ms - self._first_frame_ms) / 1000 / self.speed
+        )
+        delay = due_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
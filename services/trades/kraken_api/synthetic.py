@@ -0,0 +1,186 @@
+import math
+import random
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Union
+
+from .trade import FastTrade, Trade
+
+
+class KrakenSyntheticAPI:
+    """
+    Generate realistic trades for many pairs at a configurable aggregate rate, with the
+    same interface as `KrakenWebsocketAPI`, to load test the downstream services.
+
+    - Prices follow a geometric random walk per pair.
+    - Arrivals are Poisson within a tick, with a rate that switches between a calm
+      and a burst regime, so the average rate is `trades_per_second`.
+    - Pairs are drawn from a Zipf distribution, so a few pairs get most of the trades.
+
+    With the same seed and `start_ms`, the same trades are generated.
+    """
+
+    # Rate multiplier of the calm and burst regimes, and the probability to switch
+    # regime at each tick. The burst regime is 1/6 of the ticks, so the mean is 1.
+    CALM_RATE, BURST_RATE = 0.6, 3.0
+    CALM_TO_BURST, BURST_TO_CALM = 0.02, 0.1
+
+    def __init__(
+        self,
+        pairs: List[str],
+        trades_per_second: float,
+        n_pairs: Optional[int] = None,
+        seed: int = 42,
+        start_ms: Optional[int] = None,
+        tick_seconds: float = 0.05,
+        paced: bool = True,
+        max_trades: Optional[int] = None,
+        zipf_exponent: float = 1.1,
+        volatility_per_trade: float = 0.0005,
+        validate: bool = False,
+    ):
+        """
+        Args:
+            pairs (List[str]): The pairs to generate trades for, the first ones being the most traded.
+            trades_per_second (float): The average number of trades per second, over all the pairs.
+            n_pairs (Optional[int]): Add synthetic pairs (SYN0001/USD, ...) up to this number of pairs.
+            seed (int): The seed of the random generator.
+            start_ms (Optional[int]): The timestamp of the first trade, defaults to now.
+            tick_seconds (float): How much time each call to `get_trades` covers.
+            paced (bool): Wait for the trades to be due in real time, otherwise generate them as fast as possible.
+            max_trades (Optional[int]): Stop after this many trades.
+            zipf_exponent (float): The skew of the number of trades per pair.
+            volatility_per_trade (float): The standard deviation of the log price change of each trade.
+            validate (bool): Build `Trade` models instead of `FastTrade` records.
+        """
+        self.pairs = list(pairs)
+        if n_pairs:
+            self.pairs += [
+                f'SYN{i:04d}/USD' for i in range(1, n_pairs - len(self.pairs) + 1)
+            ]
+        self.trades_per_second = trades_per_second
+        self.tick_seconds = tick_seconds
+        self.paced = paced
+        self.max_trades = max_trades
+        self.volatility_per_trade = volatility_per_trade
+        self.validate = validate
+
+        self._rng = random.Random(seed)
+        self._cum_weights = []
+        total = 0.0
+        for rank in range(1, len(self.pairs) + 1):
+            total += 1 / rank**zipf_exponent
+            self._cum_weights.append(total)
+        # Log-uniform initial prices and typical volumes, cheaper pairs trade bigger size
+        self._prices = {}
+        self._volumes = {}
+        for pair in self.pairs:
+            price = 10 ** self._rng.uniform(-2, 5)
+            self._prices[pair] = price
+            self._volumes[pair] = 1_000 / price
+
+        self._start_ms = time.time_ns() // 1_000_000 if start_ms is None else start_ms
+        self._tick = 0
+        self._burst = False
+        self._n_trades = 0
+        self._start_time: Optional[float] = None
+
+    @property
+    def pair_weights(self) -> Dict[str, float]:
+        """
+        The share of the trades of each pair.
+        """
+        total = self._cum_weights[-1]
+        previous = [0.0, *self._cum_weights[:-1]]
+        return {
+            pair: (cum_weight - before) / total
+            for pair, cum_weight, before in zip(
+                self.pairs, self._cum_weights, previous, strict=True
+            )
+        }
+
+    def is_done(self) -> bool:
+        return self.max_trades is not None and self._n_trades >= self.max_trades
+
+    def get_trades(self) -> List[Union[Trade, FastTrade]]:
+        """
+        Generate the trades of the next tick, waiting until it is due if paced.
+
+        Returns:
+            List[Union[Trade, FastTrade]]: The trades of the tick, sorted by timestamp.
+        """
+        rng = self._rng
+
+        # Switch regime, and draw the number of trades of the tick
+        if rng.random() < (self.BURST_TO_CALM if self._burst else self.CALM_TO_BURST):
+            self._burst = not self._burst
+        rate = self.BURST_RATE if self._burst else self.CALM_RATE
+        n_trades = _poisson(rng, self.trades_per_second * rate * self.tick_seconds)
+        if self.max_trades is not None:
+            n_trades = min(n_trades, self.max_trades - self._n_trades)
+
+        tick_ms = self.tick_seconds * 1000
+        tick_start_ms = self._start_ms + self._tick * tick_ms
+        random = rng.random
+        timestamps_ms = sorted(
+            int(tick_start_ms + random() * tick_ms) for _ in range(n_trades)
+        )
+        pairs = rng.choices(self.pairs, cum_weights=self._cum_weights, k=n_trades)
+
+        # The hot loop of the load tests: the trades of the tick are built with local
+        # names, the timestamps are sorted so each second is formatted once, and
+        # `FastTrade` gets their ms instead of parsing them back
+        gauss, exp = rng.gauss, math.exp
+        prices, volumes = self._prices, self._volumes
+        volatility = self.volatility_per_trade
+        make_trade = self._make_validated_trade if self.validate else FastTrade
+        second, prefix = None, ''
+        trades = []
+        for pair, timestamp_ms in zip(pairs, timestamps_ms, strict=True):
+            price = prices[pair] * exp(gauss(0, volatility))
+            prices[pair] = price
+            # Log-normal around the typical volume of the pair
+            volume = volumes[pair] * exp(gauss(0, 1))
+            if timestamp_ms // 1000 != second:
+                second = timestamp_ms // 1000
+                prefix = _format_second(second)
+            timestamp = f'{prefix}.{timestamp_ms % 1000:03d}000Z'
+            trades.append(make_trade(pair, price, volume, timestamp, timestamp_ms))
+
+        self._tick += 1
+        self._n_trades += n_trades
+
+        if self.paced:
+            self._wait()
+
+        return trades
+
+    @staticmethod
+    def _make_validated_trade(
+        pair: str, price: float, volume: float, timestamp: str, timestamp_ms: int
+    ) -> Trade:
+        return Trade(pair=pair, price=price, volume=volume, timestamp=timestamp)
+
+    def _wait(self) -> None:
+        if self._start_time is None:
+            self._start_time = time.monotonic()
+
+        delay = self._start_time + self._tick * self.tick_seconds - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _poisson(rng: random.Random, mean: float) -> int:
+    # Knuth's algorithm for small means, a normal approximation for large ones
+    if mean > 30:
+        return max(0, round(rng.gauss(mean, math.sqrt(mean))))
+    limit, n, product = math.exp(-mean), 0, rng.random()
+    while product > limit:
+        n += 1
+        product *= rng.random()
+    return n
+
+
+@lru_cache(maxsize=1024)
+def _format_second(seconds: int) -> str:
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))
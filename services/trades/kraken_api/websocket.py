@@ -1,26 +1,38 @@
 import json
-from typing import List
+from typing import List, Optional, Union
 
+import orjson
 from loguru import logger
 from websocket import create_connection
 
-from .trade import Trade
+from .frame_log import FrameRecorder
+from .trade import FastTrade, Trade
 
 
 class KrakenWebsocketAPI:
     # Websocket URL
     URL = 'wss://ws.kraken.com/v2'
 
-    def __init__(self, pairs: List[str]):
+    def __init__(
+        self,
+        pairs: List[str],
+        url: str = URL,
+        validate: bool = True,
+        record_path: Optional[str] = None,
+    ):
         self.pairs = pairs
+        self.validate = validate
+
+        # Optionally record the raw frames, to replay them with `KrakenReplayAPI`
+        self._recorder = FrameRecorder(record_path) if record_path else None
 
         # Create a websocket connection
-        self._ws_client = create_connection(self.URL)
+        self._ws_client = create_connection(url)
 
         # Subscribe to the trades
         self._subscribe()
 
-    def get_trades(self) -> List[Trade]:
+    def get_trades(self) -> List[Union[Trade, FastTrade]]:
         """
         Fetch the trades from the Kraken Websocket APIs and returns them as a list of Trade objects.
 
@@ -29,30 +41,17 @@ class KrakenWebsocketAPI:
         """
         data = self._ws_client.recv()
 
+        if self._recorder:
+            self._recorder.write(data)
+
         if 'heartbeat' in data:
             logger.info('Heartbeat received')
             return []
 
-        # Transform raw data
-        try:
-            parsed_data = json.loads(data)
-            trades_data = parsed_data['data']
+        return parse_trades(data, validate=self.validate)
 
-            return [
-                Trade(
-                    pair=trade['symbol'],
-                    price=trade['price'],
-                    volume=trade['qty'],
-                    timestamp=trade['timestamp'],
-                )
-                for trade in trades_data
-            ]
-        except json.JSONDecodeError as e:
-            logger.error(f'Failed to decode JSON: {e}')
-            return []
-        except KeyError:
-            logger.error(f"No 'data' field with trades in the message: {parsed_data}")
-            return []
+    def is_done(self) -> bool:
+        return False
 
     def _subscribe(self):
         # Send a subscribe message to the websocket
@@ -73,3 +72,52 @@ class KrakenWebsocketAPI:
         for _ in self.pairs:
             _ = self._ws_client.recv()  # Subscription status
             _ = self._ws_client.recv()  # Initial snapshot
+
+
+def parse_trades(data: str, validate: bool = True) -> List[Union[Trade, FastTrade]]:
+    """
+    Parse a message from the Kraken Websocket API into a list of trades.
+    Messages from other channels and snapshots of past trades are skipped.
+
+    Args:
+        data (str): The raw message.
+        validate (bool): Validate the trades with the `Trade` model, or build `FastTrade` records without validation.
+
+    Returns:
+        List[Union[Trade, FastTrade]]: A list of trades, empty if the message has no trades.
+    """
+    try:
+        parsed_data = orjson.loads(data)
+        if (
+            parsed_data.get('channel') != 'trade'
+            or parsed_data.get('type') == 'snapshot'
+        ):
+            return []
+        trades_data = parsed_data['data']
+
+        if not validate:
+            return [
+                FastTrade(
+                    pair=trade['symbol'],
+                    price=float(trade['price']),
+                    volume=float(trade['qty']),
+                    timestamp=trade['timestamp'],
+                )
+                for trade in trades_data
+            ]
+
+        return [
+            Trade(
+                pair=trade['symbol'],
+                price=trade['price'],
+                volume=trade['qty'],
+                timestamp=trade['timestamp'],
+            )
+            for trade in trades_data
+        ]
+    except orjson.JSONDecodeError as e:
+        logger.error(f'Failed to decode JSON: {e}')
+        return []
+    except KeyError:
+        logger.error(f"No 'data' field with trades in the message: {parsed_data}")
+        return []
@@ -1,11 +1,28 @@
+import asyncio
 import signal
 import sys
-from typing import Union
+from typing import Any, Dict, Optional, Tuple, Union
 
+from common.instrumentation import (
+    REGISTRY,
+    SampledLogger,
+    StageMetrics,
+    start_metrics_server,
+)
+from common.partitioning import PairPartitioner, broker_partitions, topic_config
+from common.tracing import LatencyRecorder, now_us, stamp
+from common.wire_format import WireFormat, WireSerializer, encode
+from delivery import DeliveryTracker
+from kraken_api.async_websocket import KrakenAsyncWebsocketAPI
 from kraken_api.mock import KrakenMockAPI
+from kraken_api.replay import KrakenReplayAPI
+from kraken_api.synthetic import KrakenSyntheticAPI
+from kraken_api.trade import FastTrade, Trade
 from kraken_api.websocket import KrakenWebsocketAPI
 from loguru import logger
 from quixstreams import Application
+from quixstreams.kafka import Producer
+from quixstreams.models import Topic
 
 
 def signal_handler(sig, frame):
@@ -16,7 +33,22 @@ def signal_handler(sig, frame):
 def main(
     kafka_broker_address: str,
     kafka_topic: str,
-    kraken_api: Union[KrakenMockAPI, KrakenWebsocketAPI],
+    kraken_api: Union[
+        KrakenMockAPI,
+        KrakenWebsocketAPI,
+        KrakenAsyncWebsocketAPI,
+        KrakenReplayAPI,
+        KrakenSyntheticAPI,
+    ],
+    trades_queue_size: int = 10_000,
+    producer_extra_config: Optional[dict] = None,
+    latency_tracing: bool = True,
+    metrics_port: int = 0,
+    log_sample_rate: float = 0.001,
+    wire_format: WireFormat = 'binary',
+    topic_partitions: int = 1,
+    topic_replication_factor: int = 1,
+    pair_weights: Optional[Dict[str, float]] = None,
 ):
     """
     It does 2 things:
@@ -26,6 +58,16 @@ def main(
     Args:
         kafka_broker_address (str): The address of the Kafka broker.
         kafka_topic (str): The topic to push the trades to.
+        kraken_api: The API to read the trades from.
+        trades_queue_size (int): The size of the queue between the websocket connections and the producer, with the async API.
+        producer_extra_config (Optional[dict]): Extra librdkafka options of the producer, e.g. batching and compression.
+        latency_tracing (bool): Add the times the trades were received and produced to their headers, and log the latency.
+        metrics_port (int): The port of the Prometheus metrics endpoint, 0 to disable it.
+        log_sample_rate (float): The fraction of the trades logged.
+        wire_format (WireFormat): The format of the trades, 'binary' or 'json', see common/wire_format.py.
+        topic_partitions (int): The number of partitions of the topic, to create it, and checked against the partitions of an existing topic.
+        topic_replication_factor (int): The replication factor of the topic, if it is created.
+        pair_weights (Optional[Dict[str, float]]): The load of some pairs, spread evenly over the partitions, see common.partitioning.
 
     Returns:
         None
@@ -34,45 +76,363 @@ def main(
     logger.info('Starting the trades service')
     print(f'Kafka broker address: {kafka_broker_address}')
     print(f'Kafka topic: {kafka_topic}')
+    print(f'Producer extra config: {producer_extra_config}')
+    print(f'Latency tracing: {latency_tracing}')
+    print(f'Metrics port: {metrics_port}')
+    print(f'Log sample rate: {log_sample_rate}')
+    print(f'Wire format: {wire_format}')
+    print(f'Topic partitions: {topic_partitions}')
 
     # Initialize the QuixStreams application
     # This class handles all the low-level details of connecting to Kafka
-    app = Application(broker_address=kafka_broker_address)
+    app = Application(
+        broker_address=kafka_broker_address,
+        producer_extra_config=producer_extra_config,
+    )
+
+    # Count the trades acknowledged by Kafka, or that failed to be delivered
+    tracker = DeliveryTracker()
+
+    # The latency from the trade timestamp to the produce call
+    recorder = LatencyRecorder('trades') if latency_tracing else None
+
+    if metrics_port:
+        # The delivery counters, read when the metrics are scraped
+        REGISTRY.gauge_function(
+            'trade_deliveries',
+            'Trades by delivery status',
+            ['status'],
+            lambda: {
+                ('produced',): tracker.produced,
+                ('acked',): tracker.acked,
+                ('failed',): tracker.failed,
+                ('in_flight',): tracker.in_flight,
+                ('backpressure_waits',): tracker.backpressure_waits,
+            },
+        )
+        start_metrics_server(metrics_port)
+    stage_metrics = StageMetrics('trades')
+    sampled_logger = SampledLogger(log_sample_rate)
+
+    # Define a topic where we will push the trades, and create it with its partitions
+    # if it doesn't exist yet
+    topic = app.topic(
+        name=kafka_topic,
+        value_serializer=WireSerializer(wire_format),
+        config=topic_config(topic_partitions, topic_replication_factor),
+    )
+    app.setup_topics()
+
+    # The partitions of the topic on the broker, as it may have existed before
+    n_partitions = broker_partitions(app, topic)
+    if n_partitions != topic_partitions:
+        raise ValueError(
+            f'The topic {topic.name} has {n_partitions} partitions, but '
+            f'KAFKA_TOPIC_PARTITIONS is {topic_partitions}'
+        )
 
-    # Define a topic where we will push the trades
-    topic = app.topic(name=kafka_topic, value_serializer='json')
+    # The partition of each pair, so the hot pairs are spread over the partitions
+    partitioner = PairPartitioner(n_partitions, pair_weights)
+    logger.info(f'Partition loads of the weighted pairs: {partitioner.loads}')
 
     # Register the signal handler for graceful shutdown
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
     with app.get_producer() as producer:
-        while True:
+        if isinstance(kraken_api, KrakenAsyncWebsocketAPI):
+            asyncio.run(
+                produce_trades_async(
+                    kraken_api,
+                    producer,
+                    topic,
+                    tracker,
+                    trades_queue_size,
+                    recorder,
+                    stage_metrics,
+                    sampled_logger,
+                    wire_format,
+                    partitioner,
+                )
+            )
+            return
+
+        while not kraken_api.is_done():
             trades = kraken_api.get_trades()
+            received_us = now_us()
 
             for trade in trades:
-                try:
-                    # Serialize the trade as bytes
-                    message = topic.serialize(key=trade.pair, value=trade.to_dict())
-                    # Push the serialized message to Kafka
-                    producer.produce(
-                        topic=topic.name, value=message.value, key=message.key
-                    )
-                except Exception as e:
-                    logger.error(f'Failed to produce message to Redpanda: {e}')
+                produce_trade(
+                    producer,
+                    topic,
+                    tracker,
+                    trade,
+                    recorder,
+                    received_us,
+                    stage_metrics,
+                    sampled_logger,
+                    wire_format,
+                    partitioner,
+                )
+
+        # The replay or synthetic load is over, wait for the last trades to be delivered
+        producer.flush()
+        logger.info(
+            f'Trades produced={tracker.produced}, acked={tracker.acked}, '
+            f'failed={tracker.failed}'
+        )
+
+
+async def produce_trades_async(
+    kraken_api: KrakenAsyncWebsocketAPI,
+    producer: Producer,
+    topic: Topic,
+    tracker: DeliveryTracker,
+    trades_queue_size: int,
+    recorder: Optional[LatencyRecorder] = None,
+    stage_metrics: Optional[StageMetrics] = None,
+    sampled_logger: Optional[SampledLogger] = None,
+    wire_format: WireFormat = 'json',
+    partitioner: Optional[PairPartitioner] = None,
+):
+    """
+    Read the trades from the websocket connections and push them to Kafka in separate
+    tasks, connected by a bounded queue.
+
+    The time each trade was received is not known here, so only the produce time is
+    added to its headers.
+    """
+    queue = asyncio.Queue(maxsize=trades_queue_size)
+
+    async def drain_queue():
+        while True:
+            trade = await queue.get()
+            await produce_trade_async(
+                producer,
+                topic,
+                tracker,
+                trade,
+                recorder,
+                stage_metrics=stage_metrics,
+                sampled_logger=sampled_logger,
+                wire_format=wire_format,
+                partitioner=partitioner,
+            )
+
+    await asyncio.gather(kraken_api.run(queue), drain_queue())
+
+
+def produce_trade(
+    producer: Producer,
+    topic: Topic,
+    tracker: DeliveryTracker,
+    trade: Union[Trade, FastTrade],
+    recorder: Optional[LatencyRecorder] = None,
+    received_us: Optional[int] = None,
+    stage_metrics: Optional[StageMetrics] = None,
+    sampled_logger: Optional[SampledLogger] = None,
+    wire_format: WireFormat = 'json',
+    partitioner: Optional[PairPartitioner] = None,
+):
+    """
+    Serialize a trade and push it to Kafka.
+    If the local producer queue is full, wait for deliveries to free it up instead of
+    dropping the trade.
+    With a `recorder`, the time the trade was received (if known) and produced are
+    added to its headers, see common/tracing.py.
+    The `stage_metrics` count the trades and time their serialization and produce
+    call, and the `sampled_logger` logs a sample of them.
+    The `wire_format` is the one of the topic serializer, used to serialize the fast
+    trades without it.
+    With a `partitioner`, the trade goes to the partition of its pair, otherwise to the
+    one of the Kafka default partitioner.
+    """
+    message = _prepare_trade(
+        topic, trade, recorder, received_us, stage_metrics, wire_format, partitioner
+    )
+    if message is None:
+        return
 
-                logger.info(f'Pushed trade to Kafka: {trade}')
+    while not _try_produce(producer, topic, tracker, message):
+        producer.poll(timeout=1.0)
+
+    _trade_produced(tracker, trade, stage_metrics, sampled_logger)
+
+
+async def produce_trade_async(
+    producer: Producer,
+    topic: Topic,
+    tracker: DeliveryTracker,
+    trade: Union[Trade, FastTrade],
+    recorder: Optional[LatencyRecorder] = None,
+    received_us: Optional[int] = None,
+    stage_metrics: Optional[StageMetrics] = None,
+    sampled_logger: Optional[SampledLogger] = None,
+    wire_format: WireFormat = 'json',
+    partitioner: Optional[PairPartitioner] = None,
+):
+    """
+    Like `produce_trade`, but when the local producer queue is full, wait for the
+    deliveries in a thread of the default executor, so the websocket connections keep
+    being read meanwhile (up to the size of the trades queue).
+    """
+    message = _prepare_trade(
+        topic, trade, recorder, received_us, stage_metrics, wire_format, partitioner
+    )
+    if message is None:
+        return
+
+    loop = asyncio.get_running_loop()
+    while not _try_produce(producer, topic, tracker, message):
+        await loop.run_in_executor(None, producer.poll, 1.0)
+
+    _trade_produced(tracker, trade, stage_metrics, sampled_logger)
+
+
+def _prepare_trade(
+    topic: Topic,
+    trade: Union[Trade, FastTrade],
+    recorder: Optional[LatencyRecorder],
+    received_us: Optional[int],
+    stage_metrics: Optional[StageMetrics],
+    wire_format: WireFormat,
+    partitioner: Optional[PairPartitioner],
+) -> Optional[Tuple[str, bytes, Any, Optional[int]]]:
+    """
+    The key, value, headers and partition of the message of a trade, or None if it
+    can't be serialized.
+    """
+    if stage_metrics is not None:
+        stage_metrics.message_in()
+
+    try:
+        if isinstance(trade, FastTrade):
+            # Same bytes as the topic serializer, without its overhead
+            key = trade.pair
+            if wire_format == 'binary':
+                value = encode(trade.to_dict())
+            else:
+                value = trade.to_json()
+        else:
+            # Serialize the trade as bytes
+            message = topic.serialize(key=trade.pair, value=trade.to_dict())
+            key, value = message.key, message.value
+    except Exception as e:
+        logger.error(f'Failed to serialize trade {trade}: {e}')
+        return None
+
+    headers = None
+    if recorder is not None:
+        if received_us is not None:
+            headers = stamp(headers, recorder.stage, 'in', received_us)
+        out_us = now_us()
+        recorder.record(headers, {'timestamp_ms': trade.timestamp_ms}, out_us)
+        headers = stamp(headers, recorder.stage, 'out', out_us)
+
+    partition = partitioner(trade.pair) if partitioner is not None else None
+
+    return key, value, headers, partition
+
+
+def _try_produce(
+    producer: Producer,
+    topic: Topic,
+    tracker: DeliveryTracker,
+    message: Tuple[str, bytes, Any, Optional[int]],
+) -> bool:
+    """
+    Push the message of a trade to Kafka, or return False if the local producer queue
+    is full.
+    """
+    key, value, headers, partition = message
+    try:
+        producer.produce(
+            topic=topic.name,
+            value=value,
+            key=key,
+            headers=headers,
+            partition=partition,
+            buffer_error_max_tries=0,
+            on_delivery=tracker.on_delivery,
+        )
+        return True
+    except BufferError:
+        tracker.backpressure_waits += 1
+        return False
+
+
+def _trade_produced(
+    tracker: DeliveryTracker,
+    trade: Union[Trade, FastTrade],
+    stage_metrics: Optional[StageMetrics],
+    sampled_logger: Optional[SampledLogger],
+) -> None:
+    tracker.produced += 1
+    tracker.maybe_log()
+
+    if stage_metrics is not None:
+        stage_metrics.message_out()
+    if sampled_logger is not None:
+        sampled_logger.log('Pushed trade to Kafka', trade)
 
 
 if __name__ == '__main__':
     from config import config
 
     # Initialize the Kraken API
-    kraken_api = KrakenWebsocketAPI(pairs=config.pairs)
+    if config.synthetic_trades_per_second:
+        kraken_api = KrakenSyntheticAPI(
+            pairs=config.pairs,
+            trades_per_second=config.synthetic_trades_per_second,
+            n_pairs=config.synthetic_pairs,
+            seed=config.synthetic_seed,
+            start_ms=config.synthetic_start_ms,
+            max_trades=config.synthetic_max_trades,
+            validate=config.validate_trades,
+        )
+    elif config.replay_frames_path:
+        kraken_api = KrakenReplayAPI(
+            path=config.replay_frames_path,
+            speed=config.replay_speed,
+            validate=config.validate_trades,
+        )
+    elif config.websocket_mode == 'async':
+        kraken_api = KrakenAsyncWebsocketAPI(
+            pairs=config.pairs,
+            n_connections=config.websocket_connections,
+            url=config.kraken_websocket_url,
+            validate=config.validate_trades,
+            record_path=config.record_frames_path,
+        )
+    else:
+        kraken_api = KrakenWebsocketAPI(
+            pairs=config.pairs,
+            url=config.kraken_websocket_url,
+            validate=config.validate_trades,
+            record_path=config.record_frames_path,
+        )
     # kraken_api = KrakenMockAPI(pair=config.pairs[0])  # Mock API for testing
 
+    # The synthetic trades know the share of each pair
+    pair_weights = config.pair_weights
+    if not pair_weights and isinstance(kraken_api, KrakenSyntheticAPI):
+        pair_weights = kraken_api.pair_weights
+
     main(
         kafka_broker_address=config.kafka_broker_address,
         kafka_topic=config.kafka_topic,
         kraken_api=kraken_api,
+        trades_queue_size=config.trades_queue_size,
+        producer_extra_config={
+            'linger.ms': config.producer_linger_ms,
+            'batch.size': config.producer_batch_size,
+            'compression.type': config.producer_compression_type,
+        },
+        latency_tracing=config.latency_tracing,
+        metrics_port=config.metrics_port,
+        log_sample_rate=config.log_sample_rate,
+        wire_format=config.wire_format,
+        topic_partitions=config.kafka_topic_partitions,
+        topic_replication_factor=config.kafka_topic_replication_factor,
+        pair_weights=pair_weights,
     )
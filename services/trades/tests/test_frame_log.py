@@ -0,0 +1,100 @@
+"""
+Recording raw frames to a log file, reading them back and replaying their trades.
+"""
+
+import json
+
+import pytest
+from kraken_api.frame_log import FrameRecorder, read_frames
+from kraken_api.replay import KrakenReplayAPI
+
+START_MS = 1_700_000_000_000
+
+
+def make_frames(n_frames: int) -> list:
+    """
+    Trade frames of 2 trades each, with a heartbeat and a snapshot in between.
+    """
+    frames = []
+    for i in range(n_frames):
+        trades = [
+            {
+                'symbol': pair,
+                'side': 'buy',
+                'price': 100.0 + i,
+                'qty': 0.5,
+                'ord_type': 'market',
+                'trade_id': i,
+                'timestamp': f'2023-11-14T22:13:20.{i:03d}000Z',
+            }
+            for pair in ('BTC/USD', 'ETH/USD')
+        ]
+        frames.append(
+            json.dumps({'channel': 'trade', 'type': 'update', 'data': trades})
+        )
+        if i % 10 == 0:
+            frames.append(json.dumps({'channel': 'heartbeat'}))
+            frames.append(
+                json.dumps({'channel': 'trade', 'type': 'snapshot', 'data': trades})
+            )
+    return frames
+
+
+def record(path, frames: list, **kwargs) -> FrameRecorder:
+    recorder = FrameRecorder(str(path), **kwargs)
+    for i, frame in enumerate(frames):
+        recorder.write(frame, received_ms=START_MS + i)
+    return recorder
+
+
+def test_round_trip(tmp_path):
+    frames = make_frames(100)
+    # Blocks of 16 frames, the last one written when the recorder is closed
+    record(tmp_path / 'frames.log', frames, max_frames_per_block=16).close()
+
+    assert list(read_frames(str(tmp_path / 'frames.log'))) == [
+        (START_MS + i, frame) for i, frame in enumerate(frames)
+    ]
+
+    # Appending to an existing log
+    record(tmp_path / 'frames.log', frames[:5]).close()
+    assert len(list(read_frames(str(tmp_path / 'frames.log')))) == len(frames) + 5
+
+
+def test_replay_as_fast_as_possible(tmp_path):
+    frames = make_frames(100)
+    record(tmp_path / 'frames.log', frames).close()
+
+    api = KrakenReplayAPI(
+        str(tmp_path / 'frames.log'), speed=0, validate=False, max_frames_per_call=7
+    )
+    trades = []
+    while not api.is_done():
+        batch = api.get_trades()
+        assert len(batch) <= 2 * 7
+        trades.extend(batch)
+
+    # The trades of the updates, in order, without the snapshots
+    assert [(trade.pair, trade.price) for trade in trades] == [
+        (pair, 100.0 + i) for i in range(100) for pair in ('BTC/USD', 'ETH/USD')
+    ]
+    assert trades[5].timestamp_ms == START_MS + 2
+
+
+def test_truncated_last_block_is_ignored(tmp_path):
+    # 48 frames with the heartbeats and snapshots, in 4 blocks of 10 and one of 8
+    frames = make_frames(40)
+    record(tmp_path / 'frames.log', frames, max_frames_per_block=10).close()
+    path = tmp_path / 'frames.log'
+    # A crash while writing the last block
+    path.write_bytes(path.read_bytes()[:-5])
+
+    read = list(read_frames(str(path)))
+    assert [frame for _, frame in read] == frames[:40]
+
+
+def test_not_a_frame_log(tmp_path):
+    (tmp_path / 'frames.jsonl').write_text('{"channel": "heartbeat"}\n' * 10)
+
+    with pytest.raises(ValueError):
+        list(read_frames(str(tmp_path / 'frames.jsonl')))
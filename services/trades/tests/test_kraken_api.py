@@ -0,0 +1,146 @@
+"""
+The websocket clients against the local mock of the Kraken Websocket API.
+"""
+
+import asyncio
+import json
+import threading
+
+import pytest
+from kraken_api.async_websocket import KrakenAsyncWebsocketAPI
+from kraken_api.mock_server import KrakenMockServer
+from kraken_api.websocket import KrakenWebsocketAPI
+from websocket import WebSocketConnectionClosedException, create_connection
+from websockets.asyncio.server import serve
+
+PAIRS = ['BTC/USD', 'ETH/USD']
+
+
+def make_frames(n_frames: int) -> list:
+    """
+    Trade frames alternating between the pairs, with a heartbeat after each one.
+    """
+    frames = []
+    for i in range(n_frames):
+        trade = {
+            'symbol': PAIRS[i % len(PAIRS)],
+            'side': 'buy',
+            'price': 100.0 + i,
+            'qty': 0.5,
+            'ord_type': 'market',
+            'trade_id': i,
+            'timestamp': f'2024-01-01T00:00:{i:02d}.000000Z',
+        }
+        frames.append(
+            json.dumps({'channel': 'trade', 'type': 'update', 'data': [trade]})
+        )
+        frames.append(json.dumps({'channel': 'heartbeat'}))
+    return frames
+
+
+@pytest.fixture
+def mock_server():
+    """
+    Serve a mock server in a background thread, for the blocking client.
+
+    Yields a function that starts the server and returns its URL.
+    """
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    servers = []
+
+    async def start_server(server: KrakenMockServer):
+        return await serve(server.handler, 'localhost', 0)
+
+    def start(server: KrakenMockServer) -> str:
+        ws_server = asyncio.run_coroutine_threadsafe(start_server(server), loop).result(
+            timeout=5
+        )
+        servers.append(ws_server)
+        port = ws_server.sockets[0].getsockname()[1]
+        return f'ws://localhost:{port}'
+
+    yield start
+
+    async def stop_server(ws_server):
+        ws_server.close()
+        await ws_server.wait_closed()
+
+    for ws_server in servers:
+        asyncio.run_coroutine_threadsafe(stop_server(ws_server), loop).result(timeout=5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+
+
+def test_async_client_reconnects_and_resumes():
+    server = KrakenMockServer(make_frames(10), disconnect_after=3)
+
+    async def read_trades():
+        async with serve(server.handler, 'localhost', 0) as ws_server:
+            port = ws_server.sockets[0].getsockname()[1]
+            api = KrakenAsyncWebsocketAPI(
+                PAIRS,
+                url=f'ws://localhost:{port}',
+                max_reconnect_delay_seconds=0.01,
+                validate=False,
+            )
+            queue = asyncio.Queue()
+            task = asyncio.create_task(api.run(queue))
+            try:
+                return [
+                    await asyncio.wait_for(queue.get(), timeout=5) for _ in range(10)
+                ]
+            finally:
+                task.cancel()
+
+    trades = asyncio.run(read_trades())
+
+    # Every trade once and in order, over several connections
+    assert [trade.price for trade in trades] == [100.0 + i for i in range(10)]
+    assert server.connections > 1
+
+
+def test_blocking_client_skips_subscription_and_snapshot(mock_server):
+    server = KrakenMockServer(make_frames(10), disconnect_after=4)
+    url = mock_server(server)
+
+    # The first trade frame comes after the status and snapshot of each pair
+    api = KrakenWebsocketAPI(PAIRS, url=url, validate=True)
+    trades = api.get_trades()
+    assert [(trade.pair, trade.price) for trade in trades] == [('BTC/USD', 100.0)]
+
+    # Read until the server closes the connection after its 4 frames
+    with pytest.raises(WebSocketConnectionClosedException):
+        while True:
+            api.get_trades()
+
+
+def test_snapshot_of_past_trades(mock_server):
+    server = KrakenMockServer(make_frames(10), disconnect_after=4)
+    url = mock_server(server)
+
+    # A first connection gets the first 2 trades, then is closed
+    ws = create_connection(url)
+    ws.send(json.dumps({'method': 'subscribe', 'params': {'symbol': PAIRS}}))
+    with pytest.raises(WebSocketConnectionClosedException):
+        while True:
+            ws.recv()
+
+    # The next one gets a snapshot of them for each pair, then the next frames
+    ws = create_connection(url)
+    ws.send(json.dumps({'method': 'subscribe', 'params': {'symbol': PAIRS}}))
+    messages = [json.loads(ws.recv()) for _ in range(5)]
+    ws.close()
+
+    assert [message.get('type') for message in messages] == [
+        None,
+        'snapshot',
+        None,
+        'snapshot',
+        'update',
+    ]
+    assert [message['result']['symbol'] for message in messages[0:4:2]] == PAIRS
+    assert [trade['price'] for trade in messages[1]['data']] == [100.0]
+    assert [trade['price'] for trade in messages[3]['data']] == [101.0]
+    assert [trade['price'] for trade in messages[4]['data']] == [102.0]
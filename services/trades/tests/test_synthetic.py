@@ -0,0 +1,55 @@
+"""
+The synthetic trades of the load tests.
+"""
+
+from kraken_api.synthetic import KrakenSyntheticAPI
+from kraken_api.trade import parse_timestamp_ms
+
+START_MS = 1_700_000_000_000
+
+
+def generate(**kwargs) -> list:
+    api = KrakenSyntheticAPI(
+        ['BTC/USD', 'ETH/USD'],
+        trades_per_second=20_000,
+        n_pairs=50,
+        start_ms=START_MS,
+        paced=False,
+        max_trades=5_000,
+        **kwargs,
+    )
+    trades = []
+    while not api.is_done():
+        trades.extend(api.get_trades())
+    return trades
+
+
+def test_same_seed_same_trades():
+    trades = [trade.to_dict() for trade in generate(seed=7)]
+
+    assert len(trades) == 5_000
+    assert trades == [trade.to_dict() for trade in generate(seed=7)]
+    assert trades != [trade.to_dict() for trade in generate(seed=8)]
+    # The same values when the trades are validated
+    assert trades == [trade.to_dict() for trade in generate(seed=7, validate=True)]
+
+
+def test_timestamps():
+    trades = generate()
+
+    timestamps_ms = [trade.timestamp_ms for trade in trades]
+    assert timestamps_ms == sorted(timestamps_ms)
+    assert timestamps_ms[0] >= START_MS
+    # The formatted timestamps are those of the trades
+    assert [parse_timestamp_ms(trade.timestamp) for trade in trades] == timestamps_ms
+
+
+def test_most_traded_pairs():
+    trades = generate()
+
+    counts = {}
+    for trade in trades:
+        counts[trade.pair] = counts.get(trade.pair, 0) + 1
+    assert max(counts, key=counts.get) == 'BTC/USD'
+    assert counts['BTC/USD'] > counts['ETH/USD'] > counts.get('SYN0048/USD', 0)
+    assert all(trade.price > 0 and trade.volume > 0 for trade in trades)